@@ -0,0 +1,88 @@
+"""
+Measure how long the local analytics take over a large synthetic table of tagged events, both to load the
+events from Parquet into columnar arrays and to compute each metric.
+
+    python benchmarks/analytics.py --num-events 10000000
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import analytics
+from destinations.columnar import ColumnarDestination
+
+
+def synthesize_events(num_events: int, num_event_types: int, events_per_conversation: int, seed: int = 42) -> pa.Table:
+    """Events in the schema of the parquet and duckdb destinations, with one property of four values on every other event."""
+    rng = np.random.default_rng(seed)
+    conversations = np.arange(num_events) // events_per_conversation
+    num_conversations = int(conversations[-1]) + 1
+    conversation_scores = rng.integers(0, 101, num_conversations)
+    # Conversations start at random times and have a message every 1-120 seconds
+    timestamps = rng.integers(0, 30 * 86400, num_conversations)[conversations] * 1_000_000 + np.arange(num_events) * rng.integers(1, 120) * 1_000_000
+
+    has_property = np.arange(num_events) % 2 == 0
+    offsets = np.r_[0, np.cumsum(has_property)].astype(np.int32)
+    num_properties = int(has_property.sum())
+    property_values = _strings(rng.integers(0, 4, num_properties), ["low", "medium", "high", "critical"])
+
+    schema = ColumnarDestination.schema()
+    return pa.table({
+        "event_type": _strings(rng.integers(0, num_event_types, num_events), [f"Event Type {i}" for i in range(num_event_types)]),
+        "conversation_id": pa.array(conversations.astype(str)),
+        "timestamp": pa.array(timestamps, type=pa.timestamp("us")),
+        "llm_judge_score": pa.array(conversation_scores[conversations], type=pa.int32()),
+        "event_properties": pa.MapArray.from_arrays(
+            pa.array(offsets),
+            _strings(np.zeros(num_properties, dtype=np.int64), ["severity"]),
+            property_values,
+            type=schema.field("event_properties").type
+        )
+    })
+
+
+def _strings(codes: np.ndarray, values: list) -> pa.Array:
+    return pa.DictionaryArray.from_arrays(pa.array(codes), pa.array(values)).cast(pa.string())
+
+
+def timed(results: dict, name: str, fn, *args, **kwargs):
+    start = time.perf_counter()
+    value = fn(*args, **kwargs)
+    results[name] = round(time.perf_counter() - start, 3)
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark local conversational analytics")
+    parser.add_argument("--num-events", type=int, default=10000000)
+    parser.add_argument("--num-event-types", type=int, default=20)
+    parser.add_argument("--events-per-conversation", type=int, default=20)
+    args = parser.parse_args()
+
+    table = synthesize_events(args.num_events, args.num_event_types, args.events_per_conversation)
+
+    seconds = {}
+    output_dir = tempfile.mkdtemp()
+    try:
+        timed(seconds, "write_parquet", ds.write_dataset, table, output_dir, format="parquet")
+        events = timed(seconds, "load_parquet", analytics.load_events, output_dir, "parquet")
+    finally:
+        shutil.rmtree(output_dir)
+
+    timed(seconds, "transition_matrix", analytics.transition_matrix, events)
+    timed(seconds, "funnel", analytics.funnel, events, ["Event Type 0", "Event Type 1", "Event Type 2"])
+    timed(seconds, "judge_scores_by_event_type", analytics.judge_scores_by_event_type, events)
+    timed(seconds, "judge_scores_by_property", analytics.judge_scores_by_property, events, "severity")
+    timed(seconds, "time_to_event", analytics.time_to_event, events, "Event Type 3")
+
+    print(json.dumps({"events": len(events), "conversations": events.num_conversations, "seconds": seconds}, indent=4))
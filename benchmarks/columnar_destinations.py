@@ -0,0 +1,78 @@
+"""
+Measure how quickly each local destination writes events, by sending synthetic events built from an example
+schema straight to the destination, without running the rest of the pipeline.
+
+    python benchmarks/columnar_destinations.py --num-events 1000000
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from destinations.duckdb import DuckDBDestination
+from destinations.jsonl import JsonlDestination
+from destinations.parquet import ParquetDestination
+from models.conversation import Message
+from models.data_schema import DataSchema
+from models.event import Event
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+def synthesize_events(data_schema: DataSchema, num_events: int, messages_per_conversation: int = 10):
+    rng = random.Random(42)
+    start = datetime(2025, 1, 1)
+    events = []
+    for i in range(num_events):
+        event_type = rng.choice(data_schema.event_types)
+        conversation_id = f"conversation-{i // messages_per_conversation}"
+        events.append((Event(
+            user_id=conversation_id,
+            event_type=event_type,
+            conversation_id=conversation_id,
+            message=Message(event_type.role, "word " * rng.randint(10, 100), start + timedelta(seconds=i), str(i)),
+            property_values={p.name: rng.choice(p.choices) for p in event_type.properties},
+            explanation="word " * 20,
+            model_id="gpt-4o"
+        ), rng.randint(0, 100)))
+    return events
+
+
+def benchmark(name: str, destination, events) -> dict:
+    start = time.perf_counter()
+    for event, llm_judge_score in events:
+        destination.send_event(event, llm_judge_score)
+    destination.flush()
+    seconds = time.perf_counter() - start
+    return {"destination": name, "seconds": round(seconds, 3), "events_per_second": round(len(events) / seconds)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark local destinations")
+    parser.add_argument("--example", type=str, default="therapist")
+    parser.add_argument("--num-events", type=int, default=1000000)
+    parser.add_argument("--row-group-size", type=int, default=100000)
+    parser.add_argument("--compression", type=str, default="zstd")
+    args = parser.parse_args()
+
+    data_schema = DataSchema.from_yaml(os.path.join(EXAMPLES_DIR, args.example, "schema.yml"))
+    events = synthesize_events(data_schema, args.num_events)
+
+    output_dir = tempfile.mkdtemp()
+    try:
+        results = [
+            benchmark("jsonl", JsonlDestination(os.path.join(output_dir, "events.jsonl")), events),
+            benchmark("parquet", ParquetDestination(os.path.join(output_dir, "events"), args.row_group_size, args.compression), events),
+            benchmark("duckdb", DuckDBDestination(os.path.join(output_dir, "events.duckdb"), batch_size=args.row_group_size), events)
+        ]
+    finally:
+        shutil.rmtree(output_dir)
+
+    print(json.dumps(results, indent=4))
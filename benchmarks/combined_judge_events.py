@@ -0,0 +1,61 @@
+"""
+Compare token usage and wall time of judging conversations and generating their events with separate
+LLM judge and event generation requests versus a single combined request per conversation.
+
+Runs offline against the bundled examples with the ReplayModelProvider, which replays recorded responses
+from --fixtures-path and synthesizes schema-valid responses for anything that wasn't recorded.
+
+    python benchmarks/combined_judge_events.py --base-latency 0.5 --seconds-per-output-token 0.01
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+logging.basicConfig(level=logging.WARNING)
+
+from llm_queries.replay_model_provider import ReplayModelProvider
+from models.data_schema import DataSchema
+from pipeline import generate_events, judge_and_generate_events, run_llm_judge
+from sources.local import LocalSource
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+def benchmark(example: str, args) -> dict:
+    data_schema = DataSchema.from_yaml(os.path.join(EXAMPLES_DIR, example, "schema.yml"))
+    conversations = LocalSource(os.path.join(EXAMPLES_DIR, example, "example_data.json")).get_conversations()
+    conversations = conversations * args.repeat
+
+    results = {"example": example, "conversations": len(conversations)}
+
+    model_provider = ReplayModelProvider(args.fixtures_path, args.base_latency, args.seconds_per_output_token)
+    start = time.perf_counter()
+    run_llm_judge(model_provider, args.model, data_schema, conversations, args.max_concurrency)
+    generate_events(model_provider, args.model, data_schema, conversations, args.max_concurrency)
+    results["separate"] = {"wall_time": round(time.perf_counter() - start, 3), **model_provider.total_usage()}
+
+    model_provider = ReplayModelProvider(args.fixtures_path, args.base_latency, args.seconds_per_output_token)
+    start = time.perf_counter()
+    judge_and_generate_events(model_provider, args.model, data_schema, conversations, args.max_concurrency)
+    results["combined"] = {"wall_time": round(time.perf_counter() - start, 3), **model_provider.total_usage()}
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the combined judge and event generation request")
+    parser.add_argument("--examples", type=str, default="therapist,tax_advisor")
+    parser.add_argument("--fixtures-path", type=str, default=None, help="Recorded responses to replay (JSON Lines of {key, response})")
+    parser.add_argument("--model", type=str, default="gpt-4o")
+    parser.add_argument("--max-concurrency", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=1, help="Repeat the example conversations to simulate a larger run")
+    parser.add_argument("--base-latency", type=float, default=0.5, help="Simulated seconds of overhead per request")
+    parser.add_argument("--seconds-per-output-token", type=float, default=0.01, help="Simulated generation time per output token")
+    args = parser.parse_args()
+
+    print(json.dumps([benchmark(example, args) for example in args.examples.split(",")], indent=4))
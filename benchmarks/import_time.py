@@ -0,0 +1,74 @@
+"""
+Measure the import time of the CLI entry points with `python -X importtime`, and fail if any of them
+imports a provider, destination or data SDK at startup (they should only be imported once selected) or
+takes longer than the budget.
+
+    python benchmarks/import_time.py --budget-ms 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+LAZY_MODULES = ["amplitude", "anthropic", "boto3", "duckdb", "numpy", "openai", "pandas", "posthog", "pyarrow"]
+
+
+def import_times(module: str) -> dict:
+    """
+    The cumulative import time in microseconds of every module imported by importing the given module. Names
+    keep their indentation, which is two spaces per level of nesting.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name[1:]] = int(cumulative)
+    return times
+
+
+def benchmark(module: str, repeat: int) -> dict:
+    # The first run also includes compiling to bytecode, so take the fastest of several runs
+    runs = [import_times(module) for _ in range(repeat)]
+    fastest = min(runs, key=lambda times: times[module])
+    # The modules imported directly by the module are indented one level
+    direct_imports = {name.strip(): time for name, time in fastest.items() if name.startswith("  ") and not name.startswith("   ")}
+
+    return {
+        "module": module,
+        "import_ms": round(fastest[module] / 1000, 1),
+        "slowest_imports_ms": {
+            name: round(time / 1000, 1)
+            for name, time in sorted(direct_imports.items(), key=lambda item: -item[1])[:5]
+        },
+        "eager_sdk_imports": sorted({name.strip().split(".")[0] for name in fastest} & set(LAZY_MODULES))
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CLI import time")
+    parser.add_argument("--modules", type=str, default="upload_events,generate_schema,ingest_worker,run_tenants")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if any module takes longer than this to import")
+    args = parser.parse_args()
+
+    results = [benchmark(module, args.repeat) for module in args.modules.split(",")]
+    print(json.dumps(results, indent=4))
+
+    failures = [r["module"] for r in results if r["eager_sdk_imports"]]
+    if args.budget_ms is not None:
+        failures += [r["module"] for r in results if r["import_ms"] > args.budget_ms]
+    if failures:
+        sys.exit(f"Import time check failed for: {', '.join(sorted(set(failures)))}")
@@ -0,0 +1,207 @@
+"""
+End-to-end offline benchmarks of upload_events.py and generate_schema.py.
+
+Each scenario runs the real CLI entry point in a fresh process against the ReplayModelProvider (recorded
+responses from --fixtures-path, synthetic responses otherwise) on the bundled examples and on synthetic
+datasets scaled up from them, and reports throughput, per-stage LLM query latency, peak RSS and token usage.
+
+    python benchmarks/run_benchmarks.py --scales 100,1000 --latency 0.5 --jitter 0.3
+    python benchmarks/run_benchmarks.py --benchmarks upload --upload-args "--combined-judge-events"
+"""
+import argparse
+from collections import defaultdict
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import shlex
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+# How often to check whether a scenario's process died without reporting a result
+SCENARIO_POLL_SECONDS = 5
+
+
+def synthesize_dataset(example: str, num_conversations: int, file_path: str):
+    """Write a dataset of num_conversations conversations, cycling through the example's conversations."""
+    with open(os.path.join(EXAMPLES_DIR, example, "example_data.json"), 'r') as f:
+        data = json.load(f)
+
+    conversation_ids = list(data.keys())
+    synthetic = {
+        f"{conversation_ids[i % len(conversation_ids)]}_{i}": data[conversation_ids[i % len(conversation_ids)]]
+        for i in range(num_conversations)
+    }
+    with open(file_path, 'w') as f:
+        json.dump(synthetic, f)
+
+
+def _run_scenario(scenario: dict, results: multiprocessing.Queue):
+    # Imported here so that the import cost is part of the scenario's own process
+    import generate_schema
+    import upload_events
+    from llm_queries.llm_query import LLMQuery
+
+    logging.disable(logging.WARNING)
+
+    # Time every LLM query, including its retries, by the stage (query class) it belongs to
+    latencies = defaultdict(list)
+    model_providers = set()
+    query = LLMQuery._query
+
+    def timed_query(self, *args, **kwargs):
+        model_providers.add(self.model_provider)
+        start = time.perf_counter()
+        try:
+            return query(self, *args, **kwargs)
+        finally:
+            latencies[type(self).__name__].append(time.perf_counter() - start)
+
+    LLMQuery._query = timed_query
+
+    try:
+        start = time.perf_counter()
+        summary = {}
+        if scenario["benchmark"] == "upload":
+            summary = upload_events.run(upload_events.build_parser().parse_args(scenario["argv"]))
+        else:
+            generate_schema.run(generate_schema.build_parser().parse_args(scenario["argv"]))
+        wall_time = time.perf_counter() - start
+    except Exception as e:
+        results.put({"name": scenario["name"], "error": str(e)})
+        return
+
+    usage = defaultdict(int)
+    for model_provider in model_providers:
+        for key, value in model_provider.total_usage().items():
+            usage[key] += value
+
+    result = {
+        "name": scenario["name"],
+        "conversations": scenario["conversations"],
+        "wall_time": round(wall_time, 3),
+        "conversations_per_second": round(scenario["conversations"] / wall_time, 2),
+        "stage_latency": {
+            stage: {
+                "count": len(values),
+                "p50": round(float(np.percentile(values, 50)), 3),
+                "p99": round(float(np.percentile(values, 99)), 3)
+            }
+            for stage, values in sorted(latencies.items())
+        },
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "usage": dict(usage)
+    }
+    # With --upload-args "--hedge-requests", the extra requests sent and the latency saved by hedging
+    if "hedging" in summary:
+        result["hedging"] = summary["hedging"]
+    results.put(result)
+
+
+def run_scenario(scenario: dict) -> dict:
+    """Run the scenario in a fresh process so that its peak RSS isn't shared with other scenarios."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_scenario, args=(scenario, results))
+    process.start()
+
+    while True:
+        try:
+            result = results.get(timeout=SCENARIO_POLL_SECONDS)
+            break
+        except queue.Empty:
+            # A process that died before reporting, e.g. on an import error or killed for running out of memory, never puts a result
+            if process.exitcode not in (None, 0):
+                result = {"name": scenario["name"], "error": f"Exited with code {process.exitcode}"}
+                break
+    process.join()
+    return result
+
+
+def build_scenarios(args, output_dir: str) -> list:
+    replay_argv = [
+        "--model-provider", "replay",
+        "--replay-latency", str(args.latency),
+        "--replay-seconds-per-output-token", str(args.seconds_per_output_token),
+        "--replay-jitter", str(args.jitter),
+        "--replay-error-rate", str(args.error_rate),
+        "--max-concurrency", str(args.max_concurrency)
+    ]
+    if args.fixtures_path:
+        replay_argv += ["--replay-fixtures-path", args.fixtures_path]
+
+    datasets = []
+    for example in args.examples.split(","):
+        with open(os.path.join(EXAMPLES_DIR, example, "example_data.json"), 'r') as f:
+            datasets.append((example, example, os.path.join(EXAMPLES_DIR, example, "example_data.json"), len(json.load(f))))
+        for scale in [int(s) for s in args.scales.split(",") if s]:
+            data_path = os.path.join(output_dir, f"{example}_{scale}.json")
+            synthesize_dataset(example, scale, data_path)
+            datasets.append((f"{example}_{scale}", example, data_path, scale))
+
+    scenarios = []
+    for name, example, data_path, num_conversations in datasets:
+        if "upload" in args.benchmarks:
+            scenarios.append({
+                "name": f"upload:{name}",
+                "benchmark": "upload",
+                "conversations": num_conversations,
+                "argv": [
+                    "--data-path", data_path,
+                    "--data-schema-path", os.path.join(EXAMPLES_DIR, example, "schema.yml"),
+                    "--destination", "jsonl",
+                    "--destination-path", os.path.join(output_dir, f"{name}_events.jsonl")
+                ] + replay_argv + shlex.split(args.upload_args)
+            })
+        if "schema" in args.benchmarks:
+            scenarios.append({
+                "name": f"schema:{name}",
+                "benchmark": "schema",
+                "conversations": num_conversations,
+                "argv": [
+                    "--data-path", data_path,
+                    "--data-schema-output-path", os.path.join(output_dir, f"{name}_schema.yml")
+                ] + replay_argv + shlex.split(args.schema_args)
+            })
+
+    return scenarios
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the end-to-end offline benchmarks")
+    parser.add_argument("--benchmarks", type=str, default="upload,schema", help="Comma-separated benchmarks to run: upload, schema")
+    parser.add_argument("--examples", type=str, default="therapist,tax_advisor")
+    parser.add_argument("--scales", type=str, default="100,1000", help="Comma-separated sizes of the synthetic datasets generated from each example")
+    parser.add_argument("--fixtures-path", type=str, default=None, help="Recorded responses to replay (JSON Lines of {key, response})")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated seconds of overhead per request")
+    parser.add_argument("--seconds-per-output-token", type=float, default=0.01, help="Simulated generation time per output token")
+    parser.add_argument("--jitter", type=float, default=0.3, help="The sigma of the log-normal latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="The fraction of requests that fail")
+    parser.add_argument("--max-concurrency", type=int, default=5)
+    parser.add_argument("--upload-args", type=str, default="", help="Extra arguments passed to upload_events.py")
+    parser.add_argument("--schema-args", type=str, default="", help="Extra arguments passed to generate_schema.py")
+    parser.add_argument("--output-path", type=str, default=None, help="Optional path to write the results to as JSON")
+    args = parser.parse_args()
+
+    # Progress bars would interleave with the results
+    os.environ["TQDM_DISABLE"] = "1"
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = []
+        for scenario in build_scenarios(args, output_dir):
+            result = run_scenario(scenario)
+            print(json.dumps(result), flush=True)
+            results.append(result)
+
+    if args.output_path:
+        with open(args.output_path, 'w') as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,107 @@
+"""
+Compare the makespan of each pipeline stage when requests run in source order on per-stage thread pools versus
+largest first from the shared PriorityScheduler.
+
+Runs offline with the ReplayModelProvider, whose simulated latency grows with the prompt, on a synthetic
+dataset of mostly short conversations with a few very long ones at the end of the source order, the case
+where the long ones become stragglers that each stage waits for.
+
+    python benchmarks/scheduling.py --num-conversations 200 --num-long 4 --long-messages 300
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+logging.basicConfig(level=logging.WARNING)
+# Progress bars would interleave with the results
+os.environ["TQDM_DISABLE"] = "1"
+
+from destinations.jsonl import JsonlDestination
+from llm_queries.replay_model_provider import ReplayModelProvider
+from models.conversation import Conversation, Message
+from models.data_schema import DataSchema
+from pipeline import Pipeline, PipelineConfig, PipelineHooks
+from scheduler import PriorityScheduler
+from sources.local import LocalSource
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+def synthesize_conversations(example: str, num_conversations: int, num_long: int, long_messages: int, seed: int = 42):
+    """Conversations of 4-20 messages taken from the example's, followed by num_long conversations of long_messages messages."""
+    rng = random.Random(seed)
+    messages = [message for conversation in LocalSource(os.path.join(EXAMPLES_DIR, example, "example_data.json")).get_conversations() for message in conversation.messages]
+    sizes = [rng.randint(4, 20) for _ in range(num_conversations - num_long)] + [long_messages] * num_long
+
+    conversations = []
+    for i, size in enumerate(sizes):
+        conversation_messages = [
+            Message(message.role, message.content, message.timestamp, f"{i}-{j}")
+            for j, message in enumerate(messages[k % len(messages)] for k in range(i, i + size))
+        ]
+        conversations.append(Conversation(f"conversation-{i}", f"user-{i}", conversation_messages))
+    return conversations
+
+
+class StageTimer(PipelineHooks):
+
+    def __init__(self):
+        self.seconds = {}
+
+    def on_stage_end(self, stage: str, seconds: float):
+        self.seconds[stage] = round(seconds, 3)
+
+
+def benchmark(name: str, executor, data_schema: DataSchema, conversations, args, output_dir: str) -> dict:
+    model_provider = ReplayModelProvider(
+        base_latency=args.base_latency,
+        seconds_per_input_token=args.seconds_per_input_token,
+        seconds_per_output_token=args.seconds_per_output_token,
+        jitter=args.jitter
+    )
+    hooks = StageTimer()
+    config = PipelineConfig(max_workers=args.max_concurrency)
+    destination = JsonlDestination(os.path.join(output_dir, f"{name}.jsonl"))
+    start = time.perf_counter()
+    with Pipeline(model_provider, data_schema, destination, config=config, executor=executor, hooks=hooks) as pipeline:
+        pipeline.run(conversations)
+    return {"executor": name, "makespan": round(time.perf_counter() - start, 3), "stage_seconds": hooks.seconds}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark largest-first scheduling of LLM requests")
+    parser.add_argument("--example", type=str, default="therapist")
+    parser.add_argument("--num-conversations", type=int, default=200)
+    parser.add_argument("--num-long", type=int, default=4, help="Long conversations at the end of the source order")
+    parser.add_argument("--long-messages", type=int, default=300)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--tokens-per-minute", type=int, default=None, help="The priority scheduler's token limit")
+    parser.add_argument("--base-latency", type=float, default=0.05, help="Simulated seconds of overhead per request")
+    parser.add_argument("--seconds-per-input-token", type=float, default=0.0001, help="Simulated prompt processing time per input token")
+    parser.add_argument("--seconds-per-output-token", type=float, default=0.0005, help="Simulated generation time per output token")
+    parser.add_argument("--jitter", type=float, default=0.3, help="The sigma of the log-normal latency jitter")
+    args = parser.parse_args()
+
+    data_schema = DataSchema.from_yaml(os.path.join(EXAMPLES_DIR, args.example, "schema.yml"))
+    conversations = synthesize_conversations(args.example, args.num_conversations, args.num_long, args.long_messages)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        threads = benchmark("threads", "threads", data_schema, conversations, args, output_dir)
+        scheduler = PriorityScheduler(args.max_concurrency, tokens_per_minute=args.tokens_per_minute)
+        try:
+            priority = benchmark("priority", scheduler, data_schema, conversations, args, output_dir)
+        finally:
+            scheduler.shutdown()
+
+    print(json.dumps({
+        "conversations": len(conversations),
+        "results": [threads, priority],
+        "makespan_reduction": round(1 - priority["makespan"] / threads["makespan"], 3)
+    }, indent=4))
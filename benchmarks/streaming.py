@@ -0,0 +1,73 @@
+"""
+Compare how soon each stage has its first event when responses are streamed and parsed entry by entry, versus
+only once each response is complete, and how long the whole run takes without streaming, when each stage
+waits for the one before.
+
+Runs offline with the ReplayModelProvider, which streams the entries of its responses over the simulated
+generation time. When buffered, entries are passed on only when the whole response has arrived.
+
+    python benchmarks/streaming.py --repeat 3 --seconds-per-output-token 0.01
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+logging.basicConfig(level=logging.WARNING)
+# Progress bars would interleave with the results
+os.environ["TQDM_DISABLE"] = "1"
+
+from destinations.jsonl import JsonlDestination
+from llm_queries.llm_query import ModelProvider
+from llm_queries.replay_model_provider import ReplayModelProvider
+from models.data_schema import DataSchema
+from pipeline import Pipeline, PipelineConfig
+from sources.local import LocalSource
+from upload_events import FirstItemTimer
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+class BufferedReplayModelProvider(ReplayModelProvider):
+    # Falls back to waiting for the whole response, like a provider that can't stream
+    stream_query = ModelProvider.stream_query
+
+
+def benchmark(
+    name: str, model_provider: ReplayModelProvider, data_schema: DataSchema, conversations, args, output_dir: str, stream_responses: bool = True
+) -> dict:
+    hooks = FirstItemTimer()
+    config = PipelineConfig(max_workers=args.max_concurrency, stream_responses=stream_responses)
+    destination = JsonlDestination(os.path.join(output_dir, f"{name}.jsonl"))
+    start = time.perf_counter()
+    with Pipeline(model_provider, data_schema, destination, config=config, hooks=hooks) as pipeline:
+        pipeline.run(conversations)
+    return {"responses": name, "wall_time": round(time.perf_counter() - start, 3), "seconds_to_first_item": hooks.seconds_to_first_item}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark streamed LLM responses")
+    parser.add_argument("--example", type=str, default="therapist")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeat the example conversations to simulate a larger run")
+    parser.add_argument("--max-concurrency", type=int, default=5)
+    parser.add_argument("--base-latency", type=float, default=0.3, help="Simulated seconds of overhead per request")
+    parser.add_argument("--seconds-per-output-token", type=float, default=0.005, help="Simulated generation time per output token")
+    args = parser.parse_args()
+
+    data_schema = DataSchema.from_yaml(os.path.join(EXAMPLES_DIR, args.example, "schema.yml"))
+    conversations = LocalSource(os.path.join(EXAMPLES_DIR, args.example, "example_data.json")).get_conversations() * args.repeat
+
+    latency = {"base_latency": args.base_latency, "seconds_per_output_token": args.seconds_per_output_token}
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = [
+            benchmark("staged", ReplayModelProvider(**latency), data_schema, conversations, args, output_dir, stream_responses=False),
+            benchmark("buffered", BufferedReplayModelProvider(**latency), data_schema, conversations, args, output_dir),
+            benchmark("streamed", ReplayModelProvider(**latency), data_schema, conversations, args, output_dir)
+        ]
+
+    print(json.dumps({"conversations": len(conversations), "results": results}, indent=4))
@@ -0,0 +1,313 @@
+"""
+Conversational analytics computed locally over tagged events, without exporting them to an analytics platform.
+
+Events are loaded from the parquet, duckdb or jsonl destinations into NumPy arrays sorted by conversation and
+time, and each metric is computed with vectorized operations over the whole table.
+"""
+from dataclasses import dataclass, field
+import logging
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import tracing
+
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ["event_type", "conversation_id", "timestamp", "llm_judge_score", "event_properties"]
+
+
+@dataclass
+class EventTable:
+    """Tagged events as columnar arrays, sorted by conversation and then timestamp."""
+
+    # The name of each event type, indexed by its code
+    event_type_names: List[str]
+    event_types: np.ndarray
+    conversations: np.ndarray
+    # Microseconds since the epoch
+    timestamps: np.ndarray
+    # NaN where the conversation has no judge score
+    llm_judge_scores: np.ndarray
+    # For each property name, the name of each value (indexed by its code) and each event's value code, or -1 if the event doesn't have the property
+    properties: Dict[str, Tuple[List[str], np.ndarray]] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.event_types)
+
+    @property
+    def num_conversations(self) -> int:
+        return int(self.conversations.max()) + 1 if len(self) else 0
+
+    @property
+    def conversation_starts(self) -> np.ndarray:
+        """The index of each conversation's first event."""
+        return np.flatnonzero(np.r_[True, self.conversations[1:] != self.conversations[:-1]]) if len(self) else np.empty(0, dtype=np.int64)
+
+    def event_type_code(self, event_type: str) -> int:
+        if event_type not in self.event_type_names:
+            raise ValueError(f"Unknown event type {event_type}, expected one of {self.event_type_names}")
+        return self.event_type_names.index(event_type)
+
+    @classmethod
+    @tracing.traced("analytics.from_arrow")
+    def from_arrow(cls, table: pa.Table) -> "EventTable":
+        event_types, event_type_names = _dictionary_codes(table.column("event_type"))
+        conversations, _ = _dictionary_codes(table.column("conversation_id"))
+        timestamps = pc.cast(table.column("timestamp"), pa.timestamp("us")).cast(pa.int64()).to_numpy()
+        llm_judge_scores = pc.cast(table.column("llm_judge_score"), pa.float64()).to_numpy(zero_copy_only=False)
+
+        # Sort by conversation, then time. lexsort sorts by its last key first
+        order = np.lexsort((timestamps, conversations))
+        event_table = cls(
+            event_type_names=event_type_names,
+            event_types=event_types[order],
+            conversations=conversations[order],
+            timestamps=timestamps[order],
+            llm_judge_scores=llm_judge_scores[order]
+        )
+        if "event_properties" in table.column_names:
+            event_table.properties = _property_codes(table.column("event_properties"), order)
+        return event_table
+
+
+def _dictionary_codes(column: pa.ChunkedArray) -> Tuple[np.ndarray, List[str]]:
+    """The code of each value, and the value of each code."""
+    encoded = pc.dictionary_encode(column.combine_chunks())
+    return encoded.indices.to_numpy(zero_copy_only=False).astype(np.int64), encoded.dictionary.to_pylist()
+
+
+def _property_codes(column: pa.ChunkedArray, order: np.ndarray) -> Dict[str, Tuple[List[str], np.ndarray]]:
+    column = column.combine_chunks()
+    if pa.types.is_struct(column.type):
+        # The jsonl destination's properties are read as a struct with a field per property
+        return {
+            name: _property_value_codes(column.field(name), np.arange(len(column)), len(column), order)
+            for name in [column.type.field(i).name for i in range(column.type.num_fields)]
+        }
+
+    # Map arrays flatten to one entry per (event, property) pair
+    offsets = column.offsets.to_numpy()
+    parents = np.repeat(np.arange(len(column)), np.diff(offsets))
+    entry_keys = column.keys.slice(offsets[0], offsets[-1] - offsets[0])
+    entry_values = column.items.slice(offsets[0], offsets[-1] - offsets[0])
+    keys, names = _dictionary_codes(pa.chunked_array([entry_keys]))
+
+    properties = {}
+    for key_code, name in enumerate(names):
+        mask = keys == key_code
+        properties[name] = _property_value_codes(entry_values.filter(pa.array(mask)), parents[mask], len(column), order)
+    return properties
+
+
+def _property_value_codes(values: pa.Array, rows: np.ndarray, num_rows: int, order: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    encoded = pc.dictionary_encode(pc.cast(values, pa.string()))
+    codes = np.full(num_rows, -1, dtype=np.int64)
+    # Null values (events without the property) are encoded as nulls, so leave those at -1
+    valid = encoded.indices.is_valid().to_numpy(zero_copy_only=False)
+    codes[rows[valid]] = encoded.indices.to_numpy(zero_copy_only=False)[valid]
+    return encoded.dictionary.to_pylist(), codes[order]
+
+
+@tracing.traced("analytics.load_events")
+def load_events(path: str, data_format: str = "auto", table: str = "events") -> EventTable:
+    """Load the events written by the parquet, duckdb or jsonl destination. The format is detected from the path by default."""
+    if data_format == "auto":
+        if path.endswith((".duckdb", ".db")):
+            data_format = "duckdb"
+        elif path.endswith(".jsonl"):
+            data_format = "jsonl"
+        else:
+            data_format = "parquet"
+
+    if data_format == "parquet":
+        import pyarrow.dataset as ds
+
+        # Hive partition columns such as event_type and date are read back from the directory names
+        arrow_table = ds.dataset(path, format="parquet", partitioning="hive").to_table(columns=COLUMNS)
+    elif data_format == "duckdb":
+        import duckdb
+
+        connection = duckdb.connect(path, read_only=True)
+        arrow_table = connection.execute(f'SELECT {", ".join(COLUMNS)} FROM "{table}"').arrow()
+        if isinstance(arrow_table, pa.RecordBatchReader):
+            arrow_table = arrow_table.read_all()
+    elif data_format == "jsonl":
+        arrow_table = _read_jsonl(path)
+    else:
+        raise ValueError(f"Unknown events format {data_format}")
+
+    logger.info(f"Loaded {arrow_table.num_rows} events from {path}")
+    return EventTable.from_arrow(arrow_table)
+
+
+def _read_jsonl(path: str) -> pa.Table:
+    import pyarrow.json as pj
+
+    records = pj.read_json(path)
+    event_properties = records.column("event_properties").combine_chunks()
+    # The jsonl destination nests the conversation id, judge score and property values in event_properties
+    standard = {"conversation_id", "message_id", "content", "role", "explanation", "llm_judge_score", "event_model"}
+    property_names = [event_properties.type.field(i).name for i in range(event_properties.type.num_fields)]
+    property_names = [name for name in property_names if name not in standard]
+    return pa.table({
+        "event_type": records.column("event_type"),
+        "conversation_id": pc.cast(event_properties.field("conversation_id"), pa.string()),
+        "timestamp": pc.cast(records.column("timestamp"), pa.timestamp("us")),
+        "llm_judge_score": event_properties.field("llm_judge_score"),
+        "event_properties": pa.StructArray.from_arrays(
+            [event_properties.field(name) for name in property_names], names=property_names
+        ) if property_names else pa.nulls(records.num_rows, pa.struct([]))
+    })
+
+
+@tracing.traced("analytics.transition_matrix")
+def transition_matrix(events: EventTable) -> np.ndarray:
+    """Counts of each event type (row) being followed by each event type (column) within a conversation."""
+    num_event_types = len(events.event_type_names)
+    same_conversation = events.conversations[1:] == events.conversations[:-1]
+    pairs = events.event_types[:-1][same_conversation] * num_event_types + events.event_types[1:][same_conversation]
+    return np.bincount(pairs, minlength=num_event_types * num_event_types).reshape(num_event_types, num_event_types)
+
+
+@tracing.traced("analytics.funnel")
+def funnel(events: EventTable, steps: Sequence[str]) -> List[dict]:
+    """
+    The number of conversations that reach each step of the funnel, where each step is an event type that
+    has to occur after the previous step in the same conversation.
+    """
+    # Rows are sorted by conversation and time, so a later row in the same conversation is a later event
+    previous_step_rows = np.full(events.num_conversations, -1, dtype=np.int64)
+    previous_step_timestamps = np.zeros(events.num_conversations, dtype=np.int64)
+    rows = np.arange(len(events))
+
+    results = []
+    for step in steps:
+        mask = (events.event_types == events.event_type_code(step)) & (rows > previous_step_rows[events.conversations])
+        candidates = np.flatnonzero(mask)
+        # The first candidate in each conversation is where it reaches this step
+        firsts = candidates[np.r_[True, events.conversations[candidates][1:] != events.conversations[candidates][:-1]]] if len(candidates) else candidates
+        conversations = events.conversations[firsts]
+
+        seconds_from_previous = (events.timestamps[firsts] - previous_step_timestamps[conversations]) / 1e6
+        results.append({
+            "step": step,
+            "conversations": len(firsts),
+            "conversion_from_previous": len(firsts) / results[-1]["conversations"] if results and results[-1]["conversations"] else None,
+            "conversion_from_start": len(firsts) / results[0]["conversations"] if results and results[0]["conversations"] else None,
+            "median_seconds_from_previous": float(np.median(seconds_from_previous)) if results and len(firsts) else None
+        })
+
+        # Conversations that didn't reach this step can't reach the next one
+        previous_step_rows = np.full(events.num_conversations, len(events), dtype=np.int64)
+        previous_step_rows[conversations] = firsts
+        previous_step_timestamps[conversations] = events.timestamps[firsts]
+
+    return results
+
+
+def _grouped_score_distributions(groups: np.ndarray, scores: np.ndarray, group_names: List[str], bins: int) -> Dict[str, dict]:
+    """Score statistics for each group, from parallel arrays of group codes and judge scores."""
+    valid = ~np.isnan(scores)
+    groups, scores = groups[valid], scores[valid]
+    num_groups = len(group_names)
+
+    # Judge scores are integers from 0 to 100, so a count of each score per group gives exact quantiles without sorting
+    score_counts = np.bincount(
+        groups * 101 + np.clip(np.round(scores), 0, 100).astype(np.int64),
+        minlength=num_groups * 101
+    ).reshape(num_groups, 101)
+    counts = score_counts.sum(axis=1)
+    sums = score_counts @ np.arange(101)
+    cumulative_counts = np.cumsum(score_counts, axis=1)
+    # Each bin covers an equal share of 0-100, with 100 in the last bin
+    score_bins = np.minimum(np.arange(101) * bins // 100, bins - 1)
+    histograms = score_counts @ np.eye(bins, dtype=np.int64)[score_bins]
+
+    def quantile(q: float) -> np.ndarray:
+        # The score of the element at position floor(q * (n - 1)) in each group's sorted scores
+        positions = (q * np.maximum(counts - 1, 0)).astype(np.int64)
+        return (cumulative_counts > positions[:, None]).argmax(axis=1)
+
+    quantiles = {name: quantile(q) for name, q in [("p25", 0.25), ("median", 0.5), ("p75", 0.75)]}
+    return {
+        name: {
+            "conversations": int(counts[i]),
+            "mean": float(sums[i] / counts[i]),
+            **{q: float(values[i]) for q, values in quantiles.items()},
+            "histogram": histograms[i].tolist()
+        }
+        for i, name in enumerate(group_names) if counts[i]
+    }
+
+
+def _distinct(keys: np.ndarray, num_keys: int) -> np.ndarray:
+    """The distinct keys in ascending order, using a presence bitmap (linear time) unless it would be much larger than the keys."""
+    if num_keys <= 8 * len(keys) + 1024:
+        present = np.zeros(num_keys, dtype=bool)
+        present[keys] = True
+        return np.flatnonzero(present)
+    return np.unique(keys)
+
+
+def _conversation_group_scores(events: EventTable, conversations: np.ndarray, groups: np.ndarray, num_groups: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The group and judge score of each distinct (conversation, group) pair, so that a conversation counts once
+    per group however many of its events are in the group.
+    """
+    keys = _distinct(conversations * num_groups + groups, events.num_conversations * num_groups)
+    # Every event of a conversation has the conversation's score, so take the first
+    conversation_scores = events.llm_judge_scores[events.conversation_starts]
+    return keys % num_groups, conversation_scores[keys // num_groups]
+
+
+@tracing.traced("analytics.judge_scores_by_event_type")
+def judge_scores_by_event_type(events: EventTable, bins: int = 10) -> Dict[str, dict]:
+    """The distribution of judge scores of the conversations containing each event type."""
+    groups, scores = _conversation_group_scores(events, events.conversations, events.event_types, len(events.event_type_names))
+    return _grouped_score_distributions(groups, scores, events.event_type_names, bins)
+
+
+@tracing.traced("analytics.judge_scores_by_property")
+def judge_scores_by_property(events: EventTable, property_name: str, bins: int = 10) -> Dict[str, dict]:
+    """The distribution of judge scores of the conversations containing events with each value of the property."""
+    if property_name not in events.properties:
+        raise ValueError(f"Unknown property {property_name}, expected one of {list(events.properties)}")
+
+    value_names, codes = events.properties[property_name]
+    has_value = codes >= 0
+    groups, scores = _conversation_group_scores(events, events.conversations[has_value], codes[has_value], len(value_names))
+    return _grouped_score_distributions(groups, scores, value_names, bins)
+
+
+@tracing.traced("analytics.time_to_event")
+def time_to_event(events: EventTable, event_type: str) -> dict:
+    """
+    How long conversations take to reach their first event of the given type, in seconds and in turns (tagged
+    messages) from the conversation's first tagged message.
+    """
+    starts = events.conversation_starts
+    candidates = np.flatnonzero(events.event_types == events.event_type_code(event_type))
+    firsts = candidates[np.r_[True, events.conversations[candidates][1:] != events.conversations[candidates][:-1]]] if len(candidates) else candidates
+    conversation_starts = starts[events.conversations[firsts]]
+
+    seconds = (events.timestamps[firsts] - events.timestamps[conversation_starts]) / 1e6
+    turns = firsts - conversation_starts
+
+    def stats(values: np.ndarray) -> dict:
+        if not len(values):
+            return {}
+        p50, p90 = np.percentile(values, [50, 90])
+        return {"mean": float(values.mean()), "median": float(p50), "p90": float(p90)}
+
+    return {
+        "event_type": event_type,
+        "conversations": len(starts),
+        "conversations_reached": len(firsts),
+        "fraction_reached": len(firsts) / len(starts) if len(starts) else None,
+        "seconds": stats(seconds),
+        "turns": stats(turns)
+    }
@@ -0,0 +1,71 @@
+import argparse
+import json
+import logging
+import time
+
+# Configure root logger to WARNING to silence third-party libraries
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+import analytics
+import tracing
+
+# Set loggers within this application to INFO
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logging.getLogger('analytics').setLevel(logging.INFO)
+
+
+def analyze(args) -> dict:
+    """Compute the requested metrics over the tagged events at args.events_path."""
+    if args.trace_path:
+        tracing.configure(args.trace_path, service_name="analyze_events")
+
+    start = time.perf_counter()
+    events = analytics.load_events(args.events_path, args.events_format, table=args.duckdb_table)
+    logger.info(f"Loaded {len(events)} events from {events.num_conversations} conversations in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    transitions = analytics.transition_matrix(events)
+    report = {
+        "events": len(events),
+        "conversations": events.num_conversations,
+        "transitions": {
+            from_name: {to_name: int(count) for to_name, count in zip(events.event_type_names, row) if count}
+            for from_name, row in zip(events.event_type_names, transitions)
+        },
+        "judge_scores_by_event_type": analytics.judge_scores_by_event_type(events, bins=args.histogram_bins)
+    }
+    if args.funnel:
+        report["funnel"] = analytics.funnel(events, args.funnel.split(","))
+    for property_name in args.judge_scores_by_property or []:
+        report.setdefault("judge_scores_by_property", {})[property_name] = analytics.judge_scores_by_property(events, property_name, bins=args.histogram_bins)
+    for event_type in args.time_to_event or []:
+        report.setdefault("time_to_event", []).append(analytics.time_to_event(events, event_type))
+    logger.info(f"Computed metrics in {time.perf_counter() - start:.2f}s")
+
+    tracing.flush()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute conversational analytics over tagged events written by the parquet, duckdb or jsonl destination")
+    parser.add_argument("--events-path", type=str, required=True, help="A Parquet dataset, DuckDB database or JSON Lines file of events")
+    parser.add_argument("--events-format", type=str, choices=["auto", "parquet", "duckdb", "jsonl"], default="auto")
+    parser.add_argument("--duckdb-table", type=str, default="events")
+    parser.add_argument("--funnel", type=str, default=None, help="Comma-separated event types, in order, to count the conversations reaching each of")
+    parser.add_argument("--judge-scores-by-property", type=str, action="append", help="A property to break judge scores down by. Can be repeated")
+    parser.add_argument("--time-to-event", type=str, action="append", help="An event type to measure the time and turns to the first occurrence of. Can be repeated")
+    parser.add_argument("--histogram-bins", type=int, default=10, help="The number of equal-width bins of judge score histograms over 0-100")
+    parser.add_argument("--trace-path", type=str, default=None, help="Optional path to write OTLP/JSON trace spans of the analysis to")
+    parser.add_argument("--output-path", type=str, default=None, help="Write the report to this file instead of printing it")
+    args = parser.parse_args()
+
+    report = analyze(args)
+    if args.output_path:
+        with open(args.output_path, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import importlib.util
+import logging
+from typing import Callable, List, Optional, TYPE_CHECKING
+
+# Each SDK is imported by the function that builds its client, so a run only imports the ones it uses
+if TYPE_CHECKING:
+    from amplitude import Amplitude
+    import anthropic
+    import openai
+    from posthog import Posthog
+
+
+logger = logging.getLogger(__name__)
+
+
+class HttpPoolConfig:
+    """
+    Connection pool settings shared by the HTTP clients of the model providers.
+
+    The pool should have at least as many connections as there are threads making requests through the
+    client, otherwise threads wait on each other for a connection (or open and tear down extra ones).
+    """
+
+    def __init__(self, max_connections: int, http2: bool = True, keepalive_expiry: float = 60.0):
+        self.max_connections = max_connections
+        self.http2 = http2
+        self.keepalive_expiry = keepalive_expiry
+
+    def limits(self, sdk):
+        # Each SDK may be built on its own httpx version, so use the Limits type of its default limits
+        return type(sdk.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def use_http2(self) -> bool:
+        # HTTP/2 support in httpx needs the h2 package
+        if self.http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the h2 package isn't installed, falling back to HTTP/1.1")
+            return False
+        return self.http2
+
+
+def openai_client(pool_config: HttpPoolConfig) -> openai.OpenAI:
+    import openai
+
+    return openai.OpenAI(
+        http_client=openai.DefaultHttpxClient(limits=pool_config.limits(openai), http2=pool_config.use_http2())
+    )
+
+
+def anthropic_client(pool_config: HttpPoolConfig) -> anthropic.Anthropic:
+    import anthropic
+
+    return anthropic.Anthropic(
+        http_client=anthropic.DefaultHttpxClient(limits=pool_config.limits(anthropic), http2=pool_config.use_http2())
+    )
+
+
+def boto3_client(service_name: str, pool_config: HttpPoolConfig):
+    import boto3
+    from botocore.config import Config
+
+    # botocore only speaks HTTP/1.1, but its pool defaults to 10 connections and it can keep them alive
+    return boto3.client(
+        service_name,
+        config=Config(max_pool_connections=pool_config.max_connections, tcp_keepalive=True)
+    )
+
+
+def posthog_client(
+    api_key: str, host: str, threads: int = 1, max_queue_size: int = 10000, flush_at: int = 100,
+    on_error: Optional[Callable[[Exception, List[dict]], None]] = None
+) -> Posthog:
+    """
+    A PostHog client whose background consumer threads send batches of events concurrently. on_error is called
+    with each batch the consumers couldn't send after retrying it.
+    """
+    from posthog import Posthog
+
+    return Posthog(
+        project_api_key=api_key,
+        host=host,
+        thread=threads,
+        max_queue_size=max_queue_size,
+        flush_at=flush_at,
+        on_error=on_error
+    )
+
+
+def amplitude_client(
+    api_key: str, flush_queue_size: int = 200, flush_interval_millis: int = 10000,
+    callback: Optional[Callable[[object, int, Optional[str]], None]] = None
+) -> Amplitude:
+    """An Amplitude client that calls callback with every event, its status code and message once it's been sent or dropped."""
+    from amplitude import Amplitude, Config
+
+    return Amplitude(
+        api_key,
+        configuration=Config(flush_queue_size=flush_queue_size, flush_interval_millis=flush_interval_millis, callback=callback)
+    )
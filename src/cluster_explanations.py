@@ -0,0 +1,115 @@
+import argparse
+import json
+import logging
+import os
+from typing import Iterator, List, Tuple
+import uuid
+
+# Configure root logger to WARNING to silence third-party libraries
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+from explanation_clustering import ExplanationClusterer
+from models.event import EVENT_ID_NAMESPACE
+
+# Set loggers within this application to INFO
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def iter_explanations(path: str, data_format: str = "auto", batch_size: int = 65536) -> Iterator[List[Tuple[str, str, str]]]:
+    """
+    Stream (event type, insert id, explanation) batches from the events written by the jsonl, parquet or duckdb
+    destination, so that any number of events can be clustered in bounded memory.
+    """
+    if data_format == "auto":
+        data_format = "jsonl" if path.endswith(".jsonl") else "duckdb" if path.endswith((".duckdb", ".db")) else "parquet"
+
+    if data_format == "jsonl":
+        batch = []
+        with open(path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                properties = record["event_properties"]
+                # Events written before insert ids were added get the same id they would have had
+                insert_id = record.get("insert_id") or str(uuid.uuid5(EVENT_ID_NAMESPACE, f"{properties['conversation_id']}/{properties['message_id']}"))
+                batch.append((record["event_type"], insert_id, properties.get("explanation")))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+        return
+
+    columns = ["event_type", "insert_id", "explanation"]
+    if data_format == "parquet":
+        import pyarrow.dataset as ds
+
+        batches = ds.dataset(path, format="parquet", partitioning="hive").to_batches(columns=columns, batch_size=batch_size)
+    elif data_format == "duckdb":
+        import duckdb
+
+        batches = duckdb.connect(path, read_only=True).execute(f"SELECT {', '.join(columns)} FROM events").fetch_record_batch(batch_size)
+    else:
+        raise ValueError(f"Unknown events format {data_format}")
+
+    for record_batch in batches:
+        yield list(zip(*(record_batch.column(name).to_pylist() for name in columns)))
+
+
+def cluster(args) -> ExplanationClusterer:
+    if args.clusterer_path and os.path.exists(args.clusterer_path):
+        clusterer = ExplanationClusterer.load(args.clusterer_path)
+        logger.info(f"Continuing from the clusters saved at {args.clusterer_path}")
+    else:
+        clusterer = ExplanationClusterer(n_clusters=args.n_clusters, index_capacity=args.index_capacity)
+
+    num_explanations = 0
+    for batch in iter_explanations(args.events_path, args.events_format):
+        by_event_type = {}
+        for event_type, insert_id, explanation in batch:
+            if explanation:
+                ids, explanations = by_event_type.setdefault(event_type, ([], []))
+                ids.append(insert_id)
+                explanations.append(explanation)
+
+        for event_type, (ids, explanations) in by_event_type.items():
+            clusterer.partial_fit_explanations(event_type, ids, explanations)
+            num_explanations += len(explanations)
+        logger.info(f"Clustered {num_explanations} explanations")
+
+    if args.clusterer_path:
+        clusterer.save(args.clusterer_path)
+        logger.info(f"Saved the clusters to {args.clusterer_path}")
+    return clusterer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster the explanations of tagged events by event type, and find events similar to a given explanation")
+    parser.add_argument("--events-path", type=str, default=None, help="Events written by the jsonl, parquet or duckdb destination to cluster")
+    parser.add_argument("--events-format", type=str, choices=["auto", "jsonl", "parquet", "duckdb"], default="auto")
+    parser.add_argument("--clusterer-path", type=str, default=None, help="Continue from the clusters saved at this path (.npz), and save the updated clusters there")
+    parser.add_argument("--n-clusters", type=int, default=8, help="The number of clusters per event type")
+    parser.add_argument("--index-capacity", type=int, default=100000, help="The maximum number of explanations per event type kept in the similarity index")
+    parser.add_argument("--similar-to", type=str, default=None, help="Print the insert ids of the indexed events whose explanations are most similar to this one")
+    parser.add_argument("--event-type", type=str, default=None, help="The event type to search with --similar-to")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.events_path:
+        clusterer = cluster(args)
+    elif args.clusterer_path:
+        clusterer = ExplanationClusterer.load(args.clusterer_path)
+    else:
+        parser.error("Either --events-path or --clusterer-path is required")
+
+    if args.similar_to:
+        if not args.event_type:
+            parser.error("--similar-to requires --event-type")
+        print(json.dumps(clusterer.similar(args.event_type, args.similar_to, args.k), indent=4))
+    else:
+        print(json.dumps(clusterer.summary(), indent=4))
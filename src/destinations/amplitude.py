@@ -1,16 +1,31 @@
 import os
+import threading
+import time
 
 from amplitude import Amplitude
 from amplitude import BaseEvent
 
-from destinations.destination import Destination
+from destinations.destination import DeliveryError, Destination
 from models.event import Event, ROLE
 
 
 class AmplitudeDestination(Destination):
+    """
+    Sends events with the Amplitude client, which reports the outcome of each event once it's been sent, or
+    the client has given up retrying it, to record_delivery. The client must be built with record_delivery as
+    its callback (see clients.amplitude_client).
+    """
+
+    # How long flush waits for Amplitude to report the outcome of every event, including its own retries
+    flush_timeout = 120
+    poll_interval = 1
 
     def __init__(self, amplitude_client: Amplitude):
         self.amplitude_client = amplitude_client
+        self.lock = threading.Lock()
+        # Events sent since the last flush whose outcome Amplitude hasn't reported yet, and those that failed
+        self.pending = set()
+        self.failed = {}
 
     def send_event(self, event: Event, llm_judge_score: int):
 
@@ -22,15 +37,50 @@ class AmplitudeDestination(Destination):
             "explanation": event.explanation,
             "llm_judge_score": llm_judge_score
         }
+        # Events created without a model don't get an empty event_model property
+        if event.model_id:
+            event_properties["event_model"] = event.model_id
 
         for property_name, property_value in event.property_values.items():
             event_properties[property_name] = property_value
 
+        with self.lock:
+            self.pending.add(event.insert_id)
         self.amplitude_client.track(
             BaseEvent(
                 event_type=event.event_type.name,
                 user_id=str(event.user_id),
                 time=int(event.message.timestamp.timestamp()  * 1000),
-                event_properties=event_properties
+                event_properties=event_properties,
+                insert_id=event.insert_id
             )
-        )
\ No newline at end of file
+        )
+
+    def record_delivery(self, amplitude_event: BaseEvent, code: int, message: str):
+        with self.lock:
+            # Unless a flush already timed out waiting on it and reported it as failed
+            if amplitude_event.insert_id not in self.pending:
+                return
+            self.pending.discard(amplitude_event.insert_id)
+            if code != 200:
+                self.failed[amplitude_event.insert_id] = f"{code}: {message}"
+
+    def flush(self):
+        deadline = time.monotonic() + self.flush_timeout
+        while True:
+            # The futures don't raise when a request fails, the events are put back in the buffer to be retried
+            # by the next flush, or reported as failed to record_delivery. A destination with nothing buffered
+            # returns None instead of a future
+            for future in self.amplitude_client.flush():
+                if future is not None:
+                    future.result()
+            with self.lock:
+                if not self.pending or time.monotonic() >= deadline:
+                    failed = {**self.failed, **{insert_id: f"No delivery status after {self.flush_timeout}s" for insert_id in self.pending}}
+                    self.pending.clear()
+                    self.failed.clear()
+                    break
+            time.sleep(self.poll_interval)
+
+        if failed:
+            raise DeliveryError(failed)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from abc import abstractmethod
+import threading
+from typing import Dict, List, TYPE_CHECKING
+
+from destinations.destination import Destination
+from models.event import Event
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+
+class ColumnarDestination(Destination):
+    """
+    Buffers events column by column and writes them as Arrow record batches of up to batch_size rows, so that
+    events are written in bulk rather than one call per event.
+    """
+
+    def __init__(self, batch_size: int = 100000):
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.columns = self._empty_columns()
+
+    @staticmethod
+    def schema() -> pa.Schema:
+        import pyarrow as pa
+
+        return pa.schema([
+            ("insert_id", pa.string()),
+            ("event_type", pa.string()),
+            ("user_id", pa.string()),
+            ("conversation_id", pa.string()),
+            ("message_id", pa.string()),
+            ("role", pa.string()),
+            ("content", pa.string()),
+            ("timestamp", pa.timestamp("us")),
+            ("date", pa.string()),
+            ("explanation", pa.string()),
+            ("llm_judge_score", pa.int32()),
+            ("event_model", pa.string()),
+            ("event_properties", pa.map_(pa.string(), pa.string()))
+        ])
+
+    def _empty_columns(self) -> Dict[str, List]:
+        return {name: [] for name in self.schema().names}
+
+    def send_event(self, event: Event, llm_judge_score: int):
+        message = event.message
+        with self.lock:
+            columns = self.columns
+            columns["insert_id"].append(event.insert_id)
+            columns["event_type"].append(event.event_type.name)
+            columns["user_id"].append(str(event.user_id))
+            columns["conversation_id"].append(str(event.conversation_id))
+            columns["message_id"].append(str(message.message_id))
+            columns["role"].append(message.role.name.lower())
+            columns["content"].append(message.content)
+            columns["timestamp"].append(message.timestamp)
+            columns["date"].append(message.timestamp.date().isoformat())
+            columns["explanation"].append(event.explanation)
+            columns["llm_judge_score"].append(llm_judge_score)
+            columns["event_model"].append(event.model_id)
+            columns["event_properties"].append([(str(name), str(value)) for name, value in event.property_values.items()])
+
+            # Writing under the lock keeps batches in order and means flush() waits for any write in progress
+            if len(columns["insert_id"]) >= self.batch_size:
+                self._write_batch(self._take_batch())
+
+    def flush(self):
+        with self.lock:
+            batch = self._take_batch()
+            if batch.num_rows:
+                self._write_batch(batch)
+
+    def _take_batch(self) -> pa.RecordBatch:
+        import pyarrow as pa
+
+        columns, self.columns = self.columns, self._empty_columns()
+        return pa.RecordBatch.from_pydict(columns, schema=self.schema())
+
+    @abstractmethod
+    def _write_batch(self, batch: pa.RecordBatch):
+        pass
@@ -1,9 +1,26 @@
 from abc import ABC, abstractmethod
+from typing import Dict
 
 from models.event import Event
 
+
+class DeliveryError(Exception):
+    """Raised by Destination.flush with the error of each event that couldn't be delivered, by insert_id."""
+
+    def __init__(self, failed: Dict[str, str]):
+        super().__init__(f"{len(failed)} events weren't delivered, e.g. {next(iter(failed.values()), None)}")
+        self.failed = failed
+
+
 class Destination(ABC):
 
     @abstractmethod
     def send_event(self, event: Event, llm_judge_score: int):
         pass
+
+    def flush(self):
+        """
+        Block until all buffered events have been delivered, raising DeliveryError for those that couldn't be.
+        Destinations that send synchronously need not override this.
+        """
+        pass
@@ -0,0 +1,27 @@
+import duckdb
+import pyarrow as pa
+
+from destinations.columnar import ColumnarDestination
+
+
+class DuckDBDestination(ColumnarDestination):
+    """Appends events to a table in a local DuckDB database, creating the table if it doesn't exist yet."""
+
+    def __init__(self, db_path: str, table: str = "events", batch_size: int = 100000):
+        super().__init__(batch_size=batch_size)
+        self.db_path = db_path
+        self.table = table
+        self.connection = duckdb.connect(db_path)
+        self._create_table()
+
+    def _create_table(self):
+        empty_batch = pa.Table.from_batches([], schema=self.schema())
+        self.connection.register("empty_batch", empty_batch)
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" AS SELECT * FROM empty_batch')
+        self.connection.unregister("empty_batch")
+
+    def _write_batch(self, batch: pa.RecordBatch):
+        # DuckDB scans the Arrow batch directly, without converting it row by row
+        self.connection.register("batch", pa.Table.from_batches([batch]))
+        self.connection.execute(f'INSERT INTO "{self.table}" SELECT * FROM batch')
+        self.connection.unregister("batch")
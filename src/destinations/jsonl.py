@@ -0,0 +1,48 @@
+import json
+import os
+import threading
+
+from destinations.destination import Destination
+from models.event import Event
+
+
+class JsonlDestination(Destination):
+    """Appends each event to a local JSON Lines file. Useful for offline runs and as a stand-in for a real analytics platform."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.file = open(file_path, 'a')
+
+    def send_event(self, event: Event, llm_judge_score: int):
+
+        event_properties = {
+            "conversation_id": event.conversation_id,
+            "message_id": event.message.message_id,
+            "content": event.message.content,
+            "role": event.message.role.name.lower(),
+            "explanation": event.explanation,
+            "llm_judge_score": llm_judge_score
+        }
+        # Events created without a model don't get an empty event_model property
+        if event.model_id:
+            event_properties["event_model"] = event.model_id
+
+        for property_name, property_value in event.property_values.items():
+            event_properties[property_name] = property_value
+
+        record = {
+            "insert_id": event.insert_id,
+            "event_type": event.event_type.name,
+            "user_id": str(event.user_id),
+            "timestamp": event.message.timestamp.isoformat(),
+            "event_properties": event_properties
+        }
+
+        with self.lock:
+            self.file.write(json.dumps(record, default=str) + "\n")
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
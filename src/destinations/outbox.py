@@ -0,0 +1,240 @@
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from destinations.columnar import ColumnarDestination
+from destinations.destination import DeliveryError, Destination
+from models.event import Event
+import tracing
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class OutboxDestination(Destination):
+    """
+    Writes events to a durable SQLite outbox, from which a background sender delivers them to the wrapped
+    destination in batches.
+
+    Events that fail, when sent or as reported by the destination's flush (see DeliveryError), are retried with
+    exponential backoff, and after max_attempts they're left in the outbox as dead, to be redelivered with
+    replay_outbox.py without rerunning any LLM queries. Events are keyed by their insert_id, so an event that was
+    already delivered isn't delivered again when the pipeline is rerun, and the destination drops any duplicates
+    from a retried batch.
+
+    Events only count as delivered once the destination has been flushed. That happens after every batch, except
+    for columnar destinations, which write a row group or file per flush. Those are flushed when their buffer is
+    full, when flush() is called, or before the claim on the unflushed events runs out.
+    """
+
+    poll_interval = 1
+
+    def __init__(
+        self,
+        destination: Destination,
+        db_path: str,
+        batch_size: int = 100,
+        max_attempts: int = 8,
+        base_delay: float = 1.0,
+        max_delay: float = 300.0,
+        claim_timeout: int = 300
+    ):
+        self.destination = destination
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # How long a batch stays claimed by a sender, so that another process can pick it up if this one dies
+        self.claim_timeout = claim_timeout
+        self.flush_size = destination.batch_size if isinstance(destination, ColumnarDestination) else batch_size
+        # The events sent to the destination since it was last flushed, and when the first of them was claimed
+        self._unflushed: List[Tuple[str, int, str]] = []
+        self._unflushed_since = 0.0
+
+        self.lock = threading.Lock()
+        # Autocommit mode, so that transactions are controlled explicitly below
+        self.connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Survives the process crashing, which is what the outbox is for, without an fsync per event
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                insert_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS outbox_status_next_attempt_at ON outbox (status, next_attempt_at)")
+
+        self._wake = threading.Event()
+        self._flush_requested = threading.Event()
+        self._stop = threading.Event()
+        self._sender = threading.Thread(target=self._send_loop, name="OutboxSender", daemon=True)
+        self._sender.start()
+
+    def send_event(self, event: Event, llm_judge_score: int):
+        payload = json.dumps({"event": event.to_dict(), "llm_judge_score": llm_judge_score}, default=str)
+        with self.lock:
+            # A rerun replaces an undelivered event, but leaves one that was already delivered alone
+            self.connection.execute(
+                """
+                INSERT INTO outbox (insert_id, payload, next_attempt_at) VALUES (?, ?, ?)
+                ON CONFLICT (insert_id) DO UPDATE SET
+                    payload = excluded.payload, status = 'pending', attempts = 0, next_attempt_at = excluded.next_attempt_at, last_error = NULL
+                WHERE status != 'delivered'
+                """,
+                (event.insert_id, payload, time.time())
+            )
+        self._wake.set()
+
+    def flush(self):
+        """Block until every pending event has been delivered, or has failed max_attempts times."""
+        while self.counts().get("pending", 0):
+            self._flush_requested.set()
+            self._wake.set()
+            time.sleep(0.1)
+
+        dead = self.counts().get("dead", 0)
+        if dead:
+            logger.warning(f"{dead} events in the outbox {self.db_path} could not be delivered, redeliver them with replay_outbox.py")
+
+    def close(self):
+        """Stop the sender and close the outbox. Events that are still pending are delivered by the next run or replay_outbox.py."""
+        self._stop.set()
+        self._wake.set()
+        self._sender.join()
+        with self.lock:
+            self.connection.close()
+
+    def counts(self) -> Dict[str, int]:
+        """The number of events in the outbox by status: pending, delivered or dead."""
+        with self.lock:
+            return dict(self.connection.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+    def requeue(self, include_delivered: bool = False) -> int:
+        """Make dead (and optionally delivered) events pending again, with a fresh set of attempts. Returns how many were requeued."""
+        statuses = ("dead", "delivered") if include_delivered else ("dead",)
+        with self.lock:
+            cursor = self.connection.execute(
+                f"UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status IN ({', '.join('?' * len(statuses))})",
+                (time.time(), *statuses)
+            )
+        self._wake.set()
+        return cursor.rowcount
+
+    def _send_loop(self):
+        while not self._stop.is_set():
+            try:
+                delivered = self._send_batch()
+            except Exception as e:
+                logger.error(f"Error reading from the outbox {self.db_path}: {e}")
+                delivered = False
+
+            # Keep draining while there are due events, otherwise wait for new ones
+            if not delivered:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+        # Events sent since the last flush would otherwise be sent again once their claim runs out
+        if self._unflushed:
+            self._flush_destination()
+
+    def _send_batch(self) -> bool:
+        batch = self._claim_batch()
+
+        # The error of each event that couldn't be sent, by insert_id
+        failed = {}
+        if batch:
+            if not self._unflushed:
+                self._unflushed_since = time.time()
+            with tracing.span("outbox.send_batch", events=len(batch), destination=type(self.destination).__name__):
+                for insert_id, _, payload in batch:
+                    try:
+                        record = json.loads(payload)
+                        self.destination.send_event(Event.from_dict(record["event"]), record["llm_judge_score"])
+                    except Exception as e:
+                        failed[insert_id] = str(e)
+            if failed:
+                logger.error(f"Error sending {len(failed)}/{len(batch)} events of a batch from the outbox: {next(iter(failed.values()))}")
+                self._mark_failed([entry for entry in batch if entry[0] in failed], failed)
+            self._unflushed.extend(entry for entry in batch if entry[0] not in failed)
+
+        # flush() only waits for the due events, so it's honored once there are none left to send
+        flush_requested = not batch and self._flush_requested.is_set()
+        if self._unflushed and (
+            len(self._unflushed) >= self.flush_size or flush_requested or time.time() - self._unflushed_since >= self.claim_timeout / 2
+        ):
+            self._flush_destination()
+        if flush_requested:
+            self._flush_requested.clear()
+        return bool(batch) and not failed
+
+    def _flush_destination(self):
+        """Flush the destination, and mark the events sent since the last flush delivered unless it reports them as failed."""
+        sent, self._unflushed = self._unflushed, []
+        failed = {}
+        try:
+            with tracing.span("outbox.flush", events=len(sent), destination=type(self.destination).__name__):
+                self.destination.flush()
+        except DeliveryError as e:
+            sent_ids = {insert_id for insert_id, _, _ in sent}
+            failed = {insert_id: error for insert_id, error in e.failed.items() if insert_id in sent_ids}
+        except Exception as e:
+            # Without a status for each event, none of them can be counted as delivered
+            failed = {insert_id: str(e) for insert_id, _, _ in sent}
+
+        if failed:
+            logger.error(f"Error delivering {len(failed)}/{len(sent)} events from the outbox: {next(iter(failed.values()))}")
+            self._mark_failed([entry for entry in sent if entry[0] in failed], failed)
+
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE outbox SET status = 'delivered', last_error = NULL WHERE insert_id = ?",
+                [(insert_id,) for insert_id, _, _ in sent if insert_id not in failed]
+            )
+
+    def _claim_batch(self) -> List[Tuple[str, int, str]]:
+        now = time.time()
+        with self.lock:
+            # BEGIN IMMEDIATE takes the write lock up front so two processes sharing the outbox can't claim the same events
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                batch = self.connection.execute(
+                    "SELECT insert_id, attempts, payload FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                    (now, self.batch_size)
+                ).fetchall()
+                self.connection.executemany(
+                    "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ? WHERE insert_id = ?",
+                    [(now + self.claim_timeout, insert_id) for insert_id, _, _ in batch]
+                )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        return batch
+
+    def _mark_failed(self, batch: List[Tuple[str, int, str]], errors: Dict[str, str]):
+        now = time.time()
+        updates = []
+        for insert_id, attempts, _ in batch:
+            attempts += 1
+            # Exponential backoff with jitter, so that retries from several senders don't arrive together
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+            status = "dead" if attempts >= self.max_attempts else "pending"
+            updates.append((status, now + delay, errors[insert_id], insert_id))
+
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE outbox SET status = ?, next_attempt_at = ?, last_error = ? WHERE insert_id = ?",
+                updates
+            )
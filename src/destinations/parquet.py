@@ -0,0 +1,44 @@
+from typing import List, Optional
+import uuid
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from destinations.columnar import ColumnarDestination
+
+
+class ParquetDestination(ColumnarDestination):
+    """
+    Writes events to a Parquet dataset (a local directory or s3:// URI), Hive-partitioned by date and event
+    type by default, for loading into a warehouse in bulk.
+
+    Each buffered batch of row_group_size events is written as new files, so the dataset can be appended to
+    by several runs or worker processes at once.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        row_group_size: int = 100000,
+        compression: str = "zstd",
+        partition_by: Optional[List[str]] = None
+    ):
+        super().__init__(batch_size=row_group_size)
+        self.path = path
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.partition_by = ["date", "event_type"] if partition_by is None else partition_by
+
+    def _write_batch(self, batch: pa.RecordBatch):
+        ds.write_dataset(
+            batch,
+            self.path,
+            format="parquet",
+            partitioning=self.partition_by or None,
+            partitioning_flavor="hive" if self.partition_by else None,
+            # A unique name per write, so that appends never overwrite earlier files
+            basename_template=f"events-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            max_rows_per_group=self.row_group_size,
+            file_options=ds.ParquetFileFormat().make_write_options(compression=self.compression)
+        )
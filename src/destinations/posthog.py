@@ -1,13 +1,26 @@
-from posthog import Posthog
+from __future__ import annotations
 
-from destinations.destination import Destination
+import threading
+from typing import TYPE_CHECKING, List
+
+from destinations.destination import DeliveryError, Destination
 from models.event import Event
 
+if TYPE_CHECKING:
+    from posthog import Posthog
+
 
 class PosthogDestination(Destination):
+    """
+    Sends events with the PostHog client's background consumers. Batches the consumers give up on are reported to
+    record_error, which the client must be built with as its on_error callback (see clients.posthog_client).
+    """
 
     def __init__(self, posthog_client: Posthog):
         self.posthog_client = posthog_client
+        self.lock = threading.Lock()
+        # The events that couldn't be delivered since the last flush, by insert_id
+        self.failed = {}
 
     def send_event(self, event: Event, llm_judge_score: int):
 
@@ -19,13 +32,36 @@ class PosthogDestination(Destination):
             "explanation": event.explanation,
             "llm_judge_score": llm_judge_score
         }
+        # Events created without a model don't get an empty event_model property
+        if event.model_id:
+            event_properties["event_model"] = event.model_id
 
         for property_name, property_value in event.property_values.items():
             event_properties[property_name] = property_value
 
-        self.posthog_client.capture(
+        enqueued = self.posthog_client.capture(
             distinct_id=str(event.user_id),
             event=event.event_type.name,
             properties=event_properties,
-            timestamp=event.message.timestamp
-        )
\ No newline at end of file
+            timestamp=event.message.timestamp,
+            uuid=event.insert_id
+        )
+        if enqueued is None:
+            # e.g. the client's queue is full
+            with self.lock:
+                self.failed[event.insert_id] = "PostHog didn't enqueue the event"
+
+    def record_error(self, error: Exception, batch: List[dict]):
+        with self.lock:
+            for message in batch:
+                self.failed[message["uuid"]] = str(error)
+
+    def flush(self):
+        # Wait until every batch has been sent, or reported to record_error
+        self.posthog_client.flush(timeout_seconds=None)
+        with self.lock:
+            failed = dict(self.failed)
+            self.failed.clear()
+
+        if failed:
+            raise DeliveryError(failed)
@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import functools
+import threading
+from typing import Callable, Dict, Iterator, Optional
+
+
+class AsyncioExecutor(Executor):
+    """
+    Runs calls on an asyncio event loop, at most max_workers at a time, so that a service with its own event
+    loop can run the pipeline's requests on it. The calls are blocking SDK requests, so the loop runs them in
+    its default executor.
+
+    Without a loop, the executor runs its own in a background thread until it's shut down.
+    """
+
+    def __init__(self, max_workers: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self._thread = None
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=max_workers))
+            self._thread = threading.Thread(target=loop.run_forever, name="AsyncioExecutor", daemon=True)
+            self._thread.start()
+        self.loop = loop
+        self._semaphore = asyncio.Semaphore(max_workers)
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return asyncio.run_coroutine_threadsafe(self._run(functools.partial(fn, *args, **kwargs)), self.loop)
+
+    async def _run(self, call: Callable):
+        async with self._semaphore:
+            return await self.loop.run_in_executor(None, call)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        # A loop passed in belongs to the caller, so only stop the one this executor started
+        if self._thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if wait:
+            self._thread.join()
+            self.loop.close()
+
+
+# Executor factories by name, each taking the maximum number of concurrent calls
+EXECUTORS: Dict[str, Callable[[int], Executor]] = {
+    "threads": ThreadPoolExecutor,
+    "asyncio": AsyncioExecutor
+}
+
+
+@contextmanager
+def stage_executor(executor: Optional[Executor], max_workers: int) -> Iterator[Executor]:
+    """Use the given executor, which is left running for its owner to reuse, or a thread pool just for this stage."""
+    if executor is not None:
+        yield executor
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield executor
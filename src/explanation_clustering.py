@@ -0,0 +1,260 @@
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from models.event import Event
+from text_clustering import HashingVectorizer, MiniBatchKMeans
+
+
+class NearestNeighborIndex:
+    """
+    A cosine similarity index over at most capacity vectors, searched by brute force with NumPy.
+
+    Once full, it keeps a uniform random sample of every vector added (reservoir sampling), so its memory
+    stays fixed however many vectors are added.
+    """
+
+    def __init__(self, dimensions: int, capacity: int = 100000, seed: int = 42):
+        self.capacity = capacity
+        self.vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=object)
+        self.num_added = 0
+        self.random = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, vectors: np.ndarray, ids: List[str]):
+        ids = np.array(ids, dtype=object)
+        taken = min(self.capacity - len(self), len(ids))
+        if taken > 0:
+            self.vectors = np.concatenate([self.vectors, vectors[:taken]])
+            self.ids = np.concatenate([self.ids, ids[:taken]])
+            self.num_added += taken
+            vectors, ids = vectors[taken:], ids[taken:]
+
+        if len(ids):
+            # The i-th vector seen replaces a random slot with probability capacity / i
+            seen = self.num_added + np.arange(1, len(ids) + 1)
+            slots = (self.random.random(len(ids)) * seen).astype(np.int64)
+            replace = slots < self.capacity
+            self.vectors[slots[replace]] = vectors[replace]
+            self.ids[slots[replace]] = ids[replace]
+            self.num_added += len(ids)
+
+    def search(self, vectors: np.ndarray, k: int = 10) -> List[List[Tuple[str, float]]]:
+        """The ids and cosine similarities of the k most similar vectors to each of the given (normalized) vectors."""
+        if not len(self):
+            return [[] for _ in vectors]
+
+        similarities = vectors @ self.vectors.T
+        k = min(k, len(self))
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            candidates = candidates[np.argsort(-similarities[row, candidates])]
+            results.append([(self.ids[i], float(similarities[row, i])) for i in candidates])
+        return results
+
+
+class _EventTypeClusters:
+
+    def __init__(self, n_clusters: int, n_features: int, index_dimensions: int, index_capacity: int, n_exemplars: int, seed: int):
+        self.vectorizer = HashingVectorizer(n_features=n_features)
+        self.kmeans = MiniBatchKMeans(n_clusters, seed=seed)
+        self.index = NearestNeighborIndex(index_dimensions, index_capacity, seed=seed)
+        # Until there are enough explanations to seed every cluster, keep them to seed the clusters again
+        self.seed_vectors = np.zeros((0, n_features), dtype=np.float32)
+        self.seed_explanations: List[str] = []
+        self.n_exemplars = n_exemplars
+        # For each cluster, the (squared distance, explanation) of the explanations closest to its center when they were added
+        self.exemplars: Dict[int, List[Tuple[float, str]]] = {}
+
+    @property
+    def seeded(self) -> bool:
+        """Whether every cluster has a center. Until then, the centers are replaced with every batch."""
+        return self.kmeans.centers is not None and len(self.kmeans.centers) == self.kmeans.n_clusters
+
+    def partial_fit(self, vectors: np.ndarray, explanations: List[str]):
+        kmeans = self.kmeans
+        if not self.seeded:
+            vectors = np.concatenate([self.seed_vectors, vectors])
+            explanations = self.seed_explanations + explanations
+            kmeans.centers = None
+            self.exemplars = {}
+            kmeans.partial_fit(vectors)
+            self.seed_vectors = vectors[:0] if self.seeded else vectors
+            self.seed_explanations = [] if self.seeded else explanations
+        else:
+            kmeans.partial_fit(vectors)
+
+        distances = kmeans.transform(vectors)
+        labels = distances.argmin(axis=1)
+        for label in np.unique(labels):
+            members = np.flatnonzero(labels == label)
+            closest = members[np.argsort(distances[members, label])[:self.n_exemplars]]
+            candidates = self.exemplars.get(int(label), []) + [(float(distances[i, label]), explanations[i]) for i in closest]
+            self.exemplars[int(label)] = sorted(candidates)[:self.n_exemplars]
+
+
+class ExplanationClusterer:
+    """
+    Clusters event explanations separately for each event type, to surface the distinct behavioral patterns
+    behind each one.
+
+    Explanations are turned into hashed n-gram TF-IDF vectors and clustered with mini-batch k-means, both
+    updated incrementally as new events arrive. A random projection of each vector is also added to a
+    fixed-size nearest neighbor index to find the events most similar to a given one. Memory is bounded by
+    the number of event types, not the number of explanations.
+    """
+
+    def __init__(
+        self,
+        n_clusters: int = 8,
+        n_features: int = 2 ** 12,
+        index_dimensions: int = 256,
+        index_capacity: int = 100000,
+        n_exemplars: int = 3,
+        batch_size: int = 4096,
+        seed: int = 42
+    ):
+        self.n_clusters = n_clusters
+        self.n_features = n_features
+        self.index_dimensions = index_dimensions
+        self.index_capacity = index_capacity
+        self.n_exemplars = n_exemplars
+        self.batch_size = batch_size
+        self.seed = seed
+        # A Gaussian random projection approximately preserves the cosine similarities between vectors
+        self.projection = np.random.default_rng(seed).standard_normal((n_features, index_dimensions)).astype(np.float32)
+        self.clusters: Dict[str, _EventTypeClusters] = {}
+
+    def _clusters(self, event_type: str) -> _EventTypeClusters:
+        if event_type not in self.clusters:
+            self.clusters[event_type] = _EventTypeClusters(
+                self.n_clusters, self.n_features, self.index_dimensions, self.index_capacity, self.n_exemplars, self.seed
+            )
+        return self.clusters[event_type]
+
+    def _project(self, vectors: np.ndarray) -> np.ndarray:
+        projected = vectors @ self.projection
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return projected / norms
+
+    def partial_fit_explanations(self, event_type: str, ids: List[str], explanations: List[str]) -> "ExplanationClusterer":
+        """Update the clusters and index of an event type with new explanations, batch_size at a time."""
+        clusters = self._clusters(event_type)
+        for i in range(0, len(explanations), self.batch_size):
+            batch = explanations[i:i + self.batch_size]
+            vectors = clusters.vectorizer.fit_transform(batch)
+            clusters.partial_fit(vectors, batch)
+            clusters.index.add(self._project(vectors), ids[i:i + self.batch_size])
+        return self
+
+    def partial_fit(self, events: Iterable[Event]) -> "ExplanationClusterer":
+        for event_type, (ids, explanations) in _group_explanations(events).items():
+            self.partial_fit_explanations(event_type, ids, explanations)
+        return self
+
+    def predict_explanations(self, event_type: str, explanations: List[str]) -> np.ndarray:
+        """
+        The cluster of each explanation of the event type, or -1 until the event type has enough explanations
+        to seed every cluster, since the clusters are re-seeded, and renumbered, until then.
+        """
+        clusters = self.clusters.get(event_type)
+        if clusters is None or not clusters.seeded:
+            return np.full(len(explanations), -1)
+
+        return np.concatenate([
+            clusters.kmeans.predict(clusters.vectorizer.transform(explanations[i:i + self.batch_size]))
+            for i in range(0, len(explanations), self.batch_size)
+        ]) if explanations else np.zeros(0, dtype=np.int64)
+
+    def label(self, events: List[Event], property_name: str = "explanation_cluster") -> List[Event]:
+        """Set each event's cluster as a property value, so it's uploaded along with the event's other properties."""
+        events_by_type: Dict[str, List[Event]] = {}
+        for event in events:
+            if event.explanation:
+                events_by_type.setdefault(event.event_type.name, []).append(event)
+
+        for event_type, events_for_type in events_by_type.items():
+            labels = self.predict_explanations(event_type, [event.explanation for event in events_for_type])
+            for event, label in zip(events_for_type, labels):
+                if label >= 0:
+                    event.property_values[property_name] = str(label)
+        return events
+
+    def similar(self, event_type: str, explanation: str, k: int = 10) -> List[Tuple[str, float]]:
+        """The ids (insert_ids for events) and similarities of the indexed explanations of the event type most similar to the given one."""
+        clusters = self.clusters.get(event_type)
+        if clusters is None:
+            return []
+        return clusters.index.search(self._project(clusters.vectorizer.transform([explanation])), k)[0]
+
+    def summary(self) -> Dict[str, List[dict]]:
+        """For each event type, the number of explanations in each cluster and those closest to its center."""
+        return {
+            event_type: [
+                {
+                    "cluster": label,
+                    "explanations": int(clusters.kmeans.counts[label]),
+                    "exemplars": [explanation for _, explanation in clusters.exemplars.get(label, [])]
+                }
+                for label in np.argsort(-clusters.kmeans.counts).tolist()
+            ]
+            for event_type, clusters in self.clusters.items() if clusters.kmeans.centers is not None
+        }
+
+    def save(self, file_path: str):
+        arrays = {
+            "config": np.array([self.n_clusters, self.n_features, self.index_dimensions, self.index_capacity, self.n_exemplars, self.batch_size, self.seed]),
+            "event_types": np.array(list(self.clusters), dtype=str)
+        }
+        for i, clusters in enumerate(self.clusters.values()):
+            arrays[f"{i}_document_frequencies"] = clusters.vectorizer.document_frequencies
+            arrays[f"{i}_num_documents"] = np.array(clusters.vectorizer.num_documents)
+            arrays[f"{i}_centers"] = clusters.kmeans.centers if clusters.kmeans.centers is not None else np.zeros((0, self.n_features), dtype=np.float32)
+            arrays[f"{i}_counts"] = clusters.kmeans.counts if clusters.kmeans.counts is not None else np.zeros(0, dtype=np.int64)
+            arrays[f"{i}_seed_vectors"] = clusters.seed_vectors
+            arrays[f"{i}_seed_explanations"] = np.array(clusters.seed_explanations, dtype=str)
+            arrays[f"{i}_index_vectors"] = clusters.index.vectors
+            arrays[f"{i}_index_ids"] = clusters.index.ids.astype(str)
+            arrays[f"{i}_index_num_added"] = np.array(clusters.index.num_added)
+            exemplars = [(label, distance, explanation) for label, items in clusters.exemplars.items() for distance, explanation in items]
+            arrays[f"{i}_exemplar_labels"] = np.array([label for label, _, _ in exemplars], dtype=np.int64)
+            arrays[f"{i}_exemplar_distances"] = np.array([distance for _, distance, _ in exemplars], dtype=np.float64)
+            arrays[f"{i}_exemplar_explanations"] = np.array([explanation for _, _, explanation in exemplars], dtype=str)
+        np.savez_compressed(file_path, **arrays)
+
+    @classmethod
+    def load(cls, file_path: str) -> "ExplanationClusterer":
+        data = np.load(file_path)
+        n_clusters, n_features, index_dimensions, index_capacity, n_exemplars, batch_size, seed = data["config"].tolist()
+        clusterer = cls(n_clusters, n_features, index_dimensions, index_capacity, n_exemplars, batch_size, seed)
+        for i, event_type in enumerate(data["event_types"].tolist()):
+            clusters = clusterer._clusters(event_type)
+            clusters.vectorizer.document_frequencies = data[f"{i}_document_frequencies"]
+            clusters.vectorizer.num_documents = int(data[f"{i}_num_documents"])
+            if len(data[f"{i}_centers"]):
+                clusters.kmeans.centers = data[f"{i}_centers"]
+                clusters.kmeans.counts = data[f"{i}_counts"]
+            clusters.seed_vectors = data[f"{i}_seed_vectors"]
+            clusters.seed_explanations = data[f"{i}_seed_explanations"].tolist()
+            clusters.index.vectors = data[f"{i}_index_vectors"]
+            clusters.index.ids = data[f"{i}_index_ids"].astype(object)
+            clusters.index.num_added = int(data[f"{i}_index_num_added"])
+            for label, distance, explanation in zip(data[f"{i}_exemplar_labels"].tolist(), data[f"{i}_exemplar_distances"].tolist(), data[f"{i}_exemplar_explanations"].tolist()):
+                clusters.exemplars.setdefault(label, []).append((distance, explanation))
+        return clusterer
+
+
+def _group_explanations(events: Iterable[Event]) -> Dict[str, Tuple[List[str], List[str]]]:
+    """The insert ids and explanations of the events with an explanation, by event type name."""
+    grouped: Dict[str, Tuple[List[str], List[str]]] = {}
+    for event in events:
+        if event.explanation:
+            ids, explanations = grouped.setdefault(event.event_type.name, ([], []))
+            ids.append(event.insert_id)
+            explanations.append(event.explanation)
+    return grouped
@@ -1,9 +1,9 @@
 import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 import logging
-
-import boto3
-from anthropic import Anthropic
-from openai import OpenAI
+from typing import List, Set, Tuple
 
 # Configure root logger to WARNING to silence third-party libraries
 logging.basicConfig(
@@ -13,12 +13,17 @@ logging.basicConfig(
 
 from llm_queries.assistant_namer import AssistantNamer
 from llm_queries.event_type_schema_generator import EventTypeSchemaGenerator
+from llm_queries.event_type_schema_merger import EventTypeSchemaMerger
 from llm_queries.event_property_schema_generator import EventPropertySchemaGenerator
 from llm_queries.llm_judge_criteria_generator import LLMJudgeCriteriaGenerator
-from llm_queries.llm_query import OpenAIModelProvider, BedrockModelProvider, AnthropicModelProvider
+from llm_queries.llm_query import ModelProvider
+from models.assistant import Assistant
+from models.conversation import Conversation, ROLE
 from models.data_schema import DataSchema
-from sources.local import LocalSource
-from sources.s3 import S3Source
+from models.event import EventType
+from registry import model_providers
+import tracing
+from upload_events import add_client_arguments, add_plan_arguments, add_replay_arguments, build_model_provider, build_source
 
 # Set loggers within this application to INFO
 logger = logging.getLogger(__name__)
@@ -27,49 +32,49 @@ logger.setLevel(logging.INFO)
 logging.getLogger('openai').setLevel(logging.WARNING)
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--data-path", type=str, required=True)
-    parser.add_argument("--data-schema-output-path", type=str, required=True, help="The location to save the generated data schema")
-    parser.add_argument("--model-provider", type=str, choices=["openai", "bedrock", "anthropic"], default="openai")
-    parser.add_argument("--assistant-namer-model", type=str, default="gpt-4.1")
-    parser.add_argument("--llm-judge-criteria-model", type=str, default="o4-mini")
-    parser.add_argument("--event-schema-model", type=str, default="o4-mini")
-    args = parser.parse_args() 
-
-
-    if args.model_provider == "openai":
-        openai_client = OpenAI()
-        model_provider = OpenAIModelProvider(openai_client)
-    elif args.model_provider == "anthropic":
-        anthropic_client = Anthropic()
-        model_provider = AnthropicModelProvider(anthropic_client)
-    elif args.model_provider == "bedrock":
-        bedrock_client = boto3.client("bedrock-runtime")
-        model_provider = BedrockModelProvider(bedrock_client)
-
-    # Automatically determine source type based on path prefix
-    if args.data_path.startswith("s3://"):
-        logger.info("Detected S3 path, loading data from S3")
-        s3_client = boto3.client("s3")
-        source = S3Source(s3_client, args.data_path)
-    else:
-        logger.info("Loading data from local file")
-        source = LocalSource(args.data_path)
+def generate_event_properties(
+    model_provider: ModelProvider,
+    model_id: str,
+    assistant: Assistant,
+    event_types_with_conversations: List[Tuple[EventType, List[Conversation]]],
+    max_workers: int
+) -> List[EventType]:
+    """Generate the properties for each event type concurrently, each from its own conversations."""
+    updated_event_types = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                tracing.wrap(EventPropertySchemaGenerator(model_provider, model_id, assistant, event_type, convos).query),
+                max_retries=2,
+                timeout=120
+            ): event_type for event_type, convos in event_types_with_conversations
+        }
 
-    conversations = source.get_conversations()
+        for future in as_completed(futures):
+            event_type = futures[future]
+            try:
+                updated_event_types.append(future.result())
+                logger.info(f"Generated event properties for event type: {event_type.name}")
+            except Exception as e:
+                # Like a failed event type request, this fails the run rather than saving a schema without the event type's properties
+                logger.error(f"Error generating event properties for event type {event_type.name}: {e}")
+                for other in futures:
+                    other.cancel()
+                raise
 
-    logger.info("Generating assistant definition")
-    assistant_namer = AssistantNamer(model_provider, args.assistant_namer_model, conversations)
-    assistant = assistant_namer.query()
+    return updated_event_types
 
-    logger.info("Generating LLM judge criteria")
-    llm_judge_criteria_generator = LLMJudgeCriteriaGenerator(model_provider, args.llm_judge_criteria_model, assistant)
-    llm_judge_criteria = llm_judge_criteria_generator.query(max_retries=2, timeout=120)
 
-    logger.info("Generating event schema")
-    batch_size = 40
-    num_batches = 1
+def generate_event_types_sequential(
+    model_provider: ModelProvider,
+    model_id: str,
+    assistant: Assistant,
+    conversations: List[Conversation],
+    batch_size: int,
+    num_batches: int,
+    max_workers: int
+) -> Set[EventType]:
+    """Refine the event types batch by batch, showing each batch the event types found so far."""
     event_types = set()
 
     for i in range(0, min(len(conversations), batch_size * num_batches), batch_size):
@@ -79,20 +84,213 @@ if __name__ == "__main__":
 
         # First identify common event types across conversations in this batch
         logger.info("Generating event types")
-        event_type_schema_generator = EventTypeSchemaGenerator(model_provider, args.event_schema_model, assistant, convos, list(event_types))
+        event_type_schema_generator = EventTypeSchemaGenerator(model_provider, model_id, assistant, convos, list(event_types))
         new_event_types = event_type_schema_generator.query(max_retries=2, timeout=120)
         logger.info(f"Generated event types in batch {i // batch_size + 1}: {[e.name for e in new_event_types]}")
 
         # Now generate event properties for each event type identified in this batch
-        for event_type in new_event_types:
-            logger.info(f"Generating event properties for event type: {event_type.name}")
-            event_property_schema_generator = EventPropertySchemaGenerator(model_provider, args.event_schema_model, assistant, event_type, convos)
-            event_type = event_property_schema_generator.query(max_retries=2, timeout=120)
+        updated_event_types = generate_event_properties(
+            model_provider, model_id, assistant, [(event_type, convos) for event_type in new_event_types], max_workers
+        )
 
-            # Remove the event type from the set and add the updated event type back to the set, so that it's saved with the updated properties
+        # Remove each event type from the set and add the updated event type back to the set, so that it's saved with the updated properties
+        for event_type in updated_event_types:
             event_types.discard(event_type)
             event_types.add(event_type)
 
+    return event_types
+
+
+def generate_event_types_map_reduce(
+    model_provider: ModelProvider,
+    model_id: str,
+    assistant: Assistant,
+    conversations: List[Conversation],
+    batch_size: int,
+    num_batches: int,
+    merge_fan_in: int,
+    max_workers: int
+) -> Set[EventType]:
+    """
+    Generate candidate event types for every batch concurrently (map), consolidate semantically
+    equivalent event types with a tree of merge requests (reduce), then generate the properties
+    of every consolidated event type concurrently from the batches it was found in.
+    """
+    batches = [conversations[i:i+batch_size] for i in range(0, min(len(conversations), batch_size * num_batches), batch_size)]
+
+    # Each candidate schema is a list of event types, each with the indices of the batches it was found in
+    candidate_schemas: List[List[Tuple[EventType, Set[int]]]] = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                tracing.wrap(EventTypeSchemaGenerator(model_provider, model_id, assistant, batch, []).query),
+                max_retries=2,
+                timeout=120
+            ): batch_index for batch_index, batch in enumerate(batches)
+        }
+
+        for future in as_completed(futures):
+            batch_index = futures[future]
+            try:
+                new_event_types = future.result()
+                logger.info(f"Generated event types in batch {batch_index + 1} of {len(batches)}: {[e.name for e in new_event_types]}")
+                candidate_schemas.append([(event_type, {batch_index}) for event_type in new_event_types])
+            except Exception as e:
+                logger.error(f"Error generating event types for batch {batch_index + 1}: {e}")
+
+    if not candidate_schemas:
+        raise Exception("Unable to generate event types for any batch.")
+
+    while len(candidate_schemas) > 1:
+        logger.info(f"Merging {len(candidate_schemas)} candidate event schemas")
+        groups = [candidate_schemas[i:i+merge_fan_in] for i in range(0, len(candidate_schemas), merge_fan_in)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(tracing.wrap(_merge_candidate_schemas), model_provider, model_id, assistant, group)
+                for group in groups
+            ]
+            candidate_schemas = [future.result() for future in futures]
+
+    event_types_with_conversations = []
+    for event_type, batch_indices in candidate_schemas[0]:
+        # Use the conversations from the batches the event type was found in, up to one batch worth
+        convos = [conversation for batch_index in sorted(batch_indices) for conversation in batches[batch_index]][:batch_size]
+        event_types_with_conversations.append((event_type, convos))
+
+    return set(generate_event_properties(model_provider, model_id, assistant, event_types_with_conversations, max_workers))
+
+
+def _merge_candidate_schemas(
+    model_provider: ModelProvider,
+    model_id: str,
+    assistant: Assistant,
+    candidate_schemas: List[List[Tuple[EventType, Set[int]]]]
+) -> List[Tuple[EventType, Set[int]]]:
+    if len(candidate_schemas) == 1:
+        return candidate_schemas[0]
+
+    batch_indices_by_name = defaultdict(set)
+    for candidate_schema in candidate_schemas:
+        for event_type, batch_indices in candidate_schema:
+            batch_indices_by_name[event_type.name].update(batch_indices)
+
+    event_type_schema_merger = EventTypeSchemaMerger(
+        model_provider, model_id, assistant,
+        [[event_type for event_type, _ in candidate_schema] for candidate_schema in candidate_schemas]
+    )
+    merged = event_type_schema_merger.query(max_retries=2, timeout=120)
+
+    return [
+        (event_type, set().union(*(batch_indices_by_name[name] for name in merged_from)))
+        for event_type, merged_from in merged
+    ]
+
+
+def load_conversations(args) -> List[Conversation]:
+    conversations = build_source(args).get_conversations()
+
+    if args.sample_token_budget:
+        from sampling import select_representative_conversations
+
+        logger.info(f"Selecting representative conversations from {len(conversations)} conversations")
+        conversations = select_representative_conversations(conversations, args.sample_token_budget)
+        logger.info(f"Selected {len(conversations)} representative conversations")
+
+    return conversations
+
+
+def plan(args) -> dict:
+    """
+    Plan the schema generation without sending any requests. The assistant and event types it would generate are
+    unknown, so prompts that include them are built with placeholders: --plan-event-types event types per batch,
+    with definitions of typical length.
+    """
+    from planning import Plan, TokenCounter, load_model_profiles, plan_stage
+
+    conversations = load_conversations(args)
+    counter, profiles = TokenCounter(), load_model_profiles(args.plan_models)
+    batches = [conversations[i:i+args.batch_size] for i in range(0, min(len(conversations), args.batch_size * args.num_batches), args.batch_size)]
+    assistant = Assistant("Assistant", "word " * 60)
+    event_types = [
+        EventType(f"Event Type {i}", "word " * 30, ROLE.user if i % 2 else ROLE.assistant)
+        for i in range(args.plan_event_types)
+    ]
+
+    result = Plan(conversations=len(conversations))
+    result.stages.append(plan_stage(
+        "assistant_namer", args.assistant_namer_model,
+        [AssistantNamer(None, args.assistant_namer_model, conversations)], 1, counter, profiles
+    ))
+    result.stages.append(plan_stage(
+        "llm_judge_criteria", args.llm_judge_criteria_model,
+        [LLMJudgeCriteriaGenerator(None, args.llm_judge_criteria_model, assistant)], 1, counter, profiles
+    ))
+
+    model_id = args.event_schema_model
+    if args.map_reduce:
+        result.stages.append(plan_stage(
+            "event_types", model_id,
+            [EventTypeSchemaGenerator(None, model_id, assistant, batch, []) for batch in batches],
+            args.max_concurrency, counter, profiles
+        ))
+        # Each round of the merge tree consolidates groups of merge_fan_in candidate schemas
+        merges, num_schemas = [], len(batches)
+        while num_schemas > 1:
+            groups = [min(args.merge_fan_in, num_schemas - i) for i in range(0, num_schemas, args.merge_fan_in)]
+            merges.extend(EventTypeSchemaMerger(None, model_id, assistant, [event_types] * size) for size in groups if size > 1)
+            num_schemas = len(groups)
+        if merges:
+            result.stages.append(plan_stage("merge_event_types", model_id, merges, args.max_concurrency, counter, profiles))
+        result.stages.append(plan_stage(
+            "event_properties", model_id,
+            [EventPropertySchemaGenerator(None, model_id, assistant, event_type, batches[0]) for event_type in event_types],
+            args.max_concurrency, counter, profiles
+        ))
+    else:
+        # Batches are refined one after another, each shown the event types found so far
+        result.stages.append(plan_stage(
+            "event_types", model_id,
+            [EventTypeSchemaGenerator(None, model_id, assistant, batch, event_types if i else []) for i, batch in enumerate(batches)],
+            1, counter, profiles
+        ))
+        result.stages.append(plan_stage(
+            "event_properties", model_id,
+            [EventPropertySchemaGenerator(None, model_id, assistant, event_type, batch) for batch in batches for event_type in event_types],
+            args.max_concurrency, counter, profiles
+        ))
+
+    result.notes.append(f"Prompts that include generated event types assume {args.plan_event_types} event types per batch")
+    print(result.format())
+    return result.to_dict()
+
+
+def run(args) -> DataSchema:
+    """Generate the data schema from the conversations and save it to the output path."""
+    if args.trace_path:
+        tracing.configure(args.trace_path, service_name="generate_schema")
+
+    model_provider = build_model_provider(args)
+    conversations = load_conversations(args)
+
+    logger.info("Generating assistant definition")
+    assistant_namer = AssistantNamer(model_provider, args.assistant_namer_model, conversations)
+    assistant = assistant_namer.query()
+
+    logger.info("Generating LLM judge criteria")
+    llm_judge_criteria_generator = LLMJudgeCriteriaGenerator(model_provider, args.llm_judge_criteria_model, assistant)
+    llm_judge_criteria = llm_judge_criteria_generator.query(max_retries=2, timeout=120)
+
+    logger.info("Generating event schema")
+    if args.map_reduce:
+        event_types = generate_event_types_map_reduce(
+            model_provider, args.event_schema_model, assistant, conversations,
+            args.batch_size, args.num_batches, args.merge_fan_in, args.max_concurrency
+        )
+    else:
+        event_types = generate_event_types_sequential(
+            model_provider, args.event_schema_model, assistant, conversations,
+            args.batch_size, args.num_batches, args.max_concurrency
+        )
 
     logger.info(f"Generated event types: {[e.name for e in event_types]}")
 
@@ -100,3 +298,39 @@ if __name__ == "__main__":
     sorted_event_types = sorted(event_types, key=lambda e: (e.role.name, e.name))
     data_schema = DataSchema(assistant, llm_judge_criteria, sorted_event_types)
     data_schema.to_yaml(args.data_schema_output_path)
+    tracing.flush()
+    return data_schema
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", type=str, required=True)
+    parser.add_argument("--data-format", type=str, choices=["auto", "parquet"], default="auto", help="Use 'parquet' to read a Parquet dataset directory. Paths ending in .parquet are detected automatically")
+    parser.add_argument("--start-date", type=datetime.fromisoformat, default=None, help="Only load Parquet messages at or after this ISO-8601 timestamp")
+    parser.add_argument("--end-date", type=datetime.fromisoformat, default=None, help="Only load Parquet messages before this ISO-8601 timestamp")
+    parser.add_argument("--conversation-ids", type=str, default=None, help="Comma-separated conversation ids to load from Parquet")
+    parser.add_argument("--data-schema-output-path", type=str, required=True, help="The location to save the generated data schema")
+    parser.add_argument("--model-provider", type=str, choices=model_providers.names(), default="openai", help="Use 'replay' to run offline against recorded or synthetic responses")
+    add_replay_arguments(parser)
+    parser.add_argument("--assistant-namer-model", type=str, default="gpt-4.1")
+    parser.add_argument("--llm-judge-criteria-model", type=str, default="o4-mini")
+    parser.add_argument("--event-schema-model", type=str, default="o4-mini")
+    parser.add_argument("--batch-size", type=int, default=40, help="The number of conversations shown to the model per event schema request")
+    parser.add_argument("--num-batches", type=int, default=1, help="The number of conversation batches to generate the event schema from")
+    parser.add_argument("--map-reduce", action="store_true", help="Generate event types for every batch concurrently and merge them, instead of refining them batch by batch")
+    parser.add_argument("--merge-fan-in", type=int, default=8, help="The number of candidate schemas consolidated per merge request in map-reduce mode")
+    parser.add_argument("--max-concurrency", type=int, default=5, help="The number of concurrent LLM requests")
+    add_client_arguments(parser)
+    parser.add_argument("--trace-path", type=str, default=None, help="Optional path to write OTLP/JSON trace spans of the run to")
+    parser.add_argument("--sample-token-budget", type=int, default=None, help="Cluster the conversations locally and generate the schema from a diverse, representative subset of about this many tokens")
+    add_plan_arguments(parser, sampled=False)
+    parser.add_argument("--plan-event-types", type=int, default=10, help="The event types --plan assumes each batch generates")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.plan:
+        plan(args)
+    else:
+        run(args)
@@ -0,0 +1,217 @@
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime
+import json
+import logging
+import time
+from typing import Optional
+
+# Configure root logger to WARNING to silence third-party libraries
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+from models.data_schema import DataSchema
+from pipeline import Pipeline, PipelineConfig
+from registry import model_providers
+import tracing
+from upload_events import add_client_arguments, add_destination_arguments, add_outbox_arguments, add_pipeline_arguments, add_replay_arguments, build_model_provider, build_source, build_destination, build_executor, build_hedging_policy
+from work_queues.sqlite import SQLiteWorkQueue
+from work_queues.work_queue import WorkItem, WorkQueue
+
+# Set loggers within this application to INFO
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class WorkerMetrics:
+    started_at: float = field(default_factory=time.time)
+    batches_processed: int = 0
+    batches_failed: int = 0
+    batches_dead_lettered: int = 0
+    conversations_processed: int = 0
+    events_sent: int = 0
+    events_failed: int = 0
+    # Requests of the LLM stages that failed, see PipelineResult.stage_failures
+    stage_failures: int = 0
+    # Time between a batch being enqueued and this worker acknowledging it
+    last_lag_seconds: float = 0.0
+    queue_depth: int = 0
+    hedging: dict = field(default_factory=dict)
+
+    @property
+    def conversations_per_second(self) -> float:
+        elapsed = time.time() - self.started_at
+        return self.conversations_processed / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "batches_processed": self.batches_processed,
+            "batches_failed": self.batches_failed,
+            "batches_dead_lettered": self.batches_dead_lettered,
+            "conversations_processed": self.conversations_processed,
+            "events_sent": self.events_sent,
+            "events_failed": self.events_failed,
+            "stage_failures": self.stage_failures,
+            "conversations_per_second": self.conversations_per_second,
+            "last_lag_seconds": self.last_lag_seconds,
+            "queue_depth": self.queue_depth,
+            "hedging": self.hedging
+        }
+
+
+def build_queue(queue_uri: str, dead_letter_queue_url: Optional[str] = None) -> WorkQueue:
+    if queue_uri.startswith("https://sqs."):
+        import boto3
+        from work_queues.sqs import SQSWorkQueue
+
+        return SQSWorkQueue(boto3.client("sqs"), queue_uri, dead_letter_queue_url)
+    return SQLiteWorkQueue(queue_uri)
+
+
+def enqueue(args):
+    queue = build_queue(args.queue)
+    conversations = build_source(args).get_conversations()
+    for i in range(0, len(conversations), args.batch_size):
+        queue.send(conversations[i:i + args.batch_size])
+    logger.info(f"Enqueued {len(conversations)} conversations in batches of {args.batch_size}")
+
+
+def retry(queue: WorkQueue, item: WorkItem, error: str, args, metrics: WorkerMetrics):
+    """Release a failed batch to be retried after an exponential backoff, or dead-letter it once it's used up its receives."""
+    metrics.batches_failed += 1
+    if item.receive_count >= args.max_receive_count:
+        logger.error(f"Dead-lettering batch {item.receipt} after {item.receive_count} attempts: {error}")
+        queue.dead_letter(item, error)
+        metrics.batches_dead_lettered += 1
+        return
+
+    # Backing off means a batch failing on e.g. an outage or rate limit isn't retried straight away by every worker
+    delay = min(args.retry_delay * 2 ** (item.receive_count - 1), args.visibility_timeout)
+    logger.error(f"Error processing batch {item.receipt}, retrying it in {delay} seconds: {error}")
+    queue.nack(item, delay)
+
+
+def work(args):
+    queue = build_queue(args.queue, args.dead_letter_queue)
+    model_provider = build_model_provider(args)
+    data_schema = DataSchema.from_yaml(args.data_schema_path)
+    destination = build_destination(args)
+    metrics = WorkerMetrics()
+    # The pipeline and its clients and executors stay warm between batches
+    pipeline = Pipeline(
+        model_provider,
+        data_schema,
+        destination,
+        config=PipelineConfig(
+            event_model=args.event_model,
+            event_property_model=args.event_property_model,
+            explanation_model=args.explanation_model,
+            llm_judge_model=args.llm_judge_model,
+            max_workers=args.max_concurrency,
+            stage_concurrency=args.stage_concurrency,
+            hedging=build_hedging_policy(args),
+            stream_responses=args.stream_responses
+        ),
+        executor=build_executor(args)
+    )
+    if args.trace_path:
+        tracing.configure(args.trace_path, service_name="ingest_worker")
+
+    while True:
+        items = queue.receive(max_items=1, visibility_timeout=args.visibility_timeout, wait_time=args.wait_time)
+        if not items:
+            if args.exit_when_empty:
+                break
+            continue
+
+        for item in items:
+            # A batch can be received too often without failing, when the workers processing it keep dying
+            if item.receive_count > args.max_receive_count:
+                logger.error(f"Dead-lettering batch {item.receipt}, which was received {item.receive_count} times")
+                queue.dead_letter(item, f"Received {item.receive_count} times")
+                metrics.batches_dead_lettered += 1
+                continue
+
+            try:
+                with tracing.span("ingest_worker.batch", receipt=item.receipt, conversations=len(item.conversations)):
+                    # Events that an earlier attempt delivered aren't sent again, and those delivered now are added
+                    result = pipeline.run(item.conversations, delivered=item.delivered)
+            except Exception as e:
+                retry(queue, item, str(e), args, metrics)
+                continue
+
+            stage_failures = sum(result.stage_failures.values())
+            metrics.events_sent += result.sent
+            metrics.events_failed += result.failed
+            metrics.stage_failures += stage_failures
+            # Only acknowledge once every stage succeeded and the destination has everything, otherwise retry the batch
+            if result.failed or stage_failures:
+                failed_stages = {stage: failures for stage, failures in result.stage_failures.items() if failures}
+                retry(queue, item, f"{result.failed} events failed to send, failed stage requests: {failed_stages}", args, metrics)
+                continue
+
+            queue.ack(item)
+            metrics.batches_processed += 1
+            metrics.conversations_processed += len(item.conversations)
+            metrics.last_lag_seconds = (datetime.now() - item.enqueued_at).total_seconds()
+
+        metrics.queue_depth = queue.approximate_depth()
+        if pipeline.config.hedging:
+            metrics.hedging = pipeline.config.hedging.stats()
+        tracing.flush()
+        logger.info(f"Worker metrics: {json.dumps(metrics.to_dict())}")
+        if args.metrics_path:
+            with open(args.metrics_path, 'w') as f:
+                json.dump(metrics.to_dict(), f, indent=4)
+
+    pipeline.close()
+    if pipeline.shared_executor:
+        pipeline.shared_executor.shutdown()
+    if pipeline.config.hedging:
+        pipeline.config.hedging.close()
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuously process conversation batches from a work queue")
+    parser.add_argument("--queue", type=str, required=True, help="A SQLite database path, or an SQS queue URL")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="Load conversations from a source and enqueue them in batches")
+    enqueue_parser.add_argument("--data-path", type=str, required=True)
+    enqueue_parser.add_argument("--data-format", type=str, choices=["auto", "parquet"], default="auto")
+    enqueue_parser.add_argument("--start-date", type=datetime.fromisoformat, default=None)
+    enqueue_parser.add_argument("--end-date", type=datetime.fromisoformat, default=None)
+    enqueue_parser.add_argument("--conversation-ids", type=str, default=None)
+    enqueue_parser.add_argument("--batch-size", type=int, default=20)
+
+    work_parser = subparsers.add_parser("work", help="Process batches from the queue until stopped")
+    work_parser.add_argument("--data-schema-path", type=str, required=True)
+    add_destination_arguments(work_parser)
+    add_outbox_arguments(work_parser)
+    work_parser.add_argument("--model-provider", type=str, choices=model_providers.names(), default="openai", help="Use 'replay' to run offline against recorded or synthetic responses")
+    add_replay_arguments(work_parser)
+    work_parser.add_argument("--event-model", type=str, default="gpt-4o")
+    work_parser.add_argument("--event-property-model", type=str, default="gpt-4.1")
+    work_parser.add_argument("--explanation-model", type=str, default="gpt-4.1-mini")
+    work_parser.add_argument("--llm-judge-model", type=str, default="gpt-4.1")
+    work_parser.add_argument("--max-concurrency", type=int, default=5, help="The number of concurrent LLM requests per stage")
+    add_pipeline_arguments(work_parser)
+    add_client_arguments(work_parser)
+    work_parser.add_argument("--visibility-timeout", type=int, default=900, help="Seconds a received batch stays hidden from other workers")
+    work_parser.add_argument("--max-receive-count", type=int, default=5, help="Attempts at a batch before it's dead-lettered")
+    work_parser.add_argument("--retry-delay", type=int, default=30, help="Seconds before a failed batch is retried, doubling with each attempt up to the visibility timeout")
+    work_parser.add_argument("--dead-letter-queue", type=str, default=None, help="An SQS queue URL to move dead-lettered batches to. SQLite queues keep them with status 'dead'")
+    work_parser.add_argument("--wait-time", type=int, default=20, help="Seconds to wait for a batch before polling again")
+    work_parser.add_argument("--exit-when-empty", action="store_true", help="Stop once the queue has no more visible batches")
+    work_parser.add_argument("--trace-path", type=str, default=None, help="Optional path to write OTLP/JSON trace spans of every batch to")
+    work_parser.add_argument("--metrics-path", type=str, default=None, help="Optional path to write throughput and lag metrics to after every batch")
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        enqueue(args)
+    else:
+        work(args)
@@ -0,0 +1,231 @@
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass, field
+import hashlib
+import math
+from statistics import NormalDist
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from models.conversation import Conversation
+from models.event import Event
+
+
+DIMENSIONS = ("length", "events", "user")
+
+
+@dataclass
+class StratumStats:
+    """The conversations in a stratum and the running sums of the judge scores of those that were judged."""
+    population: int = 0
+    judged: int = 0
+    total: float = 0.0
+    total_squares: float = 0.0
+
+    def add_score(self, score: float):
+        self.judged += 1
+        self.total += score
+        self.total_squares += score * score
+
+    def merge(self, other: "StratumStats"):
+        self.population += other.population
+        self.judged += other.judged
+        self.total += other.total
+        self.total_squares += other.total_squares
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.judged if self.judged else None
+
+    @property
+    def variance(self) -> Optional[float]:
+        if self.judged < 2:
+            return None
+        return max(0.0, (self.total_squares - self.total * self.total / self.judged) / (self.judged - 1))
+
+
+@dataclass
+class JudgeSample:
+    # The stratum of every conversation, judged or not, by conversation id
+    strata: Dict[str, str] = field(default_factory=dict)
+    conversations: List[Conversation] = field(default_factory=list)
+
+
+def estimate_mean(strata: Dict[str, StratumStats], confidence: float = 0.95) -> dict:
+    """
+    The stratified estimate of the mean judge score of every conversation in the strata, with its standard error
+    and a normal confidence interval.
+
+    Each stratum's sample mean is weighted by its share of the conversations, and its variance is scaled by the
+    finite population correction, so a fully judged stratum adds no uncertainty. Strata with a single judged
+    conversation use the variance of all judged scores. Strata with none can't be estimated, so they're
+    excluded and counted as unjudged_conversations.
+    """
+    covered = {key: stats for key, stats in strata.items() if stats.judged}
+    population = sum(stats.population for stats in covered.values())
+    estimate = {
+        "conversations": sum(stats.population for stats in strata.values()),
+        "judged": sum(stats.judged for stats in covered.values()),
+        "unjudged_conversations": sum(stats.population for key, stats in strata.items() if key not in covered),
+        "mean": None,
+        "standard_error": None,
+        "ci_low": None,
+        "ci_high": None,
+        "confidence": confidence
+    }
+    if not population:
+        return estimate
+
+    pooled = StratumStats()
+    for stats in covered.values():
+        pooled.merge(stats)
+    pooled_variance = pooled.variance or 0.0
+
+    mean, variance = 0.0, 0.0
+    for stats in covered.values():
+        weight = stats.population / population
+        stratum_variance = stats.variance if stats.variance is not None else pooled_variance
+        mean += weight * stats.mean
+        variance += weight ** 2 * (1 - stats.judged / max(stats.population, stats.judged)) * stratum_variance / stats.judged
+
+    margin = NormalDist().inv_cdf(0.5 + confidence / 2) * math.sqrt(variance)
+    estimate.update(
+        mean=round(mean, 3),
+        standard_error=round(math.sqrt(variance), 3),
+        ci_low=round(mean - margin, 3),
+        ci_high=round(mean + margin, 3)
+    )
+    return estimate
+
+
+class StratifiedJudgeSampler:
+    """
+    Picks the conversations to run the LLM judge on, stratified by conversation length, the event type the
+    conversation has most of, and how many conversations its user has, and estimates the mean judge score of all
+    conversations from those that were judged.
+
+    Each stratum is sampled at the highest rate of the rules matching it, or default_rate, and keeps at least
+    min_per_stratum conversations so that every stratum can be estimated. Rules are stratum selectors such as
+    "length:long" or "events:Crisis,user:frequent". Conversations are picked by a hash of their id, so the same
+    ones are judged whenever the same conversations are sampled together.
+
+    A user's conversations are counted among those passed to count_users, e.g. everything a run loaded, or else
+    among those passed to each sample() call. min_per_stratum also applies to each call. So with chunks, shards
+    or workers, a conversation's stratum and whether it's judged can differ from a run over the whole dataset at
+    once.
+
+    Conversations that aren't judged get no llm_judge_score, or with impute, the mean score of their stratum.
+    Counts and scores accumulate across calls, so estimate() covers every conversation sampled so far.
+    """
+
+    def __init__(
+        self,
+        default_rate: float = 0.1,
+        rates: Optional[Dict[str, float]] = None,
+        dimensions: Sequence[str] = DIMENSIONS,
+        min_per_stratum: int = 2,
+        length_bins: Sequence[int] = (8, 20),
+        impute: bool = False,
+        confidence: float = 0.95
+    ):
+        unknown = [dimension for dimension in dimensions if dimension not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown stratification dimensions {unknown}, expected some of {list(DIMENSIONS)}")
+        self.default_rate = default_rate
+        self.rates = [(self._parse_selector(selector), rate) for selector, rate in (rates or {}).items()]
+        self.dimensions = list(dimensions)
+        self.min_per_stratum = min_per_stratum
+        self.length_bins = list(length_bins)
+        self.impute = impute
+        self.confidence = confidence
+        self.strata: Dict[str, StratumStats] = defaultdict(StratumStats)
+        self.conversations_per_user: Optional[Counter] = None
+
+    def count_users(self, conversations: Iterable[Conversation]):
+        """Stratify users by their number of conversations among these, instead of among those of each sample() call."""
+        self.conversations_per_user = Counter(conversation.user_id for conversation in conversations)
+
+    def sample(self, conversations: List[Conversation], events_by_conversation: Dict[Conversation, List[Event]]) -> JudgeSample:
+        conversations_per_user = self.conversations_per_user
+        if conversations_per_user is None:
+            conversations_per_user = Counter(conversation.user_id for conversation in conversations)
+        members = defaultdict(list)
+        sample = JudgeSample()
+        for conversation in conversations:
+            stratum = self.stratum(conversation, events_by_conversation.get(conversation, []), conversations_per_user[conversation.user_id])
+            sample.strata[conversation.id] = stratum
+            members[stratum].append(conversation)
+
+        for stratum, stratum_conversations in members.items():
+            size = min(len(stratum_conversations), max(self.min_per_stratum, math.ceil(self.rate(stratum) * len(stratum_conversations))))
+            sample.conversations.extend(sorted(stratum_conversations, key=lambda c: _sample_hash(c.id))[:size])
+        return sample
+
+    def record(self, sample: JudgeSample, llm_judge_scores_by_convo_id: Dict[str, float]) -> Dict[str, float]:
+        """Add the sample's conversations and judge scores to their strata, and return the scores, imputed for the rest if configured."""
+        for conversation_id, stratum in sample.strata.items():
+            self.strata[stratum].population += 1
+            if conversation_id in llm_judge_scores_by_convo_id:
+                self.strata[stratum].add_score(llm_judge_scores_by_convo_id[conversation_id])
+
+        if not self.impute:
+            return llm_judge_scores_by_convo_id
+
+        overall = estimate_mean(self.strata, self.confidence)["mean"]
+        scores = dict(llm_judge_scores_by_convo_id)
+        for conversation_id, stratum in sample.strata.items():
+            if conversation_id not in scores:
+                mean = self.strata[stratum].mean if self.strata[stratum].judged else overall
+                if mean is not None:
+                    scores[conversation_id] = round(mean)
+        return scores
+
+    def stratum(self, conversation: Conversation, events: List[Event], user_conversations: int) -> str:
+        values = {
+            "length": self._length_bin(len(conversation.messages)),
+            "events": Counter(event.event_type.name for event in events).most_common(1)[0][0] if events else "none",
+            "user": "one-off" if user_conversations == 1 else "returning" if user_conversations <= 5 else "frequent"
+        }
+        return ",".join(f"{dimension}:{values[dimension]}" for dimension in self.dimensions)
+
+    def rate(self, stratum: str) -> float:
+        parts = set(stratum.split(","))
+        return max((rate for selector, rate in self.rates if selector <= parts), default=self.default_rate)
+
+    def estimate(self) -> dict:
+        """The population estimate of the mean judge score, overall, per stratum and per value of each dimension."""
+        by_dimension = defaultdict(dict)
+        for stratum in self.strata:
+            for part in stratum.split(","):
+                by_dimension[part][stratum] = self.strata[stratum]
+
+        return {
+            **estimate_mean(self.strata, self.confidence),
+            "by_dimension": {part: estimate_mean(strata, self.confidence) for part, strata in sorted(by_dimension.items())},
+            "strata": {stratum: asdict(stats) for stratum, stats in sorted(self.strata.items())}
+        }
+
+    def _length_bin(self, num_messages: int) -> str:
+        names = ["short", "medium", "long"] if len(self.length_bins) == 2 else [f"bin{i}" for i in range(len(self.length_bins) + 1)]
+        return names[sum(num_messages > edge for edge in self.length_bins)]
+
+    @staticmethod
+    def _parse_selector(selector: str) -> frozenset:
+        parts = frozenset(part.strip() for part in selector.split(","))
+        for part in parts:
+            dimension, _, value = part.partition(":")
+            if dimension not in DIMENSIONS or not value:
+                raise ValueError(f"Expected dimension:value selectors with a dimension in {list(DIMENSIONS)}, got {part}")
+        return parts
+
+
+def combine_strata(stratum_dicts: Iterable[Dict[str, dict]]) -> Dict[str, StratumStats]:
+    """Merge the strata reported by several workers, e.g. from their summaries' judge_sampling["strata"]."""
+    strata = defaultdict(StratumStats)
+    for stratum_dict in stratum_dicts:
+        for stratum, stats in stratum_dict.items():
+            strata[stratum].merge(StratumStats(**stats))
+    return strata
+
+
+def _sample_hash(conversation_id) -> int:
+    # Salted, so the sample isn't correlated with the shard and worker assignment in sharding.py
+    return int.from_bytes(hashlib.md5(f"judge-sample/{conversation_id}".encode("utf-8")).digest()[:8], "big")
@@ -1,13 +1,17 @@
+from dataclasses import replace
 import json
-from typing import List
+from typing import Dict, List, Optional
 
 from models.assistant import Assistant
-from models.conversation import Conversation
+from models.conversation import Conversation, Message
 from models.event import Event, EventType, ROLE
-from llm_queries.llm_query import LLMQuery, ModelProvider
+from llm_queries.llm_query import LLMQuery, ModelProvider, SalvagesPartialResponses
 
 
-class EventGenerator(LLMQuery):
+class EventGenerator(SalvagesPartialResponses, LLMQuery):
+
+    # Recorded as the model of events whose type was assigned by the local tagger
+    local_tagger_model_id = "local_tagger"
 
     def __init__(
             self, 
@@ -15,12 +19,21 @@ class EventGenerator(LLMQuery):
             model_id: str, 
             assistant: Assistant, 
             event_types: List[EventType],
-            conversation: Conversation
+            conversation: Conversation,
+            pretagged: Optional[Dict[str, EventType]] = None
         ):
         super().__init__(model_provider, model_id)
         self.assistant = assistant
         self.event_types = event_types
         self.conversation = conversation
+        # Event types already assigned locally, by message id. Only the remaining messages are sent to the LLM to tag
+        self.pretagged = pretagged or {}
+        # Events parsed from a streamed response, by message id, reused when the whole response is parsed
+        self.streamed_events: Dict[str, Event] = {}
+
+    @property
+    def untagged_messages(self):
+        return [m for m in self.conversation.messages if str(m.message_id) not in self.pretagged]
 
     def generate_prompt(self) -> str:      
         return  f"""Determine the events that occurred during a conversation between a user and an assistant.
@@ -41,12 +54,23 @@ class EventGenerator(LLMQuery):
 
 ### Conversation
 {json.dumps(self.conversation.prompt_format, indent=4)}
+{self._pretagged_prompt()}"""
+
+    def _pretagged_prompt(self) -> str:
+        if not self.pretagged:
+            return ""
+
+        pretagged_json = [{"message_id": message_id, "event_type": event_type.name} for message_id, event_type in self.pretagged.items()]
+        return f"""
+### Already Tagged Messages
+The following messages have already been tagged. Use them as context, and only determine the event types for the remaining messages.
+{json.dumps(pretagged_json, indent=4)}
 """
     
     def response_schema(self):
         properties = {}
 
-        for message in self.conversation.messages:
+        for message in self.untagged_messages:
             if message.role == ROLE.assistant:
                 event_type_ids = [str(et.name) for et in self.event_types if (et.role == ROLE.assistant)]
             else:
@@ -61,24 +85,68 @@ class EventGenerator(LLMQuery):
         return {
             "type": "object",
             "properties": properties,
-            "required": [str(m.message_id) for m in self.conversation.messages],
+            "required": [str(m.message_id) for m in self.untagged_messages],
             "additionalProperties": False
         }
 
-    def parse_response(self, json_response) -> List[Event]:   
+    def subquery(self, failed_ids: List[str], response: Dict) -> "EventGenerator":
+        # Messages with a valid event type are passed as already tagged, leaving just the failed ones to tag
+        event_types_by_name = {str(et.name): et for et in self.event_types}
+        pretagged = {**self.pretagged, **{message_id: event_types_by_name[name] for message_id, name in response.items()}}
+        return EventGenerator(self.model_provider, self.model_id, self.assistant, self.event_types, self.conversation, pretagged)
+
+    def parse_item(self, key: str, value) -> Optional[Event]:
+        message = next((m for m in self.conversation.messages if str(m.message_id) == key), None)
+        event_type = next((et for et in self.event_types if str(et.name) == value), None)
+        if message is None or event_type is None:
+            return None
+
+        event = Event(
+            user_id=self.conversation.user_id,
+            event_type=event_type,
+            conversation_id=self.conversation.id,
+            message=message,
+            model_id=self.model_id
+        )
+        self.streamed_events[key] = event
+        # A copy, since the explanation and property stages later update the pipeline's event in place
+        return replace(event)
+
+    def parse_response(self, json_response) -> List[Event]:
+        return self._events(self.conversation.messages, json_response)
+
+    def parse_partial_response(self, json_response) -> List[Event]:
+        # Messages that still have no valid event type after every follow-up don't get an event
+        return self._events(
+            [m for m in self.conversation.messages if str(m.message_id) in self.pretagged or str(m.message_id) in json_response],
+            json_response
+        )
+
+    def _events(self, messages: List[Message], json_response) -> List[Event]:
         events = []
-        for message in self.conversation.messages:
+        for message in messages:
             message_id = str(message.message_id)
-            event_type_id = json_response.get(message_id)
-            event_type = next((et for et in self.event_types if str(et.name) == event_type_id), None)
+            if message_id in self.pretagged:
+                event_type = self.pretagged[message_id]
+                model_id = self.local_tagger_model_id
+            else:
+                event_type_id = json_response.get(message_id)
+                event_type = next((et for et in self.event_types if str(et.name) == event_type_id), None)
+                model_id = self.model_id
 
             if not event_type:
                 raise ValueError(f"Event type {event_type_id} not found in event types")
 
+            streamed = self.streamed_events.get(message_id)
+            if streamed and streamed.event_type == event_type and streamed.model_id == model_id:
+                events.append(streamed)
+                continue
+
             events.append(Event(
                 user_id=self.conversation.user_id,
                 event_type=event_type,
                 conversation_id=self.conversation.id,
-                message=message
+                message=message,
+                model_id=model_id
             ))
         return events        
@@ -1,11 +1,12 @@
+from dataclasses import replace
 import json
-from typing import List, Dict
+from typing import Dict, List, Optional
 
-from llm_queries.llm_query import LLMQuery, ModelProvider
+from llm_queries.llm_query import LLMQuery, ModelProvider, SalvagesPartialResponses
 from models.assistant import Assistant
 from models.event import EventType, Event, EventProperty
 
-class EventPropertyGenerator(LLMQuery):
+class EventPropertyGenerator(SalvagesPartialResponses, LLMQuery):
 
     def __init__(
         self, 
@@ -51,8 +52,9 @@ class EventPropertyGenerator(LLMQuery):
         for event in self.events:
             properties[str(event.message.message_id)] = {
                 "type": "string",
-                "enum": self.event_property.choices,
-                "description": f"The event property value that occurred during message_id {event.message.message_id}. If the message should not be tagged with any of the event property values, returnn an empty string."
+                # An empty string is the answer for messages that none of the values fit
+                "enum": self.event_property.choices + ([""] if "" not in self.event_property.choices else []),
+                "description": f"The event property value that occurred during message_id {event.message.message_id}. If the message should not be tagged with any of the event property values, return an empty string."
             }
 
         return {
@@ -62,6 +64,17 @@ class EventPropertyGenerator(LLMQuery):
             "additionalProperties": False
         }
        
+    def subquery(self, failed_ids: List[str], response: Dict) -> "EventPropertyGenerator":
+        events = [e for e in self.events if str(e.message.message_id) in failed_ids]
+        return EventPropertyGenerator(self.model_provider, self.model_id, self.assistant, self.event_type, events, self.event_property)
+
+    def parse_item(self, key: str, value) -> Optional[Event]:
+        # A copy, since the attempt may still fail and the shared event is only updated by parse_response
+        event = next((e for e in self.events if str(e.message.message_id) == key), None)
+        if event is None:
+            return None
+        return replace(event, property_values={**event.property_values, self.event_property.name: value})
+
     def parse_response(self, json_response) -> List[Event]:
         results = []
         
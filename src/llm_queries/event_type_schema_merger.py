@@ -0,0 +1,105 @@
+import json
+from typing import List, Tuple
+
+from llm_queries.llm_query import LLMQuery, ModelProvider
+from models.assistant import Assistant
+from models.event import EventType, ROLE
+
+class EventTypeSchemaMerger(LLMQuery):
+
+    def __init__(
+        self,
+        model_provider: ModelProvider,
+        model_id: str,
+        assistant: Assistant,
+        candidate_event_types: List[List[EventType]]
+    ):
+        super().__init__(model_provider, model_id)
+        self.assistant = assistant
+        self.candidate_event_types = candidate_event_types
+
+    def generate_prompt(self) -> str:
+        candidates_json = [
+            {"schema_id": i, "event_types": [event_type.prompt_object for event_type in event_types]}
+            for i, event_types in enumerate(self.candidate_event_types)
+        ]
+
+        return f"""Consolidate several candidate event schemas into a single event schema for product analytics. Each candidate schema was generated independently from a different sample of the assistant's conversations, so the candidates overlap and often describe the same event type with different names.
+
+### Instructions
+1. Review the assistant and every candidate schema.
+2. Merge event types that are semantically equivalent (e.g. "Express Gratitude" and "Thank Assistant") into a single event type with one clear name and definition. Only merge event types with the same role.
+3. Keep event types that are semantically distinct separate, even if they only appear in one candidate schema.
+4. Ensure the final event types are tangible, mutually exclusive, and contain the correct amount of specificity for a product analytics platform.
+5. For each final event type, list the EXACT names of every candidate event type that was merged into it. Every candidate event type name must appear in exactly one final event type.
+
+### Assistant
+{self.assistant.prompt_format}
+
+### Candidate Schemas
+{json.dumps(candidates_json, indent=4)}
+"""
+
+    def response_schema(self):
+        properties = {}
+        properties["event_types"] = {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {
+                        "type": "string",
+                        "description": "A short (3-5 words) name that captures the essence or main focus of the event type."
+                    },
+                    "definition": {
+                        "type": "string",
+                        "description": "A brief (1-2 sentences) definition of the event type."
+                    },
+                    "role": {
+                        "type": "string",
+                        "description": "Whether the event type is associated with the assistant or the user.",
+                        "enum": ["assistant", "user"]
+                    },
+                    "merged_from": {
+                        "type": "array",
+                        "description": "The exact names of the candidate event types that were merged into this event type.",
+                        "items": {
+                            "type": "string"
+                        }
+                    }
+                },
+                "required": ["name", "definition", "role", "merged_from"],
+                "additionalProperties": False
+            },
+        }
+
+        return {
+            "type": "object",
+            "properties": properties,
+            "required": ["event_types"],
+            "additionalProperties": False
+        }
+
+    def parse_response(self, json_response) -> List[Tuple[EventType, List[str]]]:
+        """Return each consolidated event type along with the candidate names that were merged into it."""
+        candidate_names = {event_type.name for event_types in self.candidate_event_types for event_type in event_types}
+
+        results = []
+        merged_names = set()
+        for event_type_data in json_response.get("event_types", []):
+            event_type = EventType(
+                name=event_type_data["name"],
+                definition=event_type_data["definition"],
+                role=ROLE[event_type_data["role"]],
+                properties=[]
+            )
+            merged_from = [name for name in event_type_data["merged_from"] if name in candidate_names]
+            merged_names.update(merged_from)
+            results.append((event_type, merged_from))
+
+        # Don't silently drop candidates the model forgot to assign
+        missing = candidate_names - merged_names
+        if missing:
+            raise ValueError(f"Merged schema is missing candidate event types: {sorted(missing)}")
+
+        return results
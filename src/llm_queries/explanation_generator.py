@@ -1,13 +1,14 @@
+from dataclasses import replace
 import json
-from typing import List
+from typing import Dict, List, Optional
 
-from llm_queries.llm_query import LLMQuery, ModelProvider
+from llm_queries.llm_query import LLMQuery, ModelProvider, SalvagesPartialResponses
 from models.assistant import Assistant
 from models.conversation import Conversation, Message
 from models.event import EventType, Event
 
 
-class ExplanationGenerator(LLMQuery):
+class ExplanationGenerator(SalvagesPartialResponses, LLMQuery):
 
     def __init__(
             self, 
@@ -60,6 +61,21 @@ class ExplanationGenerator(LLMQuery):
             "additionalProperties": False
         }
 
+    def subquery(self, failed_ids: List[str], response: Dict) -> "ExplanationGenerator":
+        events = [e for e in self.events if str(e.message.message_id) in failed_ids]
+        return ExplanationGenerator(self.model_provider, self.model_id, self.assistant, self.event_types, events, self.conversation)
+
+    def parse_item(self, key: str, value) -> Optional[Event]:
+        # A copy, since the attempt may still fail and the shared event is only updated by parse_response
+        event = next((e for e in self.events if str(e.message.message_id) == key), None)
+        return replace(event, explanation=value) if event is not None else None
+
+    def parse_partial_response(self, json_response) -> List[Event]:
+        # Events whose explanation is still invalid after every follow-up are kept without one
+        for event in self.events:
+            event.explanation = json_response.get(str(event.message.message_id), event.explanation)
+        return self.events
+
     def parse_response(self, json_response) -> List[Event]:
         # Create a list to store updated events
         updated_events = []
@@ -0,0 +1,148 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import logging
+import threading
+import time
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import tracing
+
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """The latencies of the most recent successful requests for each (model, query) pair."""
+
+    def __init__(self, window: int = 1000, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self.latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self.lock = threading.Lock()
+
+    def record(self, key: Tuple[str, str], seconds: float):
+        with self.lock:
+            self.latencies.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key: Tuple[str, str], q: float) -> Optional[float]:
+        """The q-quantile of the recent latencies, or None until there are min_samples of them."""
+        with self.lock:
+            latencies = self.latencies.get(key)
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            return _percentile(sorted(latencies), q)
+
+
+class HedgingPolicy:
+    """
+    Hedges slow LLM requests: if a request hasn't returned after the given quantile of the recent latencies
+    of its model and query type, the same request is sent again and whichever valid response arrives first
+    is used. The other request can't be cancelled once it's been sent, so its response is ignored.
+
+    Only up to max_extra_fraction of requests are hedged, which caps the extra spend. Requests run on this
+    policy's threads while the calling thread waits, so a single policy can be shared by every stage.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        max_extra_fraction: float = 0.1,
+        min_samples: int = 20,
+        window: int = 1000,
+        max_workers: int = 256
+    ):
+        self.quantile = quantile
+        self.max_extra_fraction = max_extra_fraction
+        self.latencies = LatencyTracker(window, min_samples)
+        # Threads are only started as needed, so max_workers just needs to exceed the concurrent requests
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="hedging")
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        # The (hedged, unhedged) latency of each request whose first request succeeded, for the run telemetry
+        self.outcomes: Deque[Tuple[float, float]] = deque(maxlen=100000)
+
+    def call(self, key: Tuple[str, str], fn: Callable):
+        """Call fn, a request to the model and validation of its response, hedging it if it's slow."""
+        with self.lock:
+            self.requests += 1
+
+        start = time.perf_counter()
+        primary = self._submit(key, fn, start)
+        delay = self.latencies.quantile(key, self.quantile)
+        if delay is None or wait([primary], timeout=delay).done or not self._reserve_hedge():
+            result = primary.result()
+            self._record_outcome(time.perf_counter() - start, primary, start)
+            return result
+
+        logger.debug(f"Hedging {key[1]} on {key[0]} after {delay:.2f}s")
+        tracing.set_attributes(**{"llm_query.hedged": True})
+        hedge = self._submit(key, fn, time.perf_counter())
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self.lock:
+                            self.hedge_wins += 1
+                    self._record_outcome(time.perf_counter() - start, primary, start)
+                    return future.result()
+
+        # Both failed, so raise the error of the first request like an unhedged request would
+        return primary.result()
+
+    def _submit(self, key: Tuple[str, str], fn: Callable, start: float) -> Future:
+        future = self.executor.submit(tracing.wrap(fn))
+
+        def record_latency(future: Future):
+            if future.exception() is None:
+                self.latencies.record(key, time.perf_counter() - start)
+
+        future.add_done_callback(record_latency)
+        return future
+
+    def _reserve_hedge(self) -> bool:
+        with self.lock:
+            if self.hedged_requests + 1 > self.max_extra_fraction * self.requests:
+                return False
+            self.hedged_requests += 1
+            return True
+
+    def _record_outcome(self, seconds: float, primary: Future, start: float):
+        # The first request keeps running after a hedge wins, so its latency is what the request would have taken unhedged
+        def record(primary: Future):
+            if primary.exception() is None:
+                self.outcomes.append((seconds, time.perf_counter() - start))
+
+        primary.add_done_callback(record)
+
+    def stats(self) -> Dict:
+        """The number of extra requests sent, and the latency percentiles of requests with and without hedging."""
+        outcomes = list(self.outcomes)
+        hedged = sorted(seconds for seconds, _ in outcomes)
+        unhedged = sorted(seconds for _, seconds in outcomes)
+        stats = {
+            "requests": self.requests,
+            "hedged_requests": self.hedged_requests,
+            "hedge_wins": self.hedge_wins,
+            "extra_request_fraction": round(self.hedged_requests / self.requests, 4) if self.requests else 0.0
+        }
+        if outcomes:
+            stats.update({
+                "p50_seconds": round(_percentile(hedged, 0.5), 3),
+                "p99_seconds": round(_percentile(hedged, 0.99), 3),
+                "unhedged_p50_seconds": round(_percentile(unhedged, 0.5), 3),
+                "unhedged_p99_seconds": round(_percentile(unhedged, 0.99), 3),
+                "p99_improvement_seconds": round(_percentile(unhedged, 0.99) - _percentile(hedged, 0.99), 3)
+            })
+        return stats
+
+    def close(self):
+        # Don't wait for the ignored requests that are still running
+        self.executor.shutdown(wait=False)
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
@@ -0,0 +1,69 @@
+import json
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+
+from llm_queries.event_generator import EventGenerator
+from llm_queries.llm_query import LLMQuery, ModelProvider
+from models.assistant import Assistant
+from models.conversation import Conversation
+from models.event import Event, EventType
+from models.llm_judge_criteria import LLMJudgeCriteria
+
+
+class JudgedEventGenerator(EventGenerator):
+    """Judges a conversation and tags each of its messages with an event type in a single request."""
+
+    # The score and the event types come from a single response, so a partial response can't be split up and
+    # the whole response is queried again instead
+    query = LLMQuery.query
+
+    def __init__(
+            self,
+            model_provider: ModelProvider,
+            model_id: str,
+            assistant: Assistant,
+            llm_judge_criteria: LLMJudgeCriteria,
+            event_types: List[EventType],
+            conversation: Conversation,
+            pretagged: Optional[Dict[str, EventType]] = None
+        ):
+        super().__init__(model_provider, model_id, assistant, event_types, conversation, pretagged)
+        self.llm_judge_criteria = llm_judge_criteria
+
+    def generate_prompt(self) -> str:
+        return f"""{super().generate_prompt()}
+### Evaluation Criteria
+In addition to determining the events, assess the assistant's performance in the conversation based on the following evaluation criteria.
+{json.dumps(asdict(self.llm_judge_criteria), indent=4)}
+"""
+
+    def response_schema(self):
+        # The event type of each message sits next to the score at the top level, rather than in a nested object,
+        # so that streamed responses yield each event as soon as it's generated (see parse_item)
+        events_schema = super().response_schema()
+        if "score" in events_schema["properties"]:
+            raise ValueError(f"Conversation {self.conversation.id} has a message with the id score, which the combined judge and event response reserves")
+        properties = dict()
+        properties["score"] = {
+            "type": "number",
+            "description": "A score between 0 and 100 assessing the assistant's performance in the conversation based on the evaluation criteria.",
+        }
+        properties.update(events_schema["properties"])
+
+        return {
+            "type": "object",
+            "properties": properties,
+            "required": ["score"] + events_schema["required"],
+            "additionalProperties": False
+        }
+
+    def parse_response(self, json_response) -> Tuple[int, List[Event]]:
+        if "score" not in json_response:
+            raise ValueError(f"judged event response missing required field: {json_response}")
+
+        score = json_response["score"]
+        if score < 0 or score > 100:
+            raise ValueError(f"judge score outside of bounds: {json_response}")
+
+        events_response = {key: value for key, value in json_response.items() if key != "score"}
+        return score, super().parse_response(events_response)
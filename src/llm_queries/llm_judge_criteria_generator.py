@@ -2,8 +2,6 @@ from dataclasses import asdict
 from typing import List
 import json
 
-from openai import OpenAI
-
 from models.assistant import Assistant
 from models.llm_judge_criteria import LLMJudgeCriteria
 from llm_queries.llm_query import LLMQuery, ModelProvider
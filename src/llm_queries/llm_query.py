@@ -2,14 +2,22 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 import json
+import threading
 import time
 import logging
-from typing import Dict
-import boto3
-from botocore.config import Config
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING
 
-import anthropic
-import openai
+from llm_queries.schema_validation import split_valid_entries, validation_errors
+from llm_queries.streaming import IncrementalObjectParser
+import tracing
+
+# The SDKs are only needed for type hints here, and importing them is slow
+if TYPE_CHECKING:
+    import anthropic
+    import boto3
+    import openai
+
+    from llm_queries.hedging import HedgingPolicy
 
 
 logger = logging.getLogger(__name__)
@@ -17,6 +25,8 @@ logger = logging.getLogger(__name__)
 
 class LLMQuery(ABC):
     """Base abstract class for LLM queries that defines the common interface."""
+
+    confidence_key = "response_confidence"
     
     @abstractmethod
     def __init__(self, model_provider: ModelProvider, model_id: str):
@@ -38,16 +48,106 @@ class LLMQuery(ABC):
         """Parse the JSON response from the LLM."""
         pass
     
-    def query(self, max_retries=3, retry_delay=2, timeout=60):
-        """Send the query to the LLM and return the parsed response."""
-        user_msg = self.generate_prompt()
+    def parse_item(self, key: str, value):
+        """Parse a single entry of a streamed response, or return None if entries aren't useful on their own."""
+        return None
+
+    def query(self, max_retries=3, retry_delay=2, timeout=60, hedging: Optional[HedgingPolicy] = None, on_item: Optional[Callable[[Any], None]] = None):
+        """
+        Send the query to the LLM and return the parsed response, hedging slow requests with the given policy.
+
+        With on_item, the response is streamed and on_item is called with each parsed entry (see parse_item)
+        as soon as it has been generated, before the whole response is complete. Each entry is passed once,
+        unless a retried request generates a different value for it, which is then passed again.
+        """
+        stream = self._item_handler(on_item) if on_item else None
+        return self._query(self.generate_prompt(), self.response_schema(), self.parse_response, max_retries, retry_delay, timeout, hedging, stream=stream)
+
+    def cascade_query(self, escalation_model_id: str, min_confidence=0.8, max_retries=3, retry_delay=2, timeout=60, hedging: Optional[HedgingPolicy] = None):
+        """
+        Answer with this query's (cheaper) model first, asking it to self-report its confidence, and only
+        re-run the query on the escalation model if that confidence is below min_confidence or the cheap
+        model fails. Afterwards, model_id is the model that produced the returned result.
+        """
+        user_msg = self.generate_prompt() + f"""
+### Confidence
+Also report your confidence that the response is correct, as a number between 0 and 1, in the "{self.confidence_key}" field.
+"""
         response_schema = self.response_schema()
+        response_schema = {
+            **response_schema,
+            "properties": {
+                **response_schema["properties"],
+                self.confidence_key: {
+                    "type": "number",
+                    "description": "Your confidence, between 0 and 1, that the rest of the response is correct."
+                }
+            },
+            "required": response_schema["required"] + [self.confidence_key]
+        }
+
+        def parse_with_confidence(json_response):
+            json_response = dict(json_response)
+            confidence = json_response.pop(self.confidence_key, None)
+            if not isinstance(confidence, (int, float)):
+                raise ValueError(f"response missing confidence: {json_response}")
+            return confidence, self.parse_response(json_response)
+
+        try:
+            confidence, result = self._query(user_msg, response_schema, parse_with_confidence, max_retries, retry_delay, timeout, hedging)
+            if confidence >= min_confidence:
+                return result
+            logger.info(f"Escalating {type(self).__name__} from {self.model_id} to {escalation_model_id} (confidence {confidence})")
+        except Exception as e:
+            logger.info(f"Escalating {type(self).__name__} from {self.model_id} to {escalation_model_id} after error: {e}")
+
+        self.model_id = escalation_model_id
+        return self.query(max_retries, retry_delay, timeout, hedging)
+
+    def _item_handler(self, on_item: Callable[[Any], None]) -> Callable[[str, Any], None]:
+        properties = self.response_schema()["properties"]
+        # The value passed for each key so far
+        emitted = {}
+        lock = threading.Lock()
+
+        def handle(key: str, value):
+            # Invalid entries are left for the complete response to deal with
+            if key not in properties or validation_errors(value, properties[key]):
+                return
+            with lock:
+                if key in emitted and emitted[key] == value:
+                    return
+                emitted[key] = value
+            item = self.parse_item(key, value)
+            if item is not None:
+                on_item(item)
+
+        return handle
+
+    def _query(
+        self, user_msg: str, response_schema: Dict, parse, max_retries, retry_delay, timeout,
+        hedging: Optional[HedgingPolicy] = None, validate: bool = True, stream: Optional[Callable[[str, Any], None]] = None
+    ):
+        def attempt():
+            if stream:
+                response = self.model_provider.stream_query(user_msg, response_schema, self.model_id, stream, timeout)
+            else:
+                response = self.model_provider.query(user_msg, response_schema, self.model_id, timeout)
+            if validate:
+                errors = validation_errors(response, response_schema)
+                if errors:
+                    raise ValueError(f"Response doesn't match the schema: {'; '.join(errors[:5])}")
+            with tracing.span("llm_query.parse_response", **{"llm_query.name": type(self).__name__}):
+                return parse(response)
 
         retries = 0
         while retries < max_retries:
             try:
-                response = self.model_provider.query(user_msg, response_schema, self.model_id, timeout)
-                return self.parse_response(response)
+                with tracing.span("llm_query.attempt", **{"llm_query.name": type(self).__name__, "llm_query.retry": retries, "gen_ai.request.model": self.model_id}):
+                    # A hedged response only counts once it's been parsed, so a malformed response doesn't win
+                    if hedging:
+                        return hedging.call((self.model_id, type(self).__name__), attempt)
+                    return attempt()
             except Exception as e:
                 retries += 1
                 logger.error(f"Error: {e}")
@@ -57,13 +157,65 @@ class LLMQuery(ABC):
 
         raise Exception("Unable to complete llm query.")
 
-    
+
+class SalvagesPartialResponses(ABC):
+    """
+    Mixed into LLMQuery subclasses, before LLMQuery, whose responses are objects keyed by message id. The valid
+    entries of a partially valid response are kept, and only the invalid or missing ones are queried again with
+    subquery.
+    """
+
+    def query(self, max_retries=3, retry_delay=2, timeout=60, hedging: Optional[HedgingPolicy] = None, on_item: Optional[Callable[[Any], None]] = None):
+        stream = self._item_handler(on_item) if on_item else None
+        return self._salvage_query(max_retries, retry_delay, timeout, hedging, stream)
+
+    @abstractmethod
+    def subquery(self, failed_ids: List[str], response: Dict) -> LLMQuery:
+        """A query for just the failed entries of a partially valid response, given its valid entries so far."""
+        pass
+
+    def parse_partial_response(self, json_response):
+        """Parse a response that's missing the entries that were still invalid after every follow-up."""
+        return self.parse_response(json_response)
+
+    def _salvage_query(self, max_retries, retry_delay, timeout, hedging: Optional[HedgingPolicy] = None, stream: Optional[Callable[[str, Any], None]] = None):
+        response = {}
+        query = self
+        # The first request, then up to max_retries follow-ups for the entries that are still invalid
+        for follow_up in range(max_retries + 1):
+            if follow_up:
+                logger.info(f"Re-querying {len(failed)} invalid or missing entries of {type(self).__name__}")
+                query = self.subquery(failed, response)
+
+            response_schema = query.response_schema()
+            entries, failed = query._query(
+                query.generate_prompt(), response_schema, lambda json_response: split_valid_entries(json_response, response_schema),
+                max_retries, retry_delay, timeout, hedging, validate=False, stream=stream
+            )
+            response.update(entries)
+            if not failed:
+                return self.parse_response(response)
+
+        logger.warning(f"{type(self).__name__} dropped {len(failed)} entries that were still invalid after {max_retries} follow-ups")
+        return self.parse_partial_response(response)
+
+
 class ModelProvider(ABC):
 
     @abstractmethod
     def query(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int=60):
         pass
 
+    def stream_query(self, user_msg: str, response_schema: Dict, model_id: str, on_item: Callable[[str, Any], None], timeout: int=60):
+        """
+        Like query, but also calls on_item with each top-level key and value of the response as soon as it's
+        been generated. Providers that can't stream call it for every entry once the whole response arrives.
+        """
+        response = self.query(user_msg, response_schema, model_id, timeout)
+        for key, value in response.items():
+            on_item(key, value)
+        return response
+
     @abstractmethod
     def response_format(self, response_schema: Dict) -> Dict:
         pass
@@ -74,30 +226,51 @@ class OpenAIModelProvider(ModelProvider):
         self.client = client
 
     def query(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int=60):
+        response = self.client.chat.completions.create(**self._request(user_msg, response_schema, model_id, timeout))
+
+        if response.usage:
+            tracing.set_attributes(**{
+                "gen_ai.usage.input_tokens": response.usage.prompt_tokens,
+                "gen_ai.usage.output_tokens": response.usage.completion_tokens
+            })
+
+        return json.loads(response.choices[0].message.content)
+
+    def stream_query(self, user_msg: str, response_schema: Dict, model_id: str, on_item: Callable[[str, Any], None], timeout: int=60):
+        stream = self.client.chat.completions.create(
+            **self._request(user_msg, response_schema, model_id, timeout),
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+        parser = IncrementalObjectParser()
+        for chunk in stream:
+            # The last chunk has the usage and no choices
+            if chunk.usage:
+                tracing.set_attributes(**{
+                    "gen_ai.usage.input_tokens": chunk.usage.prompt_tokens,
+                    "gen_ai.usage.output_tokens": chunk.usage.completion_tokens
+                })
+            if chunk.choices and chunk.choices[0].delta.content:
+                for key, value in parser.feed(chunk.choices[0].delta.content):
+                    on_item(key, value)
+
+        return json.loads(parser.buffer)
+
+    def _request(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int) -> Dict:
+        request = {
+            "model": model_id,
+            "messages": [
+                {"role": "user", "content": user_msg}
+            ],
+            "seed": 42,
+            "response_format": self.response_format(response_schema),
+            "timeout": timeout
+        }
         # The reasoning models don't support temperature
-        if model_id.startswith("o"):
-            response = self.client.chat.completions.create(
-                model=model_id,
-                messages=[
-                    {"role": "user", "content": user_msg}
-                ],
-                seed=42,
-                response_format=self.response_format(response_schema),
-                timeout=timeout
-            ).choices[0].message.content
-        else:
-            response = self.client.chat.completions.create(
-                model=model_id,
-                messages=[
-                    {"role": "user", "content": user_msg}
-                ],
-                temperature=0,
-                seed=42,
-                response_format=self.response_format(response_schema),
-                timeout=timeout
-            ).choices[0].message.content
-
-        return json.loads(response)
+        if not model_id.startswith("o"):
+            request["temperature"] = 0
+        return request
     
     def response_format(self, response_schema: Dict):
         return {
@@ -116,19 +289,11 @@ class AnthropicModelProvider(ModelProvider):
     
     def query(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int=60):
         """Handle API calls to Anthropic Claude using the tools API for schema enforcement"""
-        response_format = self.response_format(response_schema)
-        
-        response = self.client.messages.create(
-            model=model_id,
-            max_tokens=4096,
-            temperature=0,
-            messages=[
-                {"role": "user", "content": user_msg}
-            ],
-            tools=[response_format],
-            tool_choice={"type": "tool", "name": response_format["name"]},
-            timeout=timeout
-        )
+        response = self.client.messages.create(**self._request(user_msg, response_schema, model_id, timeout))
+        tracing.set_attributes(**{
+            "gen_ai.usage.input_tokens": response.usage.input_tokens,
+            "gen_ai.usage.output_tokens": response.usage.output_tokens
+        })
         
         # Parse the response to get the tool use
         for content in response.content:
@@ -137,6 +302,38 @@ class AnthropicModelProvider(ModelProvider):
         
         # Fallback in case the model didn't use the tool
         raise Exception("Anthropic model did not return a tool use response")
+
+    def stream_query(self, user_msg: str, response_schema: Dict, model_id: str, on_item: Callable[[str, Any], None], timeout: int=60):
+        stream = self.client.messages.create(**self._request(user_msg, response_schema, model_id, timeout), stream=True)
+
+        # The tool input streams in as fragments of its JSON
+        parser = IncrementalObjectParser()
+        for event in stream:
+            if event.type == "message_start":
+                tracing.set_attributes(**{"gen_ai.usage.input_tokens": event.message.usage.input_tokens})
+            elif event.type == "content_block_delta" and event.delta.type == "input_json_delta":
+                for key, value in parser.feed(event.delta.partial_json):
+                    on_item(key, value)
+            elif event.type == "message_delta":
+                tracing.set_attributes(**{"gen_ai.usage.output_tokens": event.usage.output_tokens})
+
+        if not parser.buffer:
+            raise Exception("Anthropic model did not return a tool use response")
+        return json.loads(parser.buffer)
+
+    def _request(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int) -> Dict:
+        response_format = self.response_format(response_schema)
+        return {
+            "model": model_id,
+            "max_tokens": 4096,
+            "temperature": 0,
+            "messages": [
+                {"role": "user", "content": user_msg}
+            ],
+            "tools": [response_format],
+            "tool_choice": {"type": "tool", "name": response_format["name"]},
+            "timeout": timeout
+        }
     
     def response_format(self, response_schema: Dict) -> Dict:
         return {
@@ -152,24 +349,10 @@ class BedrockModelProvider(ModelProvider):
 
     def query(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int=60):
         """Handle API calls via Amazon Bedrock using tool use for schema enforcement"""
-        response_format = self.response_format(response_schema)
-        
-        # Prepare the request body
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "temperature": 0,
-            "messages": [
-                {"role": "user", "content": user_msg}
-            ],
-            "tools": [response_format],
-            "tool_choice": {"type": "tool", "name": response_format["name"]}
-        }
-
         # Call the Bedrock API
         response = self.client.invoke_model(
             modelId=model_id,
-            body=json.dumps(request_body),
+            body=json.dumps(self._request_body(user_msg, response_schema)),
             contentType="application/json",
             accept="application/json"
         )
@@ -177,8 +360,50 @@ class BedrockModelProvider(ModelProvider):
         # Parse the response
         response_body = json.loads(response['body'].read().decode('utf-8'))
         logger.debug(f"Response body: {response_body}")
+        if "usage" in response_body:
+            tracing.set_attributes(**{
+                "gen_ai.usage.input_tokens": response_body["usage"]["input_tokens"],
+                "gen_ai.usage.output_tokens": response_body["usage"]["output_tokens"]
+            })
         
         return response_body["content"][0]["input"]
+
+    def stream_query(self, user_msg: str, response_schema: Dict, model_id: str, on_item: Callable[[str, Any], None], timeout: int=60):
+        response = self.client.invoke_model_with_response_stream(
+            modelId=model_id,
+            body=json.dumps(self._request_body(user_msg, response_schema)),
+            contentType="application/json",
+            accept="application/json"
+        )
+
+        # Each chunk is an Anthropic streaming event, with the tool input streaming in as fragments of its JSON
+        parser = IncrementalObjectParser()
+        for stream_event in response["body"]:
+            if "chunk" not in stream_event:
+                continue
+            event = json.loads(stream_event["chunk"]["bytes"])
+            if event["type"] == "message_start":
+                tracing.set_attributes(**{"gen_ai.usage.input_tokens": event["message"]["usage"]["input_tokens"]})
+            elif event["type"] == "content_block_delta" and event["delta"]["type"] == "input_json_delta":
+                for key, value in parser.feed(event["delta"]["partial_json"]):
+                    on_item(key, value)
+            elif event["type"] == "message_delta":
+                tracing.set_attributes(**{"gen_ai.usage.output_tokens": event["usage"]["output_tokens"]})
+
+        return json.loads(parser.buffer)
+
+    def _request_body(self, user_msg: str, response_schema: Dict) -> Dict:
+        response_format = self.response_format(response_schema)
+        return {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 4096,
+            "temperature": 0,
+            "messages": [
+                {"role": "user", "content": user_msg}
+            ],
+            "tools": [response_format],
+            "tool_choice": {"type": "tool", "name": response_format["name"]}
+        }
     
     def response_format(self, response_schema: Dict) -> Dict:
         return {
@@ -186,4 +411,3 @@ class BedrockModelProvider(ModelProvider):
             "description": "Extract structured data according to the provided schema",
             "input_schema": response_schema
         }
-
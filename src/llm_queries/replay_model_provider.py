@@ -0,0 +1,155 @@
+from collections import defaultdict
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from llm_queries.llm_query import ModelProvider
+from sampling import estimate_tokens
+import tracing
+
+
+class ReplayModelProvider(ModelProvider):
+    """
+    An offline ModelProvider for benchmarks and local runs.
+
+    Responses are replayed from a fixture file (JSON Lines of {"key": ..., "response": ...}) keyed on the
+    model, prompt and response schema. Requests without a recorded response are sent to record_provider, if
+    given, and its response is appended to the fixture file. Otherwise they get a deterministic synthetic
+    response that satisfies the schema.
+
+    Replayed and synthesized requests sleep for a simulated latency of a fixed overhead plus per-input-token
+    prompt processing and per-output-token generation times, scaled by a log-normal jitter factor, and fail
+    with probability error_rate. Token usage is estimated from the prompt and response lengths and tallied
+    per model.
+    """
+
+    def __init__(
+        self,
+        fixtures_path: Optional[str] = None,
+        base_latency: float = 0.0,
+        seconds_per_output_token: float = 0.0,
+        seconds_per_input_token: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        record_provider: Optional[ModelProvider] = None,
+        seed: int = 42
+    ):
+        if record_provider and not fixtures_path:
+            raise ValueError("A fixtures path is required to record responses")
+
+        self.fixtures = {}
+        if fixtures_path and os.path.exists(fixtures_path):
+            with open(fixtures_path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        fixture = json.loads(line)
+                        self.fixtures[fixture["key"]] = fixture["response"]
+
+        self.fixtures_path = fixtures_path
+        self.base_latency = base_latency
+        self.seconds_per_output_token = seconds_per_output_token
+        self.seconds_per_input_token = seconds_per_input_token
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.record_provider = record_provider
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.usage = defaultdict(lambda: {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "errors": 0})
+
+    @staticmethod
+    def fixture_key(user_msg: str, response_schema: Dict, model_id: str) -> str:
+        payload = json.dumps([model_id, user_msg, response_schema], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def query(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int=60):
+        response, latency, failed = self._respond(user_msg, response_schema, model_id, timeout)
+        time.sleep(latency)
+        if failed:
+            raise Exception(f"Simulated error from model {model_id}")
+        return response
+
+    def stream_query(self, user_msg: str, response_schema: Dict, model_id: str, on_item: Callable[[str, Any], None], timeout: int=60):
+        """Stream the response's entries with the time to generate each one in between. A simulated error happens halfway through."""
+        response, latency, failed = self._respond(user_msg, response_schema, model_id, timeout)
+        completion_tokens = estimate_tokens(json.dumps(response))
+        # The overhead and prompt processing time pass before the first entry, then the entries are generated
+        unjittered = self.base_latency + estimate_tokens(user_msg) * self.seconds_per_input_token + completion_tokens * self.seconds_per_output_token
+        generation_latency = latency * completion_tokens * self.seconds_per_output_token / unjittered if unjittered else 0.0
+        time.sleep(latency - generation_latency)
+
+        items = list(response.items())
+        for i, (key, value) in enumerate(items):
+            if failed and i >= len(items) // 2:
+                raise Exception(f"Simulated error from model {model_id}")
+            time.sleep(generation_latency * estimate_tokens(json.dumps({key: value})) / completion_tokens)
+            on_item(key, value)
+        if failed:
+            raise Exception(f"Simulated error from model {model_id}")
+        return response
+
+    def _respond(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int) -> Tuple[Dict, float, bool]:
+        """The response, the simulated seconds it takes and whether it fails."""
+        key = self.fixture_key(user_msg, response_schema, model_id)
+        response = self.fixtures.get(key)
+        recorded = response is None and self.record_provider is not None
+        if recorded:
+            response = self.record_provider.query(user_msg, response_schema, model_id, timeout)
+            self._record(key, response)
+        elif response is None:
+            response = self.synthesize(response_schema, random.Random(key))
+
+        prompt_tokens = estimate_tokens(user_msg)
+        completion_tokens = estimate_tokens(json.dumps(response))
+        with self.lock:
+            usage = self.usage[model_id]
+            usage["requests"] += 1
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            jitter = self.random.lognormvariate(0, self.jitter) if self.jitter else 1.0
+            failed = not recorded and self.random.random() < self.error_rate
+            usage["errors"] += failed
+        tracing.set_attributes(**{"gen_ai.usage.input_tokens": prompt_tokens, "gen_ai.usage.output_tokens": completion_tokens})
+
+        # Recorded responses already took as long as the real provider did
+        if recorded:
+            return response, 0.0, failed
+        return response, (self.base_latency + prompt_tokens * self.seconds_per_input_token + completion_tokens * self.seconds_per_output_token) * jitter, failed
+
+    def _record(self, key: str, response):
+        with self.lock:
+            self.fixtures[key] = response
+            with open(self.fixtures_path, 'a') as f:
+                f.write(json.dumps({"key": key, "response": response}) + "\n")
+
+    def response_format(self, response_schema: Dict) -> Dict:
+        return response_schema
+
+    def synthesize(self, schema: Dict, rng: random.Random):
+        """Generate a value that satisfies the (strict-mode subset of) JSON schema."""
+        if "enum" in schema:
+            return rng.choice(schema["enum"]) if schema["enum"] else ""
+
+        schema_type = schema.get("type")
+        if schema_type == "object":
+            return {name: self.synthesize(property_schema, rng) for name, property_schema in schema.get("properties", {}).items()}
+        if schema_type == "array":
+            return [self.synthesize(schema["items"], rng) for _ in range(rng.randint(1, 3))]
+        if schema_type == "number":
+            return round(rng.uniform(0, 100), 1)
+        if schema_type == "integer":
+            return rng.randint(0, 100)
+        if schema_type == "boolean":
+            return rng.random() < 0.5
+        # Strings are about as long as a typical 1-2 sentence explanation
+        return " ".join(rng.choice(["the", "user", "assistant", "asks", "explains", "about", "their", "situation"]) for _ in range(25))
+
+    def total_usage(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                key: sum(usage[key] for usage in self.usage.values())
+                for key in ["requests", "prompt_tokens", "completion_tokens", "errors"]
+            }
@@ -0,0 +1,71 @@
+from typing import Dict, List, Tuple
+
+
+# Python types accepted for each JSON schema type. bool is a subclass of int, so it's excluded explicitly below
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+    "null": type(None)
+}
+
+
+def validation_errors(value, schema: Dict, path: str = "$") -> List[str]:
+    """
+    The ways value doesn't match the JSON schema, checking the subset of JSON schema used by structured
+    outputs (type, enum, properties, required, additionalProperties and items). OpenAI enforces response
+    schemas, but the Anthropic and Bedrock tool inputs aren't guaranteed to match theirs.
+    """
+    errors = []
+    schema_type = schema.get("type")
+    if schema_type is not None:
+        types = schema_type if isinstance(schema_type, list) else [schema_type]
+        if not any(_is_type(value, t) for t in types):
+            return [f"{path}: expected {schema_type}, got {type(value).__name__}"]
+
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing required property {key}")
+        for key, item in value.items():
+            if key in properties:
+                errors.extend(validation_errors(item, properties[key], f"{path}.{key}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}: unexpected property {key}")
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validation_errors(item, schema["items"], f"{path}[{i}]"))
+
+    return errors
+
+
+def split_valid_entries(response, schema: Dict) -> Tuple[Dict, List[str]]:
+    """
+    Split an object response into the entries that are valid against their property schemas and the required
+    properties that are missing or invalid, so that only the invalid ones need to be requested again.
+    """
+    if not isinstance(response, dict):
+        raise ValueError(f"Expected a JSON object response, got {type(response).__name__}")
+
+    properties = schema.get("properties", {})
+    valid = {
+        key: value for key, value in response.items()
+        if key in properties and not validation_errors(value, properties[key])
+    }
+    failed = [key for key in schema.get("required", []) if key not in valid]
+    return valid, failed
+
+
+def _is_type(value, schema_type: str) -> bool:
+    if schema_type in ("number", "integer") and isinstance(value, bool):
+        return False
+    if schema_type == "integer" and isinstance(value, float):
+        return value.is_integer()
+    return isinstance(value, _TYPES.get(schema_type, object))
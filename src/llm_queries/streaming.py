@@ -0,0 +1,49 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class IncrementalObjectParser:
+    """
+    Parses a JSON object as its text streams in, returning each top-level entry as soon as its value is
+    complete, so a response keyed by message id can be used message by message while it's generated.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        # Where the text of the current top-level entry starts in the buffer
+        self.entry_start: Optional[int] = None
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Add the next chunk of the response, and return the (key, value) entries it completed."""
+        self.buffer += text
+        entries = []
+        buffer = self.buffer
+        for i in range(self.position, len(buffer)):
+            c = buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif c == "\\":
+                    self.escaped = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c == "{" or c == "[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.entry_start = i + 1
+            elif c == "}" or c == "]" or (c == "," and self.depth == 1):
+                if self.depth == 1 and self.entry_start is not None:
+                    entry = buffer[self.entry_start:i].strip()
+                    if entry:
+                        entries.append(next(iter(json.loads("{" + entry + "}").items())))
+                    self.entry_start = i + 1
+                if c != ",":
+                    self.depth -= 1
+        self.position = len(buffer)
+        return entries
@@ -0,0 +1,125 @@
+import json
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from models.conversation import Message, ROLE
+from models.event import EventType
+from text_clustering import HashingVectorizer
+
+
+def read_labeled_messages(file_path: str) -> List[Tuple[ROLE, str, str, str]]:
+    """Read (role, content, event type name, conversation id) examples from the events written by the jsonl destination."""
+    examples = []
+    with open(file_path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            properties = record["event_properties"]
+            examples.append((ROLE[properties["role"]], properties["content"], record["event_type"], properties["conversation_id"]))
+    return examples
+
+
+class LocalEventTagger:
+    """
+    A hashed-feature multinomial logistic regression that predicts a message's event type locally.
+
+    It is trained from messages that were previously tagged by the LLM, and only event types with the
+    message's role can be predicted, mirroring the EventGenerator response schema.
+    """
+
+    def __init__(self, event_types: List[EventType], n_features: int = 2 ** 12):
+        self.event_types = event_types
+        self.vectorizer = HashingVectorizer(n_features=n_features)
+        self.weights = np.zeros((n_features, len(event_types)), dtype=np.float32)
+        self.bias = np.zeros(len(event_types), dtype=np.float32)
+        self.role_masks = {
+            role: np.array([event_type.role == role for event_type in event_types])
+            for role in ROLE
+        }
+
+    def fit(
+        self,
+        examples: List[Tuple],
+        n_epochs: int = 20,
+        batch_size: int = 256,
+        learning_rate: float = 5.0,
+        l2: float = 1e-4,
+        seed: int = 42
+    ) -> "LocalEventTagger":
+        """Train on (role, content, event type name, ...) examples, such as those from read_labeled_messages."""
+        index_by_name = {event_type.name: i for i, event_type in enumerate(self.event_types)}
+        examples = [example for example in examples if example[2] in index_by_name]
+        if not examples:
+            raise ValueError("None of the labeled messages have an event type in the schema")
+
+        X = self.vectorizer.fit_transform([example[1] for example in examples])
+        roles = [example[0] for example in examples]
+        y = np.array([index_by_name[example[2]] for example in examples])
+
+        random = np.random.default_rng(seed)
+        for _ in range(n_epochs):
+            order = random.permutation(len(examples))
+            for i in range(0, len(order), batch_size):
+                batch = order[i:i + batch_size]
+                probabilities = self._probabilities(X[batch], [roles[j] for j in batch])
+                probabilities[np.arange(len(batch)), y[batch]] -= 1
+                self.weights -= learning_rate * (X[batch].T @ probabilities / len(batch) + l2 * self.weights)
+                self.bias -= learning_rate * probabilities.mean(axis=0)
+
+        return self
+
+    def _probabilities(self, X: np.ndarray, roles: List[ROLE]) -> np.ndarray:
+        logits = X @ self.weights + self.bias
+        # Event types for the other role can never be assigned to a message
+        masks = np.array([self.role_masks[role] for role in roles])
+        logits = np.where(masks, logits, -np.inf)
+        # A message whose role has no event types at all gets a probability of 0 for each, instead of NaN
+        allowed = masks.any(axis=1, keepdims=True)
+        logits -= np.where(allowed, logits.max(axis=1, keepdims=True), 0)
+        probabilities = np.exp(logits)
+        return probabilities / np.where(allowed, probabilities.sum(axis=1, keepdims=True), 1)
+
+    def predict(self, messages: List[Message]) -> List[Tuple[EventType, float]]:
+        """Return the most likely event type for each message along with its probability."""
+        if not messages:
+            return []
+        X = self.vectorizer.transform([message.content for message in messages])
+        probabilities = self._probabilities(X, [message.role for message in messages])
+        best = probabilities.argmax(axis=1)
+        return [(self.event_types[i], float(probabilities[row, i])) for row, i in enumerate(best)]
+
+    def pretag(self, messages: List[Message], threshold: float) -> Dict[str, EventType]:
+        """The event types of the messages that can be tagged with at least the given confidence, by message id."""
+        return {
+            str(message.message_id): event_type
+            for message, (event_type, probability) in zip(messages, self.predict(messages))
+            if probability >= threshold
+        }
+
+    def save(self, file_path: str):
+        np.savez_compressed(
+            file_path,
+            weights=self.weights,
+            bias=self.bias,
+            document_frequencies=self.vectorizer.document_frequencies,
+            num_documents=self.vectorizer.num_documents,
+            event_type_names=np.array([event_type.name for event_type in self.event_types])
+        )
+
+    @classmethod
+    def load(cls, file_path: str, event_types: List[EventType]) -> "LocalEventTagger":
+        data = np.load(file_path)
+        names = list(data["event_type_names"])
+        by_name = {event_type.name: event_type for event_type in event_types}
+        missing = [name for name in names if name not in by_name]
+        if missing:
+            raise ValueError(f"Local tagger was trained with event types that aren't in the schema: {missing}")
+
+        tagger = cls([by_name[name] for name in names], n_features=data["weights"].shape[0])
+        tagger.weights = data["weights"]
+        tagger.bias = data["bias"]
+        tagger.vectorizer.document_frequencies = data["document_frequencies"]
+        tagger.vectorizer.num_documents = int(data["num_documents"])
+        return tagger
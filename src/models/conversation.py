@@ -19,6 +19,13 @@ class Message:
     def prompt_format(self):
         return {"message_id": self.message_id, "role": self.role.name.lower(), "content": self.content}
 
+    def to_dict(self) -> dict:
+        return {"message_id": str(self.message_id), "role": self.role.name, "content": self.content, "timestamp": self.timestamp.isoformat()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Message":
+        return cls(ROLE[data["role"]], data["content"], datetime.fromisoformat(data["timestamp"]), data["message_id"])
+
 
 @dataclass
 class Conversation:
@@ -52,3 +59,13 @@ class Conversation:
     def prompt_format(self):
         return [m.prompt_format for m in self.messages]
 
+    def to_dict(self) -> dict:
+        return {"conversation_id": str(self.id), "user_id": str(self.user_id), "messages": [m.to_dict() for m in self.messages]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Conversation":
+        return cls(
+            id=data["conversation_id"],
+            user_id=data["user_id"],
+            messages=[Message.from_dict(m) for m in data["messages"]]
+        )
@@ -1,9 +1,13 @@
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional
 import json
+import uuid
 
 from models.conversation import Message, ROLE
 
+# Namespace for the deterministic ids of events, see Event.insert_id
+EVENT_ID_NAMESPACE = uuid.UUID("6f1c9a3e-1b52-4d0e-9a8e-2f6c1d4b7e10")
+
 @dataclass
 class EventProperty:
     name: str
@@ -57,3 +61,37 @@ class Event:
     message: Message
     property_values: Dict[EventProperty, str] = field(default_factory=dict)
     explanation: Optional[str] = None
+    # The model that assigned the event type
+    model_id: Optional[str] = None
+
+    @property
+    def insert_id(self) -> str:
+        """
+        A UUID derived from the conversation and message ids, so the same message's event always gets the same
+        id. Analytics platforms use it to drop duplicates when an event is delivered more than once.
+        """
+        return str(uuid.uuid5(EVENT_ID_NAMESPACE, f"{self.conversation_id}/{self.message.message_id}"))
+
+    def to_dict(self) -> dict:
+        return {
+            "user_id": str(self.user_id),
+            "event_type": self.event_type.prompt_object,
+            "conversation_id": str(self.conversation_id),
+            "message": self.message.to_dict(),
+            "property_values": dict(self.property_values),
+            "explanation": self.explanation,
+            "model_id": self.model_id
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Event":
+        event_type = data["event_type"]
+        return cls(
+            user_id=data["user_id"],
+            event_type=EventType(event_type["name"], event_type["definition"], ROLE[event_type["role"]]),
+            conversation_id=data["conversation_id"],
+            message=Message.from_dict(data["message"]),
+            property_values=data["property_values"],
+            explanation=data["explanation"],
+            model_id=data["model_id"]
+        )
@@ -0,0 +1,717 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Executor, Future, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING, Union
+
+from tqdm import tqdm
+
+from destinations.destination import DeliveryError, Destination
+from executors import EXECUTORS, stage_executor
+from llm_queries.event_generator import EventGenerator
+from llm_queries.event_property_generator import EventPropertyGenerator
+from llm_queries.explanation_generator import ExplanationGenerator
+from llm_queries.judged_event_generator import JudgedEventGenerator
+from llm_queries.llm_judge import LLMJudge
+from llm_queries.llm_query import ModelProvider
+from models.conversation import Conversation
+from models.data_schema import DataSchema
+from models.event import Event
+from scheduler import submit_llm_query
+import tracing
+
+if TYPE_CHECKING:
+    from explanation_clustering import ExplanationClusterer
+    from judge_sampling import StratifiedJudgeSampler
+    from llm_queries.hedging import HedgingPolicy
+    from local_tagger import LocalEventTagger
+    from sources.source import Source
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Events of the same type whose values of a property are generated in one request
+PROPERTY_BATCH_SIZE = 50
+
+
+def run_llm_judge(
+    model_provider: ModelProvider,
+    model_id: str,
+    data_schema: DataSchema,
+    conversations: List[Conversation],
+    max_workers: int = 5,
+    escalation_model_id: Optional[str] = None,
+    min_confidence: float = 0.8,
+    hedging: Optional[HedgingPolicy] = None,
+    executor: Optional[Executor] = None
+) -> Dict[str, int]:
+    llm_judge_scores_by_convo_id = dict()
+    with stage_executor(executor, max_workers) as executor:
+        futures = {}
+        for conversation in conversations:
+            llm_judge = LLMJudge(
+                model_provider,
+                model_id,
+                data_schema.assistant,
+                data_schema.llm_judge_criteria,
+                conversation
+            )
+            future = _submit_query(executor, llm_judge, escalation_model_id, min_confidence, hedging)
+            futures[future] = (conversation, llm_judge)
+
+        escalated = 0
+        for future in tqdm(as_completed(futures), total=len(conversations), desc="Processing LLM Judge"):
+            try:
+                conversation, llm_judge = futures[future]
+                llm_judge_score = future.result()
+                llm_judge_scores_by_convo_id[conversation.id] = llm_judge_score
+                escalated += llm_judge.model_id != model_id
+            except Exception as e:
+                logger.error(f"Error running LLM Judge for conversation {conversation.id}: {e}")
+
+    if escalation_model_id:
+        logger.info(f"LLM judge escalated {escalated}/{len(conversations)} conversations from {model_id} to {escalation_model_id}")
+
+    return llm_judge_scores_by_convo_id
+
+
+def _submit_query(
+    executor, llm_query, escalation_model_id: Optional[str], min_confidence: float,
+    hedging: Optional[HedgingPolicy] = None, on_item: Optional[Callable[[Event], None]] = None
+):
+    """
+    Submit the query, as a cascade from its model to the escalation model if one is given. A cascade's first
+    answer may be replaced by the escalation model's, so its entries aren't streamed to on_item.
+    """
+    if escalation_model_id:
+        return submit_llm_query(
+            executor,
+            llm_query,
+            tracing.wrap(llm_query.cascade_query),
+            escalation_model_id,
+            min_confidence=min_confidence,
+            max_retries=2,
+            retry_delay=2,
+            timeout=60,
+            hedging=hedging
+        )
+
+    return submit_llm_query(
+        executor,
+        llm_query,
+        tracing.wrap(llm_query.query),
+        max_retries=2,
+        retry_delay=2,
+        timeout=60,
+        hedging=hedging,
+        on_item=on_item
+    )
+
+
+def generate_events(
+    model_provider: ModelProvider,
+    model_id: str,
+    data_schema: DataSchema,
+    conversations: List[Conversation],
+    max_workers: int = 5,
+    local_tagger: Optional[LocalEventTagger] = None,
+    local_tagger_threshold: float = 0.9,
+    escalation_model_id: Optional[str] = None,
+    min_confidence: float = 0.8,
+    hedging: Optional[HedgingPolicy] = None,
+    on_item: Optional[Callable[[Event], None]] = None,
+    executor: Optional[Executor] = None,
+    on_conversation: Optional[Callable[[Conversation, List[Event]], None]] = None
+) -> Dict[Conversation, List[Event]]:
+    """Generate the events of each conversation, calling on_conversation with each one's events as soon as they're complete."""
+    events_by_conversation = dict()
+    pretagged_messages, skipped_queries = 0, 0
+    with stage_executor(executor, max_workers) as executor:
+        futures = {}
+        for conversation in conversations:
+            # Messages the local tagger is confident about don't need to be tagged by the LLM
+            pretagged = local_tagger.pretag(conversation.messages, local_tagger_threshold) if local_tagger else None
+            event_generator = EventGenerator(
+                model_provider,
+                model_id,
+                data_schema.assistant,
+                data_schema.event_types,
+                conversation=conversation,
+                pretagged=pretagged
+            )
+
+            if pretagged:
+                pretagged_messages += len(pretagged)
+                if not event_generator.untagged_messages:
+                    skipped_queries += 1
+                    events_by_conversation[conversation] = event_generator.parse_response({})
+                    if on_conversation:
+                        on_conversation(conversation, events_by_conversation[conversation])
+                    continue
+
+            future = _submit_query(executor, event_generator, escalation_model_id, min_confidence, hedging, on_item)
+            futures[future] = conversation
+
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Generating events"):
+            try:
+                conversation = futures[future]
+                events_for_conversation = future.result()
+                events_by_conversation[conversation] = events_for_conversation
+            except Exception as e:
+                logger.error(f"Error processing conversation {conversation.id}: {e}")
+                continue
+            if on_conversation:
+                on_conversation(conversation, events_for_conversation)
+
+    if local_tagger:
+        total_messages = sum(len(conversation.messages) for conversation in conversations)
+        logger.info(f"Local tagger tagged {pretagged_messages}/{total_messages} messages and skipped {skipped_queries}/{len(conversations)} event generation requests")
+
+    return events_by_conversation
+
+
+def judge_and_generate_events(
+    model_provider: ModelProvider,
+    model_id: str,
+    data_schema: DataSchema,
+    conversations: List[Conversation],
+    max_workers: int = 5,
+    local_tagger: Optional[LocalEventTagger] = None,
+    local_tagger_threshold: float = 0.9,
+    escalation_model_id: Optional[str] = None,
+    min_confidence: float = 0.8,
+    hedging: Optional[HedgingPolicy] = None,
+    on_item: Optional[Callable[[Event], None]] = None,
+    executor: Optional[Executor] = None,
+    on_conversation: Optional[Callable[[Conversation, List[Event]], None]] = None
+) -> Tuple[Dict[str, int], Dict[Conversation, List[Event]]]:
+    """
+    Judge each conversation and generate its events with a single request, sending each conversation once for both.
+    on_conversation is called with each conversation's events as soon as they're complete.
+    """
+    llm_judge_scores_by_convo_id = dict()
+    events_by_conversation = dict()
+    with stage_executor(executor, max_workers) as executor:
+        futures = {}
+        for conversation in conversations:
+            # The conversation still needs to be judged, so pretagging every message doesn't skip the request
+            pretagged = local_tagger.pretag(conversation.messages, local_tagger_threshold) if local_tagger else None
+            judged_event_generator = JudgedEventGenerator(
+                model_provider,
+                model_id,
+                data_schema.assistant,
+                data_schema.llm_judge_criteria,
+                data_schema.event_types,
+                conversation=conversation,
+                pretagged=pretagged
+            )
+            future = _submit_query(executor, judged_event_generator, escalation_model_id, min_confidence, hedging, on_item)
+            futures[future] = conversation
+
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Judging conversations and generating events"):
+            try:
+                conversation = futures[future]
+                llm_judge_score, events_for_conversation = future.result()
+                llm_judge_scores_by_convo_id[conversation.id] = llm_judge_score
+                events_by_conversation[conversation] = events_for_conversation
+            except Exception as e:
+                logger.error(f"Error judging and generating events for conversation {conversation.id}: {e}")
+                continue
+            if on_conversation:
+                on_conversation(conversation, events_for_conversation)
+
+    return llm_judge_scores_by_convo_id, events_by_conversation
+
+
+def generate_explanations(
+    model_provider: ModelProvider,
+    model_id: str,
+    data_schema: DataSchema,
+    events_by_conversation: Dict[Conversation, List[Event]],
+    max_workers: int = 5,
+    hedging: Optional[HedgingPolicy] = None,
+    on_item: Optional[Callable[[Event], None]] = None,
+    executor: Optional[Executor] = None
+) -> List[Event]:
+    with stage_executor(executor, max_workers) as executor:
+        futures = {}
+        for conversation, events_for_conversation in events_by_conversation.items():
+            future = submit_explanations(
+                executor, model_provider, model_id, data_schema, conversation, events_for_conversation, hedging, on_item
+            )
+            futures[future] = conversation
+
+        return collect_explanations(futures)
+
+
+def submit_explanations(
+    executor: Executor,
+    model_provider: ModelProvider,
+    model_id: str,
+    data_schema: DataSchema,
+    conversation: Conversation,
+    events_for_conversation: List[Event],
+    hedging: Optional[HedgingPolicy] = None,
+    on_item: Optional[Callable[[Event], None]] = None
+) -> Future:
+    """Submit the request for the explanations of one conversation's events."""
+    explanation_generator = ExplanationGenerator(
+        model_provider,
+        model_id,
+        data_schema.assistant,
+        data_schema.event_types,
+        events_for_conversation,
+        conversation
+    )
+    return submit_llm_query(
+        executor,
+        explanation_generator,
+        tracing.wrap(explanation_generator.query),
+        max_retries=2,
+        retry_delay=2,
+        timeout=60,
+        hedging=hedging,
+        on_item=on_item
+    )
+
+
+def collect_explanations(futures: Dict[Future, Conversation]) -> List[Event]:
+    """Wait for the explanation requests, returning the events of the conversations whose requests succeeded."""
+    events = list()
+    for future in tqdm(as_completed(futures), total=len(futures), desc="Generating explanations"):
+        try:
+            events_with_explanations = future.result()
+            events.extend(events_with_explanations)
+        except Exception as e:
+            conversation = futures[future]
+            logger.error(f"Error generating explanation for conversation {conversation.id}: {e}")
+
+    return events
+
+
+def generate_event_properties(
+    model_provider: ModelProvider,
+    model_id: str,
+    data_schema: DataSchema,
+    events: List[Event],
+    max_workers: int = 5,
+    batch_size: int = PROPERTY_BATCH_SIZE,
+    hedging: Optional[HedgingPolicy] = None,
+    on_item: Optional[Callable[[Event], None]] = None,
+    executor: Optional[Executor] = None
+) -> List[Event]:
+    """Fill in property values on the given events in place, batching events of the same type."""
+    with stage_executor(executor, max_workers) as executor:
+        futures = {}
+        event_mapping = {event.message.message_id: i for i, event in enumerate(events)}
+
+        for event_type in data_schema.event_types:
+            events_for_event_type = [event for event in events if event.event_type == event_type]
+            if not events_for_event_type:
+                continue
+
+            # Skip if no properties to process
+            if not event_type.properties:
+                continue
+
+            for event_property in event_type.properties:
+                # Process events in batches
+                for i in range(0, len(events_for_event_type), batch_size):
+                    events_batch = events_for_event_type[i:i + batch_size]
+                    event_property_generator = EventPropertyGenerator(
+                        model_provider,
+                        model_id,
+                        data_schema.assistant,
+                        event_type,
+                        events_batch,
+                        event_property
+                    )
+                    future = submit_llm_query(
+                        executor,
+                        event_property_generator,
+                        tracing.wrap(event_property_generator.query),
+                        max_retries=2,
+                        retry_delay=2,
+                        timeout=60,
+                        hedging=hedging,
+                        on_item=on_item
+                    )
+                    futures[future] = (event_type.name, event_property.name, [event.message.message_id for event in events_batch])
+
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Generating event properties"):
+            try:
+                events_with_property_values = future.result()
+                # Update existing events in events with new property values
+                for updated_event in events_with_property_values:
+                    message_id = updated_event.message.message_id
+                    if message_id in event_mapping:
+                        index = event_mapping[message_id]
+                        # Merge properties instead of replacing the entire event
+                        for prop, prop_value in updated_event.property_values.items():
+                            events[index].property_values[prop] = prop_value
+            except Exception as e:
+                event_type_name, property_name, _ = futures[future]
+                logger.error(f"Error generating property {property_name} for event type {event_type_name}: {e}")
+
+    return events
+
+
+def upload_events(
+    destination: Destination,
+    events: List[Event],
+    llm_judge_scores_by_convo_id: Dict[str, int],
+    max_workers: int = 10,
+    executor: Optional[Executor] = None,
+    delivered: Optional[Set[str]] = None
+) -> Tuple[int, int]:
+    """
+    Send events to the destination and return the number of (sent, failed) events. Events of conversations
+    without a judge score, because judging failed or the conversation wasn't sampled, are sent without one.
+
+    With delivered, events whose insert_id is in it are skipped, and the insert_ids of the events that are
+    sent are added to it.
+    """
+    if delivered is not None:
+        events = [event for event in events if event.insert_id not in delivered]
+    sent, failed = 0, 0
+    with stage_executor(executor, max_workers) as executor:
+        futures= {
+            executor.submit(tracing.wrap(_send_event), destination, event, llm_judge_scores_by_convo_id.get(event.conversation_id)): event for event in events
+        }
+
+        for future in tqdm(as_completed(futures), total=len(events), desc="Uploading events"):
+            try:
+                future.result()
+                sent += 1
+                if delivered is not None:
+                    delivered.add(futures[future].insert_id)
+            except Exception as e:
+                failed += 1
+                logger.error(f"Error sending event: {e}")
+
+    return sent, failed
+
+
+def _send_event(destination: Destination, event: Event, llm_judge_score: Optional[int]):
+    with tracing.span("destination.send_event", destination=type(destination).__name__, event_type=event.event_type.name):
+        destination.send_event(event, llm_judge_score)
+
+
+STAGES = [
+    "llm_judge",
+    "generate_events",
+    "judge_and_generate_events",
+    "generate_explanations",
+    "generate_event_properties",
+    "upload_events"
+]
+
+
+@dataclass
+class PipelineConfig:
+    event_model: str = "gpt-4o"
+    event_property_model: str = "gpt-4.1"
+    explanation_model: str = "gpt-4.1-mini"
+    llm_judge_model: str = "gpt-4.1"
+    max_workers: int = 5
+    # Overrides max_workers for individual stages by name, e.g. {"upload_events": 20}
+    stage_concurrency: Dict[str, int] = field(default_factory=dict)
+    local_tagger: Optional[LocalEventTagger] = None
+    local_tagger_threshold: float = 0.9
+    event_escalation_model: Optional[str] = None
+    llm_judge_escalation_model: Optional[str] = None
+    cascade_min_confidence: float = 0.8
+    combined_judge_events: bool = False
+    # Judges a stratified sample of the conversations instead of all of them. Not used with combined_judge_events,
+    # where every conversation's score comes with its events
+    judge_sampler: Optional[StratifiedJudgeSampler] = None
+    # Clusters the explanations of each event type as they're generated, and uploads each event's cluster as a property
+    explanation_clusterer: Optional[ExplanationClusterer] = None
+    # Whether the clusters are updated with each chunk's explanations, or are a fitted model that only labels them
+    update_explanation_clusters: bool = True
+    # Sends a duplicate of LLM requests that are slower than usual, and uses whichever response arrives first
+    hedging: Optional[HedgingPolicy] = None
+    # Streams responses, passing each event to PipelineHooks.on_item as soon as it's been generated, and requests
+    # each conversation's explanations as soon as its events are complete rather than once every conversation's are
+    stream_responses: bool = False
+
+    def concurrency(self, stage: str) -> int:
+        # Uploads are cheap requests to the destination, so by default they run twice as many at once
+        return self.stage_concurrency.get(stage, 2 * self.max_workers if stage == "upload_events" else self.max_workers)
+
+
+@dataclass
+class PipelineResult:
+    conversations: List[Conversation] = field(default_factory=list)
+    events: List[Event] = field(default_factory=list)
+    llm_judge_scores_by_convo_id: Dict[str, int] = field(default_factory=dict)
+    sent: int = 0
+    failed: int = 0
+    # The requests of each stage that failed, whose conversations or events were dropped or left incomplete
+    stage_failures: Dict[str, int] = field(default_factory=dict)
+
+    def merge(self, other: PipelineResult):
+        self.conversations.extend(other.conversations)
+        self.events.extend(other.events)
+        self.llm_judge_scores_by_convo_id.update(other.llm_judge_scores_by_convo_id)
+        self.sent += other.sent
+        self.failed += other.failed
+        for stage, failures in other.stage_failures.items():
+            self.stage_failures[stage] = self.stage_failures.get(stage, 0) + failures
+
+
+class PipelineHooks:
+    """Callbacks a Pipeline makes as it runs. Override the ones you need."""
+
+    def on_stage_start(self, stage: str):
+        pass
+
+    def on_stage_end(self, stage: str, seconds: float):
+        pass
+
+    def on_item(self, stage: str, event: Event):
+        """
+        With stream_responses, called from the stage's worker threads with each event as soon as its event type
+        (generate_events, judge_and_generate_events), explanation (generate_explanations) or property value
+        (generate_event_properties) has been generated, before the rest of the response. The event is a copy;
+        the pipeline's own events are only updated once the whole response is valid, so a failed attempt
+        doesn't leave a partial result on them, and later stages don't change the copies already passed. If a
+        retried attempt generates a different value for a message, its event is passed again with that value.
+        """
+        pass
+
+    def on_result(self, result: PipelineResult):
+        """Called once the events of each chunk of conversations have been delivered to the destination."""
+        pass
+
+
+class Pipeline:
+    """
+    Judges conversations, generates their events, explanations and property values, and sends the events to
+    the destination.
+
+    A pipeline keeps its model provider, destination and executors between runs, so a service can create one
+    and reuse its warm clients and connections for every batch of conversations. Each stage gets its own
+    executor, created on first use by the executor factory: "threads", "asyncio" or any callable that takes
+    the stage's concurrency and returns a concurrent.futures.Executor. Alternatively, an executor such as a
+    PriorityScheduler can be shared by every stage; it belongs to the caller, so it isn't shut down on close.
+    """
+
+    def __init__(
+        self,
+        model_provider: ModelProvider,
+        data_schema: DataSchema,
+        destination: Destination,
+        source: Optional[Source] = None,
+        config: Optional[PipelineConfig] = None,
+        executor: Union[str, Callable[[int], Executor], Executor] = "threads",
+        hooks: Optional[PipelineHooks] = None
+    ):
+        self.model_provider = model_provider
+        self.data_schema = data_schema
+        self.destination = destination
+        self.source = source
+        self.config = config or PipelineConfig()
+        self.shared_executor = executor if isinstance(executor, Executor) else None
+        self.executor_factory = EXECUTORS[executor] if isinstance(executor, str) else executor
+        self.hooks = hooks or PipelineHooks()
+        self._executors: Dict[str, Executor] = {}
+        self._executors_lock = threading.Lock()
+
+    def __enter__(self) -> Pipeline:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shut down the stage executors. The pipeline can still be run afterwards, starting new ones."""
+        with self._executors_lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown()
+
+    def run(
+        self, conversations: Optional[List[Conversation]] = None, chunk_size: Optional[int] = None, delivered: Optional[Set[str]] = None
+    ) -> PipelineResult:
+        """Process the conversations, or all of the source's conversations, and return the combined result."""
+        result = PipelineResult()
+        for chunk_result in self.iter_results(conversations, chunk_size, delivered):
+            result.merge(chunk_result)
+        return result
+
+    async def run_async(self, conversations: Optional[List[Conversation]] = None, chunk_size: Optional[int] = None) -> PipelineResult:
+        """Run the pipeline without blocking the calling event loop."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, conversations, chunk_size)
+
+    def iter_results(
+        self, conversations: Optional[List[Conversation]] = None, chunk_size: Optional[int] = None, delivered: Optional[Set[str]] = None
+    ) -> Iterator[PipelineResult]:
+        """
+        Process the conversations chunk_size at a time (all at once by default), yielding each chunk's result
+        once its events have been delivered to the destination.
+
+        delivered is the set of insert_ids of events that were already delivered, e.g. by an earlier attempt at
+        the same conversations. Those events aren't sent again, and the ones delivered now are added to it.
+        """
+        if conversations is None:
+            if self.source is None:
+                raise ValueError("Pipeline needs either conversations or a source to load them from")
+            conversations = self.source.get_conversations()
+
+        chunk_size = chunk_size or max(len(conversations), 1)
+        for i in range(0, len(conversations), chunk_size):
+            result = self.process(conversations[i:i + chunk_size], delivered)
+            try:
+                self.destination.flush()
+            except DeliveryError as e:
+                logger.error(f"{len(e.failed)} events weren't delivered: {e}")
+                result.sent -= len(e.failed)
+                result.failed += len(e.failed)
+                if delivered is not None:
+                    delivered.difference_update(e.failed)
+            self.hooks.on_result(result)
+            yield result
+
+    def process(self, conversations: List[Conversation], delivered: Optional[Set[str]] = None) -> PipelineResult:
+        """Run every stage over the conversations and upload the events, without waiting for the destination to flush."""
+        config = self.config
+        result = PipelineResult(conversations=list(conversations))
+
+        if config.stream_responses:
+            # Each conversation's explanations are requested as soon as its events are complete, so the explanation
+            # stage overlaps event generation instead of waiting for every conversation's events
+            logger.info("Generating events and their explanations")
+            with self._stage("generate_explanations") as explanation_executor:
+                futures, explaining = {}, set()
+
+                def explain(conversation: Conversation, events_for_conversation: List[Event]):
+                    # Like events_by_conversation, a conversation that's passed in more than once is explained once
+                    if conversation in explaining:
+                        return
+                    explaining.add(conversation)
+                    futures[submit_explanations(
+                        explanation_executor, self.model_provider, config.explanation_model, self.data_schema, conversation,
+                        events_for_conversation, config.hedging, self._on_item("generate_explanations")
+                    )] = conversation
+
+                events_by_conversation = self._generate_events(conversations, result, on_conversation=explain)
+                result.events = collect_explanations(futures)
+        else:
+            events_by_conversation = self._generate_events(conversations, result)
+            logger.info("Generating event explanations")
+            with self._stage("generate_explanations") as executor:
+                result.events = generate_explanations(
+                    self.model_provider, config.explanation_model, self.data_schema, events_by_conversation,
+                    hedging=config.hedging, on_item=self._on_item("generate_explanations"), executor=executor
+                )
+        explained = {event.conversation_id for event in result.events}
+        result.stage_failures["generate_explanations"] = sum(
+            1 for conversation, events in events_by_conversation.items() if events and conversation.id not in explained
+        )
+
+        logger.info("Generating event property values. Number of events: %d", len(result.events))
+        with self._stage("generate_event_properties", events=len(result.events)) as executor:
+            generate_event_properties(
+                self.model_provider, config.event_property_model, self.data_schema, result.events,
+                hedging=config.hedging, on_item=self._on_item("generate_event_properties"), executor=executor
+            )
+        result.stage_failures["generate_event_properties"] = sum(
+            1 for event in result.events if any(event_property.name not in event.property_values for event_property in event.event_type.properties)
+        )
+
+        if config.explanation_clusterer:
+            logger.info("Clustering event explanations")
+            self.hooks.on_stage_start("cluster_explanations")
+            start = time.perf_counter()
+            with tracing.span("pipeline.cluster_explanations", events=len(result.events)):
+                if config.update_explanation_clusters:
+                    config.explanation_clusterer.partial_fit(result.events)
+                config.explanation_clusterer.label(result.events)
+            self.hooks.on_stage_end("cluster_explanations", time.perf_counter() - start)
+
+        logger.info(f"Uploading events")
+        with self._stage("upload_events", events=len(result.events)) as executor:
+            result.sent, result.failed = upload_events(
+                self.destination, result.events, result.llm_judge_scores_by_convo_id, executor=executor, delivered=delivered
+            )
+
+        return result
+
+    def _generate_events(
+        self, conversations: List[Conversation], result: PipelineResult,
+        on_conversation: Optional[Callable[[Conversation, List[Event]], None]] = None
+    ) -> Dict[Conversation, List[Event]]:
+        """Generate the conversations' events and judge them, recording the judge scores and stage failures in the result."""
+        config = self.config
+        if config.combined_judge_events:
+            logger.info("Judging conversations and generating events")
+            with self._stage("judge_and_generate_events", conversations=len(conversations)) as executor:
+                result.llm_judge_scores_by_convo_id, events_by_conversation = judge_and_generate_events(
+                    self.model_provider, config.event_model, self.data_schema, conversations, config.max_workers,
+                    config.local_tagger, config.local_tagger_threshold, config.event_escalation_model, config.cascade_min_confidence,
+                    hedging=config.hedging, on_item=self._on_item("judge_and_generate_events"), executor=executor,
+                    on_conversation=on_conversation
+                )
+            result.stage_failures["judge_and_generate_events"] = len(conversations) - len(events_by_conversation)
+        else:
+            if not config.judge_sampler:
+                logger.info("Performing LLM-as-a-judge on conversations")
+                result.llm_judge_scores_by_convo_id = self._judge(conversations)
+                result.stage_failures["llm_judge"] = len(conversations) - len(result.llm_judge_scores_by_convo_id)
+
+            logger.info("Generating events")
+            with self._stage("generate_events", conversations=len(conversations)) as executor:
+                events_by_conversation = generate_events(
+                    self.model_provider, config.event_model, self.data_schema, conversations, config.max_workers,
+                    config.local_tagger, config.local_tagger_threshold, config.event_escalation_model, config.cascade_min_confidence,
+                    hedging=config.hedging, on_item=self._on_item("generate_events"), executor=executor,
+                    on_conversation=on_conversation
+                )
+            result.stage_failures["generate_events"] = len(conversations) - len(events_by_conversation)
+
+            if config.judge_sampler:
+                # Conversations are stratified by their events, so the sample is drawn once they've been tagged
+                sample = config.judge_sampler.sample(conversations, events_by_conversation)
+                logger.info(f"Performing LLM-as-a-judge on a stratified sample of {len(sample.conversations)}/{len(conversations)} conversations")
+                llm_judge_scores_by_convo_id = self._judge(sample.conversations)
+                result.stage_failures["llm_judge"] = len(sample.conversations) - len(llm_judge_scores_by_convo_id)
+                result.llm_judge_scores_by_convo_id = config.judge_sampler.record(sample, llm_judge_scores_by_convo_id)
+
+        return events_by_conversation
+
+    def executor(self, stage: str) -> Executor:
+        """The executor for a stage, started with the stage's concurrency on first use."""
+        if self.shared_executor:
+            return self.shared_executor
+        with self._executors_lock:
+            if stage not in self._executors:
+                self._executors[stage] = self.executor_factory(self.config.concurrency(stage))
+            return self._executors[stage]
+
+    def _judge(self, conversations: List[Conversation]) -> Dict[str, int]:
+        config = self.config
+        with self._stage("llm_judge", conversations=len(conversations)) as executor:
+            return run_llm_judge(
+                self.model_provider, config.llm_judge_model, self.data_schema, conversations, config.max_workers,
+                config.llm_judge_escalation_model, config.cascade_min_confidence,
+                hedging=config.hedging, executor=executor
+            )
+
+    def _on_item(self, stage: str) -> Optional[Callable[[Event], None]]:
+        return functools.partial(self.hooks.on_item, stage) if self.config.stream_responses else None
+
+    @contextmanager
+    def _stage(self, stage: str, **attributes) -> Iterator[Executor]:
+        self.hooks.on_stage_start(stage)
+        start = time.perf_counter()
+        with tracing.span(f"pipeline.{stage}", **attributes):
+            yield self.executor(stage)
+        self.hooks.on_stage_end(stage, time.perf_counter() - start)
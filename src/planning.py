@@ -0,0 +1,375 @@
+from collections import defaultdict
+from dataclasses import dataclass, field, fields
+import json
+import logging
+import math
+import random
+from typing import Dict, List, Optional, Sequence
+
+import yaml
+
+from llm_queries.llm_query import LLMQuery
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class ModelProfile:
+    # USD per million tokens, or None if unknown
+    input_per_million: Optional[float] = None
+    output_per_million: Optional[float] = None
+    # The account's rate limits for the model, or None for no limit
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+    output_tokens_per_second: float = 80.0
+    # Seconds before the first output token of a request
+    base_latency: float = 0.5
+    # Hidden reasoning tokens per request, billed and generated as output tokens
+    reasoning_tokens: int = 0
+
+
+# List prices and typical speeds, with example rate limits of a mid-tier account. Model ids are matched by their
+# longest prefix here, so dated versions such as claude-sonnet-4-20250514 share their model's profile. Override
+# them for your account with --plan-models.
+MODEL_PROFILES: Dict[str, ModelProfile] = {
+    "gpt-4o": ModelProfile(2.50, 10.00, 10000, 2000000, 80),
+    "gpt-4o-mini": ModelProfile(0.15, 0.60, 30000, 10000000, 100),
+    "gpt-4.1": ModelProfile(2.00, 8.00, 10000, 2000000, 80),
+    "gpt-4.1-mini": ModelProfile(0.40, 1.60, 30000, 10000000, 100),
+    "gpt-4.1-nano": ModelProfile(0.10, 0.40, 30000, 10000000, 150),
+    "o3": ModelProfile(2.00, 8.00, 10000, 2000000, 60, base_latency=2.0, reasoning_tokens=2000),
+    "o4-mini": ModelProfile(1.10, 4.40, 10000, 2000000, 100, base_latency=2.0, reasoning_tokens=2000),
+    "claude-3-5-haiku": ModelProfile(0.80, 4.00, 4000, 400000, 60),
+    "claude-3-7-sonnet": ModelProfile(3.00, 15.00, 4000, 2000000, 60),
+    "claude-sonnet-4": ModelProfile(3.00, 15.00, 4000, 2000000, 60),
+    "claude-opus-4": ModelProfile(15.00, 75.00, 4000, 2000000, 40)
+}
+
+
+def load_model_profiles(path: Optional[str] = None) -> Dict[str, ModelProfile]:
+    """
+    The default profiles, updated from a YAML mapping of model id to profile fields, e.g.
+    {"gpt-4o": {"requests_per_minute": 500, "tokens_per_minute": 30000}}. New model ids are added.
+    """
+    profiles = dict(MODEL_PROFILES)
+    if path:
+        with open(path) as f:
+            overrides = yaml.safe_load(f) or {}
+        names = {f.name for f in fields(ModelProfile)}
+        for model_id, values in overrides.items():
+            unknown = set(values) - names
+            if unknown:
+                raise ValueError(f"Unknown model profile fields {sorted(unknown)} for {model_id}, expected some of {sorted(names)}")
+            base = profiles.get(model_id, ModelProfile())
+            profiles[model_id] = ModelProfile(**{**base.__dict__, **values})
+    return profiles
+
+
+def model_profile(model_id: str, profiles: Dict[str, ModelProfile]) -> ModelProfile:
+    matches = [prefix for prefix in profiles if model_id.startswith(prefix)]
+    if not matches:
+        logger.warning(f"No price or rate limit profile for model {model_id}, so its cost is unknown and its requests aren't rate limited")
+        return ModelProfile()
+    return profiles[max(matches, key=len)]
+
+
+class TokenCounter:
+    """
+    Counts tokens with the model's tiktoken encoding when tiktoken is installed, falling back to about four
+    characters per token for other models or without tiktoken.
+    """
+
+    def __init__(self, num_threads: int = 8):
+        self.num_threads = num_threads
+        self._encodings = {}
+
+    def encoding(self, model_id: str):
+        if model_id not in self._encodings:
+            self._encodings[model_id] = self._load_encoding(model_id)
+        return self._encodings[model_id]
+
+    def tokenizer(self, model_id: str) -> str:
+        encoding = self.encoding(model_id)
+        return encoding.name if encoding is not None else "chars/4"
+
+    def count(self, texts: List[str], model_id: str) -> List[int]:
+        encoding = self.encoding(model_id)
+        if encoding is None:
+            return [len(text) // 4 + 1 for text in texts]
+        return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts, num_threads=self.num_threads)]
+
+    @staticmethod
+    def _load_encoding(model_id: str):
+        try:
+            # Optional, and only needed for planning
+            import tiktoken
+        except ImportError:
+            return None
+        try:
+            return tiktoken.encoding_for_model(model_id)
+        except KeyError:
+            # Newer OpenAI models than the installed tiktoken knows about use its latest encoding
+            return tiktoken.get_encoding("o200k_base") if model_id.startswith(("gpt-", "o1", "o3", "o4")) else None
+
+
+def estimate_output_tokens(schema: Dict, free_text_tokens: int = 40, array_items: int = 5) -> int:
+    """
+    The tokens of a typical response matching a JSON schema: the longest enum choice, free_text_tokens for
+    other strings and array_items items for arrays, plus the keys and punctuation of objects.
+    """
+    schema_type = schema.get("type")
+    if "enum" in schema:
+        return max((len(str(choice)) // 4 + 1 for choice in schema["enum"]), default=1) + 1
+    if schema_type == "object":
+        return 2 + sum(
+            len(key) // 4 + 3 + estimate_output_tokens(value, free_text_tokens, array_items)
+            for key, value in schema.get("properties", {}).items()
+        )
+    if schema_type == "array":
+        return 2 + array_items * (estimate_output_tokens(schema.get("items", {}), free_text_tokens, array_items) + 1)
+    if schema_type == "string":
+        return free_text_tokens
+    if schema_type in ("number", "integer"):
+        return 3
+    return 1
+
+
+@dataclass
+class StagePlan:
+    stage: str
+    model_id: str
+    tokenizer: str
+    requests: int
+    input_tokens: int
+    output_tokens: int
+    cost: Optional[float]
+    concurrency: int
+    seconds: float
+    # What the stage's duration is bound by: concurrency, requests_per_minute, tokens_per_minute or longest_request
+    limited_by: str
+
+
+def plan_stage(
+    stage: str,
+    model_id: str,
+    queries: Sequence[LLMQuery],
+    concurrency: int,
+    counter: TokenCounter,
+    profiles: Dict[str, ModelProfile],
+    scale: float = 1.0,
+    requests: Optional[int] = None
+) -> StagePlan:
+    """
+    Estimate a stage from its queries' prompts and response schemas, built locally without being sent. When the
+    queries are built from a sample, scale extrapolates their tokens and latency, and requests overrides their count.
+    """
+    profile = model_profile(model_id, profiles)
+    schemas = [query.response_schema() for query in queries]
+    # The response schema is sent with the prompt, as a structured output format or tool definition
+    input_counts = counter.count([query.generate_prompt() + json.dumps(schema) for query, schema in zip(queries, schemas)], model_id)
+    output_counts = [estimate_output_tokens(schema) + profile.reasoning_tokens for schema in schemas]
+    latencies = [profile.base_latency + output_tokens / profile.output_tokens_per_second for output_tokens in output_counts]
+
+    requests = round(len(queries) * scale) if requests is None else requests
+    input_tokens = round(sum(input_counts) * scale)
+    output_tokens = round(sum(output_counts) * scale)
+    cost = None
+    if profile.input_per_million is not None and profile.output_per_million is not None:
+        cost = round((input_tokens * profile.input_per_million + output_tokens * profile.output_per_million) / 1e6, 2)
+
+    bounds = {
+        "concurrency": sum(latencies) * scale / concurrency,
+        "longest_request": max(latencies, default=0.0),
+        "requests_per_minute": 60 * requests / profile.requests_per_minute if profile.requests_per_minute else 0.0,
+        "tokens_per_minute": 60 * (input_tokens + output_tokens) / profile.tokens_per_minute if profile.tokens_per_minute else 0.0
+    }
+    limited_by = max(bounds, key=bounds.get)
+    return StagePlan(
+        stage, model_id, counter.tokenizer(model_id), requests, input_tokens, output_tokens, cost,
+        concurrency, round(bounds[limited_by], 1), limited_by
+    )
+
+
+@dataclass
+class Plan:
+    stages: List[StagePlan] = field(default_factory=list)
+    conversations: int = 0
+    # The conversations the prompts were built from, when there were too many to build them all
+    sampled_conversations: Optional[int] = None
+    notes: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        costs = [stage.cost for stage in self.stages]
+        by_model = defaultdict(lambda: {"requests": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0})
+        for stage in self.stages:
+            totals = by_model[stage.model_id]
+            totals["requests"] += stage.requests
+            totals["input_tokens"] += stage.input_tokens
+            totals["output_tokens"] += stage.output_tokens
+            totals["cost"] = round(totals["cost"] + stage.cost, 2) if stage.cost is not None and totals["cost"] is not None else None
+
+        return {
+            "conversations": self.conversations,
+            "sampled_conversations": self.sampled_conversations,
+            "stages": [stage.__dict__ for stage in self.stages],
+            "by_model": dict(by_model),
+            "requests": sum(stage.requests for stage in self.stages),
+            "input_tokens": sum(stage.input_tokens for stage in self.stages),
+            "output_tokens": sum(stage.output_tokens for stage in self.stages),
+            "cost": round(sum(costs), 2) if None not in costs else None,
+            # Stages run one after another
+            "makespan_seconds": round(sum(stage.seconds for stage in self.stages), 1),
+            "notes": self.notes
+        }
+
+    def format(self) -> str:
+        summary = self.to_dict()
+        rows = [("stage", "model", "requests", "input tokens", "output tokens", "cost ($)", "duration", "limited by")]
+        for stage in self.stages:
+            rows.append((
+                stage.stage, stage.model_id, f"{stage.requests:,}", f"{stage.input_tokens:,}", f"{stage.output_tokens:,}",
+                "?" if stage.cost is None else f"{stage.cost:,.2f}", _duration(stage.seconds), stage.limited_by
+            ))
+        rows.append((
+            "total", "", f"{summary['requests']:,}", f"{summary['input_tokens']:,}", f"{summary['output_tokens']:,}",
+            "?" if summary["cost"] is None else f"{summary['cost']:,.2f}", _duration(summary["makespan_seconds"]), ""
+        ))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = [f"Plan for {self.conversations:,} conversations" + (
+            f" (prompts built from a sample of {self.sampled_conversations:,})" if self.sampled_conversations else ""
+        )]
+        lines += ["  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
+        lines += [f"Note: {note}" for note in self.notes]
+        return "\n".join(lines)
+
+
+def _duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    hours, minutes = divmod(round(seconds / 60), 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m"
+
+
+def sample_for_planning(items: List, sample_size: Optional[int], seed: int = 42):
+    """A uniform random sample of at most sample_size items and the factor that scales the sample's totals up to all items."""
+    if not sample_size or len(items) <= sample_size:
+        return list(items), 1.0
+    return random.Random(seed).sample(items, sample_size), len(items) / sample_size
+
+
+def scaled_batches(num_items: int, scale: float, batch_size: int) -> int:
+    return math.ceil(num_items * scale / batch_size) if num_items else 0
+
+
+def _placeholder_events(conversation, event_types, explanation_tokens: int) -> list:
+    """An event for every message, as the event stage tags each one, with an event type picked uniformly from its role's."""
+    from models.event import Event
+    from sharding import shard_hash
+
+    events = []
+    for message in conversation.messages:
+        candidates = [event_type for event_type in event_types if event_type.role == message.role] or event_types
+        events.append(Event(
+            user_id=conversation.user_id,
+            event_type=candidates[shard_hash(f"{conversation.id}/{message.message_id}") % len(candidates)],
+            conversation_id=conversation.id,
+            message=message,
+            explanation="word " * explanation_tokens
+        ))
+    return events
+
+
+def plan_pipeline(
+    data_schema,
+    conversations: List,
+    config,
+    counter: TokenCounter,
+    profiles: Dict[str, ModelProfile],
+    sample_size: Optional[int] = 20000
+) -> Plan:
+    """
+    Plan every stage of a pipeline run with the given PipelineConfig by building its requests' prompts locally.
+
+    Event types are unknown until the events are generated, so the explanation and property stages are planned
+    with an event for every message, its type picked uniformly from the event types of the message's role. With
+    more than sample_size conversations, prompts are built for a random sample and its totals scaled up.
+    """
+    from llm_queries.event_generator import EventGenerator
+    from llm_queries.event_property_generator import EventPropertyGenerator
+    from llm_queries.explanation_generator import ExplanationGenerator
+    from llm_queries.judged_event_generator import JudgedEventGenerator
+    from llm_queries.llm_judge import LLMJudge
+    from pipeline import PROPERTY_BATCH_SIZE
+
+    sample, scale = sample_for_planning(conversations, sample_size)
+    plan = Plan(conversations=len(conversations), sampled_conversations=len(sample) if scale > 1 else None)
+    assistant, event_types = data_schema.assistant, data_schema.event_types
+
+    pretagged = {}
+    if config.local_tagger:
+        pretagged = {conversation: config.local_tagger.pretag(conversation.messages, config.local_tagger_threshold) for conversation in sample}
+
+    def event_generators(generator_class, *args):
+        generators = [
+            generator_class(None, config.event_model, assistant, *args, event_types, conversation, pretagged=pretagged.get(conversation))
+            for conversation in sample
+        ]
+        # Conversations the local tagger tags entirely aren't sent to the event model
+        return [generator for generator in generators if generator.untagged_messages]
+
+    if config.combined_judge_events:
+        plan.stages.append(plan_stage(
+            "judge_and_generate_events", config.event_model,
+            event_generators(JudgedEventGenerator, data_schema.llm_judge_criteria),
+            config.concurrency("judge_and_generate_events"), counter, profiles, scale
+        ))
+    else:
+        judged = sample
+        if config.judge_sampler:
+            # Without events, the sample is stratified by the other dimensions only
+            judged = config.judge_sampler.sample(sample, {}).conversations
+        plan.stages.append(plan_stage(
+            "llm_judge", config.llm_judge_model,
+            [LLMJudge(None, config.llm_judge_model, assistant, data_schema.llm_judge_criteria, conversation) for conversation in judged],
+            config.concurrency("llm_judge"), counter, profiles, scale
+        ))
+        plan.stages.append(plan_stage(
+            "generate_events", config.event_model, event_generators(EventGenerator),
+            config.concurrency("generate_events"), counter, profiles, scale
+        ))
+
+    events_by_conversation = {conversation: _placeholder_events(conversation, event_types, 40) for conversation in sample}
+    plan.stages.append(plan_stage(
+        "generate_explanations", config.explanation_model,
+        [
+            ExplanationGenerator(None, config.explanation_model, assistant, event_types, events, conversation)
+            for conversation, events in events_by_conversation.items()
+        ],
+        config.concurrency("generate_explanations"), counter, profiles, scale
+    ))
+
+    events_by_type = defaultdict(list)
+    for events in events_by_conversation.values():
+        for event in events:
+            events_by_type[event.event_type].append(event)
+    property_generators, property_requests = [], 0
+    for event_type, events in events_by_type.items():
+        for event_property in event_type.properties:
+            property_requests += scaled_batches(len(events), scale, PROPERTY_BATCH_SIZE)
+            for i in range(0, len(events), PROPERTY_BATCH_SIZE):
+                property_generators.append(EventPropertyGenerator(
+                    None, config.event_property_model, assistant, event_type, events[i:i + PROPERTY_BATCH_SIZE], event_property
+                ))
+    plan.stages.append(plan_stage(
+        "generate_event_properties", config.event_property_model, property_generators,
+        config.concurrency("generate_event_properties"), counter, profiles, scale, requests=property_requests
+    ))
+
+    plan.notes.append("Explanation and property requests assume every message is tagged, with event types spread evenly within each role")
+    if config.event_escalation_model or config.llm_judge_escalation_model:
+        plan.notes.append("Cascade escalations to larger models aren't included")
+    if counter.tokenizer(config.event_model) == "chars/4":
+        plan.notes.append("Tokens are estimated at four characters each; install tiktoken to count OpenAI tokens exactly")
+    return plan
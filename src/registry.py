@@ -0,0 +1,151 @@
+import logging
+import os
+from typing import Callable, Dict, List
+
+from clients import HttpPoolConfig
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class Registry:
+    """
+    Named factories for the model providers and destinations a run can select.
+
+    Each factory imports the SDK it needs when it's called, so a run only pays the (often substantial)
+    import cost of the provider and destination it actually uses.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.factories: Dict[str, Callable] = {}
+
+    def register(self, name: str):
+        def decorator(factory: Callable) -> Callable:
+            self.factories[name] = factory
+            return factory
+        return decorator
+
+    def names(self) -> List[str]:
+        return list(self.factories)
+
+    def create(self, name: str, args):
+        """Build the named implementation from the parsed command line arguments."""
+        if name not in self.factories:
+            raise ValueError(f"Unknown {self.kind} {name}, expected one of {self.names()}")
+        return self.factories[name](args)
+
+
+model_providers = Registry("model provider")
+destinations = Registry("destination")
+
+
+def http_pool_config(args) -> HttpPoolConfig:
+    # Every stage runs up to max_concurrency requests at once, and the upload stage twice that
+    return HttpPoolConfig(
+        max_connections=args.http_pool_size or 2 * args.max_concurrency,
+        http2=args.http2,
+        keepalive_expiry=args.http_keepalive_expiry
+    )
+
+
+@model_providers.register("openai")
+def openai_model_provider(args):
+    from clients import openai_client
+    from llm_queries.llm_query import OpenAIModelProvider
+
+    return OpenAIModelProvider(openai_client(http_pool_config(args)))
+
+
+@model_providers.register("anthropic")
+def anthropic_model_provider(args):
+    from clients import anthropic_client
+    from llm_queries.llm_query import AnthropicModelProvider
+
+    return AnthropicModelProvider(anthropic_client(http_pool_config(args)))
+
+
+@model_providers.register("bedrock")
+def bedrock_model_provider(args):
+    from clients import boto3_client
+    from llm_queries.llm_query import BedrockModelProvider
+
+    return BedrockModelProvider(boto3_client("bedrock-runtime", http_pool_config(args)))
+
+
+@model_providers.register("replay")
+def replay_model_provider(args):
+    from llm_queries.replay_model_provider import ReplayModelProvider
+
+    return ReplayModelProvider(
+        args.replay_fixtures_path,
+        base_latency=args.replay_latency,
+        seconds_per_input_token=args.replay_seconds_per_input_token,
+        seconds_per_output_token=args.replay_seconds_per_output_token,
+        jitter=args.replay_jitter,
+        error_rate=args.replay_error_rate,
+        record_provider=model_providers.create(args.replay_record_provider, args) if args.replay_record_provider else None
+    )
+
+
+@destinations.register("amplitude")
+def amplitude_destination(args):
+    from clients import amplitude_client
+    from destinations.amplitude import AmplitudeDestination
+
+    logger.info("Using Amplitude destination")
+    # The client reports the outcome of every event to the destination, which wraps the client
+    destination = AmplitudeDestination(amplitude_client=amplitude_client(
+        os.getenv("AMPLITUDE_API_KEY"),
+        flush_queue_size=args.amplitude_flush_queue_size,
+        flush_interval_millis=args.amplitude_flush_interval_millis,
+        callback=lambda event, code, message: destination.record_delivery(event, code, message)
+    ))
+    return destination
+
+
+@destinations.register("posthog")
+def posthog_destination(args):
+    from clients import posthog_client
+    from destinations.posthog import PosthogDestination
+
+    logger.info("Using Posthog destination")
+    # The client's consumer threads report the batches they gave up on to the destination, which wraps the client
+    destination = PosthogDestination(posthog_client=posthog_client(
+        os.getenv("POSTHOG_API_KEY"),
+        os.getenv("POSTHOG_HOST"),
+        threads=args.posthog_threads,
+        max_queue_size=args.posthog_max_queue_size,
+        on_error=lambda error, batch: destination.record_error(error, batch)
+    ))
+    return destination
+
+
+@destinations.register("jsonl")
+def jsonl_destination(args):
+    from destinations.jsonl import JsonlDestination
+
+    logger.info(f"Writing events to {args.destination_path}")
+    return JsonlDestination(args.destination_path)
+
+
+@destinations.register("parquet")
+def parquet_destination(args):
+    from destinations.parquet import ParquetDestination
+
+    logger.info(f"Writing events to the Parquet dataset {args.destination_path}")
+    return ParquetDestination(
+        args.destination_path,
+        row_group_size=args.parquet_row_group_size,
+        compression=args.parquet_compression,
+        partition_by=args.parquet_partition_by.split(",") if args.parquet_partition_by else []
+    )
+
+
+@destinations.register("duckdb")
+def duckdb_destination(args):
+    from destinations.duckdb import DuckDBDestination
+
+    logger.info(f"Writing events to the {args.duckdb_table} table of {args.destination_path}")
+    return DuckDBDestination(args.destination_path, table=args.duckdb_table, batch_size=args.parquet_row_group_size)
@@ -0,0 +1,49 @@
+import argparse
+import logging
+
+# Configure root logger to WARNING to silence third-party libraries
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+from destinations.outbox import OutboxDestination
+from registry import destinations
+from upload_events import add_destination_arguments
+
+# Set loggers within this application to INFO
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+logging.getLogger('amplitude').setLevel(logging.WARNING)
+
+
+def replay(args) -> dict:
+    """Redeliver the events left in an outbox by upload_events.py or ingest_worker.py, without any LLM queries."""
+    outbox = OutboxDestination(
+        destinations.create(args.destination, args),
+        args.outbox_path,
+        batch_size=args.outbox_batch_size,
+        max_attempts=args.outbox_max_attempts
+    )
+    requeued = outbox.requeue(include_delivered=args.include_delivered)
+    logger.info(f"Redelivering {requeued} events from {args.outbox_path}")
+
+    outbox.flush()
+    counts = outbox.counts()
+    outbox.close()
+
+    logger.info(f"Outbox now has {counts.get('delivered', 0)} delivered, {counts.get('pending', 0)} pending and {counts.get('dead', 0)} dead events")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Redeliver undelivered events from an outbox")
+    parser.add_argument("--outbox-path", type=str, required=True)
+    add_destination_arguments(parser)
+    parser.add_argument("--include-delivered", action="store_true", help="Also redeliver events that were already delivered, e.g. to backfill a new destination")
+    parser.add_argument("--outbox-batch-size", type=int, default=100, help="Events delivered from the outbox per batch")
+    parser.add_argument("--outbox-max-attempts", type=int, default=8, help="Attempts to deliver a batch, with exponential backoff, before giving up on its events")
+    args = parser.parse_args()
+
+    replay(args)
@@ -0,0 +1,148 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import json
+import logging
+from typing import List, Optional
+
+# Configure root logger to WARNING to silence third-party libraries
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+import yaml
+
+from registry import model_providers
+from scheduler import FairShareScheduler
+import tracing
+from upload_events import add_client_arguments, add_replay_arguments, build_model_provider, build_parser, check_args, run
+
+# Set loggers within this application to INFO
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# upload_events.py flags that run_tenants.py sets once for every tenant, since they share one provider and pool
+SHARED_FLAGS = ("model-provider", "executor", "tokens-per-minute", "num-workers")
+
+
+@dataclass
+class Tenant:
+    name: str
+    # upload_events.py arguments, the manifest's defaults followed by the tenant's own
+    argv: List[str]
+    args: argparse.Namespace
+    weight: float = 1.0
+    max_concurrency: Optional[int] = None
+
+
+def load_manifest(path: str) -> List[Tenant]:
+    """
+    Read the tenants from a YAML manifest. Every key of a tenant other than name and weight is an
+    upload_events.py flag without its leading dashes, with the manifest's defaults applying to every tenant. A
+    tenant's max-concurrency is its quota of concurrent requests in the shared pool.
+
+    Every tenant's flags are parsed here, so a mistake in any of them is reported before any tenant starts.
+    """
+    with open(path) as f:
+        manifest = yaml.safe_load(f)
+
+    defaults = manifest.get("defaults", {})
+    tenants = []
+    for entry in manifest["tenants"]:
+        entry = dict(entry)
+        name = entry.pop("name")
+        weight = float(entry.pop("weight", 1.0))
+        flags = {**defaults, **entry}
+        if any(tenant.name == name for tenant in tenants):
+            raise ValueError(f"Duplicate tenant name {name} in {path}")
+        shared = [flag for flag in SHARED_FLAGS if flag in flags]
+        if shared:
+            raise ValueError(f"Tenant {name} in {path} sets {shared}, which only the run_tenants.py command line sets, for every tenant")
+
+        argv = _to_argv(flags)
+        try:
+            parser = build_parser()
+            args = parser.parse_args(argv)
+            check_args(parser, args)
+        except SystemExit:
+            # argparse has already printed what's wrong
+            raise ValueError(f"Invalid upload_events.py flags for tenant {name} in {path}") from None
+        tenants.append(Tenant(name, argv, args, weight, flags.get("max-concurrency")))
+    return tenants
+
+
+def _to_argv(flags: dict) -> List[str]:
+    argv = []
+    for flag, value in flags.items():
+        if value is True:
+            argv.append(f"--{flag}")
+        elif value is False:
+            argv.append(f"--no-{flag}")
+        elif isinstance(value, list):
+            for item in value:
+                argv.extend([f"--{flag}", str(item)])
+        elif value is not None:
+            argv.extend([f"--{flag}", str(value)])
+    return argv
+
+
+def run_tenant(tenant: Tenant, model_provider, scheduler: FairShareScheduler) -> dict:
+    # Tracing is configured once for the whole run
+    tenant.args.trace_path = None
+    try:
+        executor = scheduler.tenant(tenant.name, tenant.weight, tenant.max_concurrency)
+        summary = run(tenant.args, model_provider=model_provider, executor=executor)
+    except Exception as e:
+        logger.error(f"Tenant {tenant.name} failed: {e}")
+        return {"tenant": tenant.name, "error": str(e)}
+    logger.info(f"Tenant {tenant.name}: sent {summary['events_sent']} events for {summary['conversations']} conversations")
+    return {"tenant": tenant.name, **summary}
+
+
+def run_tenants(args) -> dict:
+    """Run every tenant of the manifest at once, sharing one model provider and a fair-share pool of request workers."""
+    tenants = load_manifest(args.manifest)
+    if args.trace_path:
+        tracing.configure(args.trace_path, service_name="run_tenants")
+
+    model_provider = build_model_provider(args)
+    scheduler = FairShareScheduler(args.max_concurrency, tokens_per_minute=args.tokens_per_minute)
+    try:
+        # Each tenant's pipeline waits on its stages from its own thread, while the requests run on the scheduler
+        with ThreadPoolExecutor(max_workers=len(tenants), thread_name_prefix="tenant") as tenant_threads:
+            summaries = list(tenant_threads.map(lambda tenant: run_tenant(tenant, model_provider, scheduler), tenants))
+    finally:
+        scheduler.shutdown()
+        tracing.flush()
+
+    return {"tenants": summaries, "scheduler": scheduler.stats()}
+
+
+def build_tenant_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run the pipelines of many assistants at once on shared LLM clients")
+    parser.add_argument("--manifest", type=str, required=True, help="YAML manifest of the tenants to run, see README")
+    parser.add_argument("--model-provider", type=str, choices=model_providers.names(), default="openai", help="The provider every tenant's requests are sent to")
+    add_replay_arguments(parser)
+    parser.add_argument("--max-concurrency", type=int, default=20, help="The concurrent LLM requests shared by all tenants")
+    parser.add_argument("--tokens-per-minute", type=int, default=None, help="The estimated prompt tokens per minute all tenants together stay within")
+    add_client_arguments(parser)
+    parser.add_argument("--trace-path", type=str, default=None, help="Optional path to write OTLP/JSON trace spans of the run to")
+    parser.add_argument("--summary-path", type=str, default=None, help="Optional path to write the per-tenant run summaries to as JSON")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_tenant_parser().parse_args()
+    summary = run_tenants(args)
+
+    for tenant_summary in summary["tenants"]:
+        if "error" in tenant_summary:
+            logger.error(f"Tenant {tenant_summary['tenant']} failed: {tenant_summary['error']}")
+    logger.info(f"Sent {sum(s.get('events_sent', 0) for s in summary['tenants'])} events for {len(summary['tenants'])} tenants")
+    logger.info(f"Scheduler: {json.dumps(summary['scheduler'])}")
+
+    if args.summary_path:
+        with open(args.summary_path, 'w') as f:
+            json.dump(summary, f, indent=4)
@@ -0,0 +1,72 @@
+from collections import defaultdict
+from typing import List, Optional
+
+import numpy as np
+
+from models.conversation import Conversation
+from text_clustering import HashingVectorizer, MiniBatchKMeans
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+def conversation_text(conversation: Conversation) -> str:
+    return "\n".join(f"{message.role.name}: {message.content}" for message in conversation.messages)
+
+
+def select_representative_conversations(
+    conversations: List[Conversation],
+    token_budget: int,
+    n_clusters: Optional[int] = None,
+    seed: int = 42
+) -> List[Conversation]:
+    """
+    Pick a diverse subset of conversations that fits within a token budget.
+
+    Conversations are clustered on hashed n-gram TF-IDF vectors, then picked round-robin across clusters
+    (largest first), taking the conversation closest to each cluster's center first. The result is
+    ordered so that any prefix of it is itself spread across the clusters.
+    """
+    if not conversations:
+        return []
+
+    texts = [conversation_text(conversation) for conversation in conversations]
+    tokens = np.array([estimate_tokens(text) for text in texts])
+    if tokens.sum() <= token_budget:
+        return list(conversations)
+
+    if n_clusters is None:
+        # Aim for roughly one cluster per conversation that fits in the budget
+        n_clusters = int(token_budget // max(np.median(tokens), 1))
+    n_clusters = max(1, min(n_clusters, len(conversations)))
+
+    vectors = HashingVectorizer().fit_transform(texts)
+    kmeans = MiniBatchKMeans(n_clusters, seed=seed).fit(vectors)
+    labels = kmeans.predict(vectors)
+    distances = kmeans.transform(vectors)[np.arange(len(vectors)), labels]
+
+    # Each cluster's members, closest to the center first
+    members = defaultdict(list)
+    for index in np.argsort(distances):
+        members[labels[index]].append(index)
+    clusters = sorted(members.values(), key=len, reverse=True)
+
+    selected = []
+    remaining = token_budget
+    position = 0
+    while clusters and remaining > 0:
+        next_clusters = []
+        for cluster in clusters:
+            if position >= len(cluster):
+                continue
+            next_clusters.append(cluster)
+            index = cluster[position]
+            if tokens[index] <= remaining:
+                selected.append(conversations[index])
+                remaining -= tokens[index]
+        clusters = next_clusters
+        position += 1
+
+    return selected
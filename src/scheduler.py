@@ -0,0 +1,319 @@
+from bisect import bisect_right, insort
+from concurrent.futures import Executor, Future
+import functools
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    A tokens-per-minute limit: the bucket holds up to a minute of tokens and refills continuously. It isn't
+    thread-safe, so its owner must hold a lock while using it.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self.tokens = float(tokens_per_minute)
+        self.updated_at = time.monotonic()
+
+    def available(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return self.tokens
+
+    def consume(self, tokens: int):
+        self.tokens -= tokens
+
+    def seconds_until(self, tokens: int) -> float:
+        # Calls with no estimated tokens don't draw on the bucket, even while it's overdrawn
+        if tokens <= 0:
+            return 0.0
+        # A request larger than the whole bucket can go as soon as the bucket is full
+        return max(0.0, min(tokens, self.capacity) - self.available()) / self.rate
+
+
+def _unsized_index(tasks: List[tuple]) -> int:
+    """The index of the earliest submitted call without estimated tokens in a list of sorted tasks, or -1."""
+    return bisect_right(tasks, 0, key=lambda entry: entry[0]) - 1
+
+
+class _Task:
+
+    def __init__(self, tokens: int, future: Future, call: Callable):
+        self.tokens = tokens
+        self.future = future
+        self.call = call
+        self.submitted_at = time.monotonic()
+        self.blocked_since: Optional[float] = None
+
+
+class PriorityScheduler(Executor):
+    """
+    Runs calls on max_workers threads from a single queue ordered largest first, so that one scheduler can
+    serve every stage of a pipeline.
+
+    Starting the largest requests first (longest processing time first) keeps a few huge conversations from
+    starting last and becoming the stragglers that every stage waits for. Calls are sized by
+    submit_sized with their estimated prompt tokens; calls submitted without a size run after sized ones,
+    in the order they were submitted.
+
+    With tokens_per_minute, calls wait until the estimated tokens are within the limit. While the largest call
+    waits for enough tokens, smaller calls that fit in the tokens available run in its place, until the
+    largest has waited as long as the bucket takes to refill for it and then goes next. Calls without a size
+    don't count against the limit, so they run whenever the largest call has to wait.
+    """
+
+    def __init__(self, max_workers: int, tokens_per_minute: Optional[int] = None):
+        self.max_workers = max_workers
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        # (tokens, -submission order, task), so the last task is the largest and earliest submitted
+        self._tasks: List[tuple] = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"PriorityScheduler-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return self.submit_sized(0, fn, *args, **kwargs)
+
+    def submit_sized(self, tokens: int, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new calls after shutdown")
+            insort(self._tasks, (tokens, -next(self._order), _Task(tokens, future, functools.partial(fn, *args, **kwargs))))
+            self._condition.notify()
+        return future
+
+    def _next_task(self) -> Optional[_Task]:
+        with self._condition:
+            while True:
+                if not self._tasks:
+                    if self._shutdown:
+                        return None
+                    self._condition.wait()
+                    continue
+
+                largest = self._tasks[-1][2]
+                if self.bucket is None:
+                    return self._tasks.pop()[2]
+
+                wait_seconds = self.bucket.seconds_until(largest.tokens)
+                if wait_seconds == 0:
+                    self.bucket.consume(largest.tokens)
+                    return self._tasks.pop()[2]
+
+                # Unsized calls don't draw on the bucket, so they never wait for it
+                index = _unsized_index(self._tasks)
+                if index >= 0:
+                    return self._tasks.pop(index)[2]
+
+                now = time.monotonic()
+                if largest.blocked_since is None:
+                    largest.blocked_since = now
+                if now - largest.blocked_since < min(largest.tokens, self.bucket.capacity) / self.bucket.rate:
+                    # The largest task that fits in the tokens available now
+                    index = bisect_right(self._tasks, self.bucket.available(), key=lambda entry: entry[0]) - 1
+                    if index >= 0:
+                        task = self._tasks.pop(index)[2]
+                        self.bucket.consume(task.tokens)
+                        return task
+                    # Wake up as soon as the smallest task fits
+                    wait_seconds = min(wait_seconds, self.bucket.seconds_until(self._tasks[0][0]))
+
+                self._condition.wait(timeout=wait_seconds)
+
+    def _work(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            try:
+                task.future.set_result(task.call())
+            except BaseException as e:
+                task.future.set_exception(e)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._condition:
+            self._shutdown = True
+            if cancel_futures:
+                self._cancel_queued()
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _cancel_queued(self):
+        for _, _, task in self._tasks:
+            task.future.cancel()
+        self._tasks = []
+
+
+class _Tenant:
+
+    def __init__(self, name: str, weight: float, max_concurrency: Optional[int]):
+        self.name = name
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        # Sorted like PriorityScheduler._tasks, so each tenant's own calls run largest first
+        self.tasks: List[tuple] = []
+        self.running = 0
+        # The virtual time at which the tenant's service so far, divided by its weight, ends
+        self.finish_tag = 0.0
+        self.requests = 0
+        self.tokens = 0
+        self.queue_seconds = 0.0
+
+    @property
+    def eligible(self) -> bool:
+        return bool(self.tasks) and (self.max_concurrency is None or self.running < self.max_concurrency)
+
+
+class FairShareScheduler(PriorityScheduler):
+    """
+    Shares max_workers threads, and the tokens_per_minute limit, between tenants that each submit through their
+    own executor from tenant().
+
+    The next call comes from the tenant that has been served the fewest estimated tokens relative to its weight
+    (start-time fair queueing), among the tenants below their max_concurrency quota. A tenant that was idle
+    starts from the current virtual time, so it can't claim the share it didn't use. Within a tenant, calls run
+    largest first. Unlike PriorityScheduler, a call that doesn't fit in the tokens available isn't bypassed, so
+    that no tenant can starve another's large calls, except by unsized calls, which don't use any tokens.
+    """
+
+    def __init__(self, max_workers: int, tokens_per_minute: Optional[int] = None):
+        # Set before the worker threads start in PriorityScheduler.__init__
+        self._tenants: Dict[str, _Tenant] = {}
+        self._virtual_time = 0.0
+        super().__init__(max_workers, tokens_per_minute)
+
+    def tenant(self, name: str, weight: float = 1.0, max_concurrency: Optional[int] = None) -> "TenantExecutor":
+        """The executor a tenant submits its calls to, with up to max_concurrency of them running at once."""
+        if weight <= 0:
+            raise ValueError(f"Tenant {name} needs a positive weight, got {weight}")
+        with self._condition:
+            if name in self._tenants:
+                raise ValueError(f"Tenant {name} is already registered")
+            self._tenants[name] = _Tenant(name, weight, max_concurrency)
+        return TenantExecutor(self, name)
+
+    def submit_sized(self, tokens: int, fn, /, *args, **kwargs) -> Future:
+        raise TypeError("Submit calls to a FairShareScheduler through the executor of their tenant()")
+
+    def submit_tenant(self, name: str, tokens: int, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new calls after shutdown")
+            tenant = self._tenants[name]
+            if not tenant.tasks and not tenant.running:
+                tenant.finish_tag = max(tenant.finish_tag, self._virtual_time)
+            insort(tenant.tasks, (tokens, -next(self._order), _Task(tokens, future, functools.partial(fn, *args, **kwargs))))
+            self._condition.notify()
+        return future
+
+    def _release(self, tenant: _Tenant):
+        with self._condition:
+            tenant.running -= 1
+            self._condition.notify_all()
+
+    def _next_task(self) -> Optional[_Task]:
+        with self._condition:
+            while True:
+                eligible = [tenant for tenant in self._tenants.values() if tenant.eligible]
+                if not eligible:
+                    if self._shutdown and not any(tenant.tasks for tenant in self._tenants.values()):
+                        return None
+                    self._condition.wait()
+                    continue
+
+                tenant = min(eligible, key=lambda t: t.finish_tag)
+                index = len(tenant.tasks) - 1
+                task = tenant.tasks[index][2]
+                if self.bucket is not None:
+                    wait_seconds = self.bucket.seconds_until(task.tokens)
+                    if wait_seconds > 0:
+                        # Unsized calls don't draw on the bucket, so the next tenant with one runs it in the meantime
+                        unsized = [(t, _unsized_index(t.tasks)) for t in eligible]
+                        unsized = [(t, i) for t, i in unsized if i >= 0]
+                        if not unsized:
+                            self._condition.wait(timeout=wait_seconds)
+                            continue
+                        tenant, index = min(unsized, key=lambda entry: entry[0].finish_tag)
+                        task = tenant.tasks[index][2]
+                    else:
+                        self.bucket.consume(task.tokens)
+
+                tenant.tasks.pop(index)
+                tenant.running += 1
+                # Also called if the call is cancelled before a worker starts it
+                task.future.add_done_callback(lambda _, tenant=tenant: self._release(tenant))
+                self._virtual_time = tenant.finish_tag
+                # Unsized calls count as one token, so tenants that don't size their calls share by request count
+                tenant.finish_tag += max(task.tokens, 1) / tenant.weight
+                tenant.requests += 1
+                tenant.tokens += task.tokens
+                tenant.queue_seconds += time.monotonic() - task.submitted_at
+                return task
+
+    def _cancel_queued(self):
+        for tenant in self._tenants.values():
+            for _, _, task in tenant.tasks:
+                task.future.cancel()
+            tenant.tasks = []
+
+    def stats(self) -> Dict[str, dict]:
+        """The calls started for each tenant, their estimated tokens and how long they waited in the queue on average."""
+        with self._condition:
+            return {
+                tenant.name: {
+                    "weight": tenant.weight,
+                    "max_concurrency": tenant.max_concurrency,
+                    "requests": tenant.requests,
+                    "tokens": tenant.tokens,
+                    "mean_queue_seconds": round(tenant.queue_seconds / tenant.requests, 3) if tenant.requests else 0.0
+                }
+                for tenant in self._tenants.values()
+            }
+
+
+class TenantExecutor(Executor):
+    """A tenant's view of a FairShareScheduler. The scheduler belongs to its creator, so shutting this down does nothing."""
+
+    def __init__(self, scheduler: FairShareScheduler, name: str):
+        self.scheduler = scheduler
+        self.name = name
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return self.scheduler.submit_tenant(self.name, 0, fn, *args, **kwargs)
+
+    def submit_sized(self, tokens: int, fn, /, *args, **kwargs) -> Future:
+        return self.scheduler.submit_tenant(self.name, tokens, fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        pass
+
+
+def submit_llm_query(executor: Executor, llm_query, fn, /, *args, **kwargs) -> Future:
+    """Submit a call to one of llm_query's methods, sized by the query's estimated prompt tokens if the executor schedules by size."""
+    if isinstance(executor, (PriorityScheduler, TenantExecutor)):
+        # sampling imports NumPy, which the pipeline otherwise doesn't need at startup
+        from sampling import estimate_tokens
+
+        return executor.submit_sized(estimate_tokens(llm_query.generate_prompt()), fn, *args, **kwargs)
+    return executor.submit(fn, *args, **kwargs)
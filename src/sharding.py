@@ -0,0 +1,42 @@
+import functools
+import hashlib
+from typing import Any, Callable, List
+
+from models.conversation import Conversation
+
+
+def shard_hash(conversation_id) -> int:
+    """A hash of the conversation id that is stable across processes and machines (unlike the built-in hash)."""
+    return int.from_bytes(hashlib.md5(str(conversation_id).encode("utf-8")).digest()[:8], "big")
+
+
+def in_shard(conversation_id, shard_index: int, num_shards: int, worker_index: int = 0, num_workers: int = 1) -> bool:
+    """
+    Whether a conversation belongs to the given shard, and within that shard to the given local worker.
+
+    The shard is chosen from the low part of the hash and the worker from the remaining part, so each
+    machine can split its shard across any number of local workers without coordinating with the others.
+    """
+    h = shard_hash(conversation_id)
+    return h % num_shards == shard_index and (h // num_shards) % num_workers == worker_index
+
+
+def shard_filter(shard_index: int, num_shards: int, worker_index: int = 0, num_workers: int = 1) -> Callable[[Any], bool]:
+    """A predicate on conversation ids for the given shard and worker, e.g. for Source.conversation_filter."""
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"Shard index {shard_index} is out of range for {num_shards} shards")
+    if not 0 <= worker_index < num_workers:
+        raise ValueError(f"Worker index {worker_index} is out of range for {num_workers} workers")
+
+    return functools.partial(in_shard, shard_index=shard_index, num_shards=num_shards, worker_index=worker_index, num_workers=num_workers)
+
+
+def select_shard(
+    conversations: List[Conversation],
+    shard_index: int,
+    num_shards: int,
+    worker_index: int = 0,
+    num_workers: int = 1
+) -> List[Conversation]:
+    keep = shard_filter(shard_index, num_shards, worker_index, num_workers)
+    return [c for c in conversations if keep(c.id)]
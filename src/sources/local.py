@@ -1,23 +1,23 @@
-import json
 from typing import List
 
-import pandas as pd
-
-from models.conversation import Conversation, Message, ROLE
+from models.conversation import Conversation
 
 from sources.source import Source
+import tracing
 
 class LocalSource(Source):
 
     def __init__(self, file_path: str):
         self.file_path = file_path
 
+    @tracing.traced("source.get_conversations")
     def get_conversations(self) -> List[Conversation]:
-        if self.file_path.endswith("csv"):
+        file_format = self._file_format(self.file_path)
+        if file_format == "csv":
+            import pandas as pd
+            # pandas infers gzip/zstd compression from the file extension
             conversation_df = pd.read_csv(self.file_path)
-        else:
-            with open(self.file_path, 'r') as f:
-                data = json.load(f)
-            conversation_df = self._parse_json_data(data)
+            return self._transform_data_frame(conversation_df)
 
-        return self._transform_data_frame(conversation_df)
+        with open(self.file_path, 'rb') as f:
+            return list(self._iter_json_conversations(self._decompress(f, self.file_path), jsonl=file_format == "jsonl"))
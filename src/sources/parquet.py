@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from models.conversation import Conversation, Message, ROLE
+from sources.source import Source
+import tracing
+
+
+class ParquetSource(Source):
+    """Reads conversations from Parquet files (local or s3://) without going through pandas.
+
+    Only the columns needed to build conversations are read, the date and conversation id
+    filters are pushed down to the Parquet reader so that non-matching row groups are skipped
+    (when the data has a message_id column, see below), and record batches are streamed rather
+    than loading the whole dataset into memory.
+    """
+
+    columns = ["conversation_id", "user_id", "role", "content", "timestamp", "message_id"]
+
+    def __init__(
+        self,
+        path: str,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        conversation_ids: Optional[List[str]] = None,
+        batch_size: int = 65536
+    ):
+        self.path = path
+        self.start_date = start_date
+        self.end_date = end_date
+        self.conversation_ids = conversation_ids
+        self.batch_size = batch_size
+
+    @tracing.traced("source.get_conversations")
+    def get_conversations(self) -> List[Conversation]:
+        # pyarrow resolves both local paths and s3:// URIs to the right filesystem
+        dataset = ds.dataset(self.path, format="parquet")
+        schema = dataset.schema
+
+        # Either user_id or conversation_id is required
+        if "conversation_id" not in schema.names and "user_id" not in schema.names:
+            raise ValueError(f"Parquet data at {self.path} must contain a conversation_id or user_id column")
+        user_id_column = "user_id" if "user_id" in schema.names else "conversation_id"
+        conversation_id_column = "conversation_id" if "conversation_id" in schema.names else "user_id"
+        has_timestamp = "timestamp" in schema.names
+        timestamp_type = self._timestamp_type(dataset) if has_timestamp else None
+        has_message_id = "message_id" in schema.names
+
+        columns = [c for c in self.columns if c in schema.names]
+        row_filter = self._build_filter(schema, conversation_id_column, timestamp_type)
+        # Default message ids are positions in the whole dataset, so that the same message keeps its id (and its
+        # events their insert_id) whatever the filters. Without a message_id column, the rows are filtered batch by
+        # batch once their positions are known, rather than by the reader
+        pushed_down = row_filter is None or has_message_id
+        batches = dataset.to_batches(
+            columns=columns,
+            filter=row_filter if pushed_down else None,
+            batch_size=self.batch_size
+        )
+
+        conversations: Dict[str, Conversation] = {}
+        # Whether each conversation id seen so far passes the conversation filter
+        kept_ids: Dict[str, bool] = {}
+        row_index = 0
+        for batch in batches:
+            # Message ids default to the row's position in the dataset, including the rows that are filtered out
+            positions = range(row_index, row_index + batch.num_rows)
+            row_index += batch.num_rows
+            if not pushed_down:
+                batch = batch.append_column("__position", pa.array(positions, type=pa.int64())).filter(row_filter)
+                positions = batch.column("__position").to_pylist()
+            if batch.num_rows == 0:
+                continue
+
+            conversation_ids = batch.column(conversation_id_column).to_pylist()
+            if self.conversation_filter is not None:
+                # Only the kept rows' other columns are converted to Python objects
+                indices = [i for i, kept in enumerate(self._kept(conversation_ids, kept_ids)) if kept]
+                if not indices:
+                    continue
+                batch = batch.take(pa.array(indices, type=pa.int64()))
+                conversation_ids = [conversation_ids[i] for i in indices]
+                positions = [positions[i] for i in indices]
+
+            user_ids = batch.column(user_id_column).to_pylist()
+            roles = batch.column("role").to_pylist()
+            contents = batch.column("content").to_pylist()
+            timestamps = self._timestamps(batch.column("timestamp"), timestamp_type) if has_timestamp else [None] * batch.num_rows
+            if has_message_id:
+                message_ids = [str(m) for m in batch.column("message_id").to_pylist()]
+            else:
+                message_ids = [str(i) for i in positions]
+
+            for conversation_id, user_id, role, content, timestamp, message_id in zip(conversation_ids, user_ids, roles, contents, timestamps, message_ids):
+                conversation = conversations.get(conversation_id)
+                if conversation is None:
+                    conversation = Conversation(id=conversation_id, user_id=user_id, messages=[])
+                    conversations[conversation_id] = conversation
+                conversation.messages.append(Message(ROLE[role], content, timestamp, message_id))
+
+        # If no timestamp column, create timestamps starting from now
+        if not has_timestamp:
+            now = datetime.now()
+            for conversation in conversations.values():
+                for i, message in enumerate(conversation.messages):
+                    message.timestamp = now + timedelta(seconds=i)
+
+        return list(conversations.values())
+
+    def _kept(self, conversation_ids: List[str], kept_ids: Dict[str, bool]) -> List[bool]:
+        for conversation_id in conversation_ids:
+            if conversation_id not in kept_ids:
+                kept_ids[conversation_id] = self.conversation_filter(conversation_id)
+        return [kept_ids[conversation_id] for conversation_id in conversation_ids]
+
+    def _build_filter(self, schema: pa.Schema, conversation_id_column: str, timestamp_type: Optional[pa.TimestampType]) -> Optional[ds.Expression]:
+        expressions = []
+
+        if self.conversation_ids:
+            expressions.append(ds.field(conversation_id_column).isin(self.conversation_ids))
+
+        if (self.start_date or self.end_date) and "timestamp" not in schema.names:
+            raise ValueError(f"Date filters require a timestamp column in {self.path}")
+
+        timestamp = ds.field("timestamp")
+        if timestamp_type is not None and self._is_string(schema.field("timestamp").type):
+            # ISO-8601 strings don't sort as timestamps, e.g. with a space instead of a T, so they're parsed first
+            timestamp = timestamp.cast(timestamp_type)
+        if self.start_date:
+            expressions.append(timestamp >= self._timestamp_scalar(self.start_date, timestamp_type))
+        if self.end_date:
+            expressions.append(timestamp < self._timestamp_scalar(self.end_date, timestamp_type))
+
+        if not expressions:
+            return None
+
+        expression = expressions[0]
+        for other in expressions[1:]:
+            expression = expression & other
+        return expression
+
+    def _timestamp_scalar(self, value: datetime, timestamp_type: pa.TimestampType) -> pa.Scalar:
+        # A bound with a timezone is compared as UTC against timestamps without one, and a bound without one is taken to be UTC
+        if timestamp_type.tz is None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        elif timestamp_type.tz is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        # Bounds more precise than the column's unit are truncated to it
+        return pc.cast(pa.scalar(value, type=pa.timestamp("us", tz=timestamp_type.tz)), timestamp_type, safe=False)
+
+    @staticmethod
+    def _is_string(data_type: pa.DataType) -> bool:
+        return pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+
+    def _timestamp_type(self, dataset: ds.Dataset) -> pa.TimestampType:
+        """The type of the timestamp column, or for strings the type they're parsed as."""
+        timestamp_type = dataset.schema.field("timestamp").type
+        if not self._is_string(timestamp_type):
+            return timestamp_type
+
+        # Strings with a zone offset, e.g. ending in Z or +00:00, can only be parsed as UTC, and those without one only
+        # as naive timestamps, so the first value decides for the whole column
+        first = dataset.head(1, columns=["timestamp"], filter=ds.field("timestamp").is_valid()).column("timestamp")
+        try:
+            pc.cast(first, pa.timestamp("us", tz="UTC"))
+            return pa.timestamp("us", tz="UTC")
+        except pa.ArrowInvalid:
+            return pa.timestamp("us")
+
+    def _timestamps(self, column: pa.Array, timestamp_type: pa.TimestampType) -> List[datetime]:
+        if self._is_string(column.type):
+            column = pc.cast(column, timestamp_type)
+        return column.to_pylist()
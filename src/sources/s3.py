@@ -1,12 +1,14 @@
-from typing import List
-import io
-import boto3
-import pandas as pd
+from __future__ import annotations
+
+from typing import List, TYPE_CHECKING
 import re
-import json
 
-from models.conversation import Conversation, Message, ROLE
+from models.conversation import Conversation
 from sources.source import Source
+import tracing
+
+if TYPE_CHECKING:
+    import boto3
 
 
 class S3Source(Source):
@@ -24,6 +26,7 @@ class S3Source(Source):
         self.s3_bucket = match.group(1)
         self.s3_path = match.group(2)
 
+    @tracing.traced("source.get_conversations")
     def get_conversations(self) -> List[Conversation]:
         # List all objects under the given path
         paginator = self.s3_client.get_paginator('list_objects_v2')
@@ -39,26 +42,25 @@ class S3Source(Source):
             for obj in page['Contents']:
                 file_key = obj['Key']
                 
-                # Skip directories or non-CSV/JSON files
-                if file_key.endswith('/') or not (file_key.lower().endswith('.csv') or file_key.lower().endswith('.json')):
+                # Skip directories or non-CSV/JSON/JSONL files
+                if file_key.endswith('/') or self._file_format(file_key) not in ('csv', 'json', 'jsonl'):
                     continue
                 
                 conversations.extend(self._process_s3_file(file_key))
                 
         return conversations
     
+    @tracing.traced("source.read_s3_file")
     def _process_s3_file(self, file_key: str) -> List[Conversation]:
-        """Process a single S3 CSV file into Conversation objects"""
-        # Get file content from S3
+        """Process a single S3 CSV/JSON/JSONL file into Conversation objects"""
+        # Stream the file content from S3 rather than reading it into memory up front
         response = self.s3_client.get_object(Bucket=self.s3_bucket, Key=file_key)
-        file_content = response['Body'].read()
-        bytes_io = io.BytesIO(file_content)
+        stream = self._decompress(response['Body'], file_key)
         
-        # Parse CSV content
-        if file_key.endswith("csv"):
-            conversation_df = pd.read_csv(bytes_io)
-        else:
-            json_data = json.loads(bytes_io.read().decode('utf-8'))
-            conversation_df = self._parse_json_data(json_data)
-        
-        return self._transform_data_frame(conversation_df)
\ No newline at end of file
+        file_format = self._file_format(file_key)
+        if file_format == "csv":
+            import pandas as pd
+            conversation_df = pd.read_csv(stream)
+            return self._transform_data_frame(conversation_df)
+
+        return list(self._iter_json_conversations(stream, jsonl=file_format == "jsonl"))
\ No newline at end of file
@@ -1,31 +1,52 @@
+from __future__ import annotations
+
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
-from typing import List
+import gzip
+import io
+import json
+from typing import Any, BinaryIO, Callable, Iterator, List, Optional, TYPE_CHECKING
 
-import pandas as pd
+import ijson
 
 from models.conversation import Conversation, Message, ROLE
+import tracing
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 class Source(ABC):
 
+    compression_extensions = (".gz", ".zst")
+    # Only the conversations whose id this accepts are built, e.g. those of one shard (see sharding.shard_filter),
+    # so that a shard's process doesn't hold every conversation in memory
+    conversation_filter: Optional[Callable[[Any], bool]] = None
+
     @abstractmethod
     def get_conversations(self) -> List[Conversation]:
         pass
 
+    @tracing.traced("source.transform_data_frame")
     def _transform_data_frame(self, df: pd.DataFrame) -> List[Conversation]:
+        import pandas as pd
+
          # Either user_id or conversation_id is required
         user_id_column = "user_id" if "user_id" in df.columns else "conversation_id"
         conversation_id_column = "conversation_id" if "conversation_id" in df.columns else "user_id"
 
+        # Message ids default to the row's position in the file, so they're assigned before any rows are filtered out
+        if 'message_id' not in df.columns:
+            df['message_id'] = df.index.astype(str)
+
+        if self.conversation_filter is not None:
+            df = df[df[conversation_id_column].map(self.conversation_filter)].copy()
+
         # Check if timestamp column exists, if not, we'll add it later per conversation
         has_timestamp = 'timestamp' in df.columns
         if has_timestamp:
             # Convert timestamps to datetime before creating Message objects
             df['timestamp'] = pd.to_datetime(df['timestamp'])
 
-        if 'message_id' not in df.columns:
-            df['message_id'] = df.index.astype(str)
-
         conversations = []
         for conversation_id, group_df in df.groupby(conversation_id_column):    
             # If no timestamp column, create timestamps starting from now
@@ -43,14 +64,60 @@ class Source(ABC):
 
         return conversations
     
-    def _parse_json_data(self, json_data) -> pd.DataFrame:
-        rows = []
-        for convo_id, convo_data in json_data.items():
-            for message in convo_data['messages']:
-                rows.append({
-                    'conversation_id': convo_id,
-                    'role': message['role'],
-                    'content': message['content']
-                })
-
-        return pd.DataFrame(rows)
+    @classmethod
+    def _file_format(cls, file_name: str) -> str:
+        """Return csv, json or jsonl for a file name, ignoring any compression extension."""
+        file_name = file_name.lower()
+        for extension in cls.compression_extensions:
+            if file_name.endswith(extension):
+                file_name = file_name[:-len(extension)]
+        return file_name.rsplit(".", 1)[-1]
+
+    def _decompress(self, file_obj: BinaryIO, file_name: str) -> BinaryIO:
+        """Wrap a binary stream so that gzip/zstd inputs are decompressed incrementally."""
+        if file_name.lower().endswith(".gz"):
+            return gzip.GzipFile(fileobj=file_obj)
+        if file_name.lower().endswith(".zst"):
+            import zstandard
+            return zstandard.ZstdDecompressor().stream_reader(file_obj)
+        return file_obj
+
+    def _iter_json_conversations(self, stream: BinaryIO, jsonl: bool = False) -> Iterator[Conversation]:
+        """
+        Incrementally parse conversations from a JSON or JSON Lines stream without materializing the whole file.
+
+        JSON input is the {conversation_id: {"messages": [...]}} structure; JSON Lines input has one
+        {"conversation_id": ..., "messages": [...]} object per line. Both may set an optional user_id.
+        """
+        if jsonl:
+            conversations = (
+                (convo_data["conversation_id"], convo_data)
+                for convo_data in (json.loads(line) for line in io.TextIOWrapper(stream, encoding="utf-8") if line.strip())
+            )
+        else:
+            conversations = ijson.kvitems(stream, "", use_float=True)
+
+        # Message ids default to the message's position in the file, matching the CSV path
+        message_index = 0
+        for convo_id, convo_data in conversations:
+            if self.conversation_filter is not None and not self.conversation_filter(convo_id):
+                message_index += len(convo_data["messages"])
+                continue
+
+            now = datetime.now()
+            messages = []
+            for i, message in enumerate(convo_data["messages"]):
+                timestamp = message.get("timestamp")
+                messages.append(Message(
+                    ROLE[message["role"]],
+                    message["content"],
+                    datetime.fromisoformat(timestamp) if timestamp else now + timedelta(seconds=i),
+                    str(message.get("message_id", message_index))
+                ))
+                message_index += 1
+
+            yield Conversation(
+                id=convo_id,
+                user_id=convo_data.get("user_id", convo_id),
+                messages=messages
+            )
@@ -0,0 +1,147 @@
+import re
+from typing import Iterable, List, Optional
+import zlib
+
+import numpy as np
+
+
+token_pattern = re.compile(r"\w+")
+
+
+class HashingVectorizer:
+    """
+    Turns texts into L2-normalized hashed n-gram TF-IDF vectors using only NumPy.
+
+    Features are hashed into a fixed number of columns, so no vocabulary is kept and memory stays bounded
+    however many texts are seen. Document frequencies can be accumulated incrementally with partial_fit.
+    """
+
+    max_cached_tokens = 1_000_000
+
+    def __init__(self, n_features: int = 2 ** 12, ngram_range=(1, 2)):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.document_frequencies = np.zeros(n_features, dtype=np.int64)
+        self.num_documents = 0
+        self.token_hashes = {}
+
+    def _token_hashes(self, text: str) -> np.ndarray:
+        cache = self.token_hashes
+        if len(cache) > self.max_cached_tokens:
+            cache.clear()
+
+        tokens = token_pattern.findall(text.lower())
+        for token in set(tokens).difference(cache):
+            # crc32 rather than hash() so that vectors are stable across processes
+            cache[token] = zlib.crc32(token.encode("utf-8"))
+        return np.fromiter(map(cache.__getitem__, tokens), dtype=np.uint64, count=len(tokens))
+
+    def _feature_indices(self, text: str) -> np.ndarray:
+        token_hashes = self._token_hashes(text)
+        features = []
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            count = len(token_hashes) - n + 1
+            if count <= 0:
+                continue
+            # Combine the token hashes of each n-gram in NumPy rather than hashing the n-gram strings
+            ngram_hashes = token_hashes[:count].copy()
+            for offset in range(1, n):
+                ngram_hashes = ngram_hashes * np.uint64(1000003) ^ token_hashes[offset:offset + count]
+            features.append(ngram_hashes)
+
+        if not features:
+            return np.zeros(0, dtype=np.int64)
+        return (np.concatenate(features) % np.uint64(self.n_features)).astype(np.int64)
+
+    def partial_fit(self, texts: Iterable[str]) -> "HashingVectorizer":
+        for text in texts:
+            self.document_frequencies[np.unique(self._feature_indices(text))] += 1
+            self.num_documents += 1
+        return self
+
+    @property
+    def idf(self) -> np.ndarray:
+        return np.log((1 + self.num_documents) / (1 + self.document_frequencies)) + 1
+
+    def transform(self, texts: List[str]) -> np.ndarray:
+        return self._vectorize([self._feature_indices(text) for text in texts])
+
+    def fit_transform(self, texts: List[str]) -> np.ndarray:
+        feature_indices = [self._feature_indices(text) for text in texts]
+        for indices in feature_indices:
+            self.document_frequencies[np.unique(indices)] += 1
+        self.num_documents += len(feature_indices)
+        return self._vectorize(feature_indices)
+
+    def _vectorize(self, feature_indices: List[np.ndarray]) -> np.ndarray:
+        vectors = np.zeros((len(feature_indices), self.n_features), dtype=np.float32)
+        for row, indices in enumerate(feature_indices):
+            indices, counts = np.unique(indices, return_counts=True)
+            # Sublinear term frequency so that long texts aren't dominated by repeated words
+            vectors[row, indices] = 1 + np.log(counts)
+
+        if self.num_documents:
+            vectors *= self.idf.astype(np.float32)
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+
+class MiniBatchKMeans:
+    """Mini-batch k-means (Sculley, 2010) that can be updated incrementally as new vectors arrive."""
+
+    def __init__(self, n_clusters: int, seed: int = 42):
+        self.n_clusters = n_clusters
+        self.random = np.random.default_rng(seed)
+        self.centers: Optional[np.ndarray] = None
+        self.counts: Optional[np.ndarray] = None
+
+    def _init_centers(self, X: np.ndarray):
+        # k-means++ seeding on the first batch
+        centers = [X[self.random.integers(len(X))]]
+        closest = ((X - centers[0]) ** 2).sum(axis=1)
+        for _ in range(1, min(self.n_clusters, len(X))):
+            total = closest.sum()
+            index = self.random.choice(len(X), p=closest / total) if total > 0 else self.random.integers(len(X))
+            centers.append(X[index])
+            closest = np.minimum(closest, ((X - X[index]) ** 2).sum(axis=1))
+
+        self.centers = np.array(centers, dtype=np.float32)
+        self.counts = np.zeros(len(self.centers), dtype=np.int64)
+
+    def _squared_distances(self, X: np.ndarray) -> np.ndarray:
+        return (
+            (X ** 2).sum(axis=1)[:, None]
+            - 2 * X @ self.centers.T
+            + (self.centers ** 2).sum(axis=1)[None, :]
+        )
+
+    def partial_fit(self, X: np.ndarray) -> "MiniBatchKMeans":
+        if len(X) == 0:
+            return self
+        if self.centers is None:
+            self._init_centers(X)
+
+        labels = self.predict(X)
+        for label in np.unique(labels):
+            members = X[labels == label]
+            # Per-center learning rate that decays as the center absorbs more points
+            self.counts[label] += len(members)
+            learning_rate = len(members) / self.counts[label]
+            self.centers[label] = (1 - learning_rate) * self.centers[label] + learning_rate * members.mean(axis=0)
+        return self
+
+    def fit(self, X: np.ndarray, batch_size: int = 1024, n_iterations: int = 10) -> "MiniBatchKMeans":
+        for _ in range(n_iterations):
+            order = self.random.permutation(len(X))
+            for i in range(0, len(X), batch_size):
+                self.partial_fit(X[order[i:i + batch_size]])
+        return self
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self._squared_distances(X).argmin(axis=1)
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """The squared distance from each vector to each cluster center."""
+        return np.maximum(self._squared_distances(X), 0)
@@ -0,0 +1,219 @@
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_exporter = None
+_trace_id = None
+
+
+class Span:
+    """A timed operation within a run, exported in the OpenTelemetry (OTLP) span format."""
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict):
+        self.name = name
+        self.trace_id = _trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_time = None
+        self.end_time = None
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start_time = time.time_ns()
+        _stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end_time = time.time_ns()
+        _stack().pop()
+        if exc_value is not None:
+            self.error = f"{exc_type.__name__}: {exc_value}"
+        if _exporter:
+            _exporter.export(self)
+        return False
+
+    def to_otlp(self) -> Dict:
+        otlp_span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            # SPAN_KIND_INTERNAL
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": _otlp_attributes(self.attributes),
+            # STATUS_CODE_ERROR or STATUS_CODE_UNSET
+            "status": {"code": 2, "message": self.error} if self.error else {}
+        }
+        if self.parent_span_id:
+            otlp_span["parentSpanId"] = self.parent_span_id
+        return otlp_span
+
+
+class _NoopSpan:
+    """Returned when tracing isn't configured, so that instrumented code costs next to nothing."""
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_noop_span = _NoopSpan()
+
+
+class OTLPJsonFileExporter:
+    """
+    Writes finished spans to a local file in the OTLP/JSON format, one ExportTraceServiceRequest per line,
+    so a run's spans can be loaded into a trace viewer without running a collector.
+    """
+
+    def __init__(self, file_path: str, service_name: str, max_batch_size: int = 512):
+        self.file_path = file_path
+        self.service_name = service_name
+        self.max_batch_size = max_batch_size
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+        self.file = open(file_path, 'a')
+
+    def export(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+            if len(self.spans) >= self.max_batch_size:
+                self._write()
+
+    def flush(self):
+        with self.lock:
+            self._write()
+            self.file.flush()
+
+    def _write(self):
+        if not self.spans:
+            return
+
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": "conversational-product-analytics"},
+                    "spans": [span.to_otlp() for span in self.spans]
+                }]
+            }]
+        }
+        self.file.write(json.dumps(request) + "\n")
+        self.spans = []
+
+
+def configure(file_path: str, service_name: str):
+    """Start tracing this process's run, exporting every span to the given file."""
+    global _exporter, _trace_id
+    if _exporter:
+        _exporter.flush()
+    else:
+        atexit.register(flush)
+
+    _trace_id = os.urandom(16).hex()
+    _exporter = OTLPJsonFileExporter(file_path, service_name)
+    logger.info(f"Writing trace {_trace_id} to {file_path}")
+
+
+def flush():
+    if _exporter:
+        _exporter.flush()
+
+
+def span(name: str, **attributes):
+    """
+    A context manager that times the enclosed block as a child of the current span in this thread.
+
+        with tracing.span("source.get_conversations", source="LocalSource") as s:
+            ...
+            s.set_attribute("conversations", len(conversations))
+    """
+    if not _exporter:
+        return _noop_span
+    return Span(name, current_span(), attributes)
+
+
+def traced(name: str):
+    """Decorate a function so that each call is timed as a span."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            with span(name, **{"code.function": fn.__qualname__}):
+                return fn(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def current_span() -> Optional[Span]:
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def set_attributes(**attributes):
+    """Set attributes on the current span, e.g. token usage reported deep inside a model provider."""
+    current = current_span()
+    if current:
+        current.attributes.update(attributes)
+
+
+def wrap(fn):
+    """
+    Make spans started by fn children of the span that is current where wrap is called. Spans are tracked
+    per thread, so wrap functions that are submitted to an executor.
+    """
+    parent = current_span()
+    if not parent:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapped(*args, **kwargs):
+        stack = _stack()
+        stack.append(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stack.pop()
+
+    return wrapped
+
+
+def _stack() -> List[Span]:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    otlp_attributes = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            otlp_value = {"boolValue": value}
+        elif isinstance(value, int):
+            otlp_value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            otlp_value = {"doubleValue": value}
+        else:
+            otlp_value = {"stringValue": str(value)}
+        otlp_attributes.append({"key": key, "value": otlp_value})
+    return otlp_attributes
@@ -0,0 +1,81 @@
+import argparse
+from collections import defaultdict
+import json
+import logging
+
+# Configure root logger to WARNING to silence third-party libraries
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+from local_tagger import LocalEventTagger, read_labeled_messages
+from models.conversation import Message
+from models.data_schema import DataSchema
+from sharding import shard_hash
+
+# Set loggers within this application to INFO
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def evaluate(tagger: LocalEventTagger, examples, thresholds) -> list:
+    """
+    Compare the local tagger against the LLM labels of held-out messages.
+
+    For each confidence threshold, reports the fraction of messages the tagger would tag locally, how often
+    those local tags agree with the LLM, and the fraction of event generation requests that would be skipped
+    entirely because every message in the conversation was tagged locally.
+    """
+    messages = [Message(role, content, None, str(i)) for i, (role, content, _, _) in enumerate(examples)]
+    predictions = tagger.predict(messages)
+
+    messages_by_conversation = defaultdict(list)
+    for i, (_, _, _, conversation_id) in enumerate(examples):
+        messages_by_conversation[conversation_id].append(i)
+
+    results = []
+    for threshold in thresholds:
+        confident = [probability >= threshold for _, probability in predictions]
+        agreements = [predictions[i][0].name == examples[i][2] for i in range(len(examples)) if confident[i]]
+        skipped = sum(all(confident[i] for i in indices) for indices in messages_by_conversation.values())
+        results.append({
+            "threshold": threshold,
+            "messages_tagged_locally": sum(confident) / len(examples),
+            "agreement_with_llm": sum(agreements) / len(agreements) if agreements else None,
+            "event_requests_saved": skipped / len(messages_by_conversation)
+        })
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train and evaluate a local event tagger from previously LLM-tagged events")
+    parser.add_argument("--labeled-events-path", type=str, required=True, help="Events written by the jsonl destination")
+    parser.add_argument("--data-schema-path", type=str, required=True)
+    parser.add_argument("--tagger-output-path", type=str, default=None, help="Where to save the tagger trained on all labeled events (.npz)")
+    parser.add_argument("--evaluate", action="store_true", help="Hold out a fraction of conversations and report agreement with the LLM labels")
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--thresholds", type=str, default="0.5,0.7,0.8,0.9,0.95,0.99")
+    parser.add_argument("--n-epochs", type=int, default=20)
+    args = parser.parse_args()
+
+    data_schema = DataSchema.from_yaml(args.data_schema_path)
+    examples = read_labeled_messages(args.labeled_events_path)
+    logger.info(f"Loaded {len(examples)} labeled messages")
+
+    if args.evaluate:
+        # Split by conversation so that no conversation appears in both the train and test sets
+        is_test = [shard_hash(conversation_id) % 1000 < args.test_fraction * 1000 for _, _, _, conversation_id in examples]
+        train_examples = [example for example, test in zip(examples, is_test) if not test]
+        test_examples = [example for example, test in zip(examples, is_test) if test]
+        logger.info(f"Training on {len(train_examples)} messages and evaluating on {len(test_examples)} messages")
+
+        tagger = LocalEventTagger(data_schema.event_types).fit(train_examples, n_epochs=args.n_epochs)
+        results = evaluate(tagger, test_examples, [float(t) for t in args.thresholds.split(",")])
+        print(json.dumps(results, indent=4))
+
+    if args.tagger_output_path:
+        tagger = LocalEventTagger(data_schema.event_types).fit(examples, n_epochs=args.n_epochs)
+        tagger.save(args.tagger_output_path)
+        logger.info(f"Saved local tagger to {args.tagger_output_path}")
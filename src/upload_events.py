@@ -1,14 +1,12 @@
 import argparse
+from datetime import datetime
+import json
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import multiprocessing
 import os
-from tqdm import tqdm
-
-from anthropic import Anthropic
-from amplitude import Amplitude
-import boto3
-from openai import OpenAI
-from posthog import Posthog
+import queue
+import time
+from typing import Dict, Tuple
 
 # Configure root logger to WARNING to silence third-party libraries
 logging.basicConfig(
@@ -16,16 +14,12 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-from destinations.amplitude import AmplitudeDestination
-from destinations.posthog import PosthogDestination
-from llm_queries.event_generator import EventGenerator
-from llm_queries.event_property_generator import EventPropertyGenerator
-from llm_queries.explanation_generator import ExplanationGenerator
-from llm_queries.llm_judge import LLMJudge
-from llm_queries.llm_query import OpenAIModelProvider, BedrockModelProvider, AnthropicModelProvider
+from executors import EXECUTORS
 from models.data_schema import DataSchema
-from sources.local import LocalSource
-from sources.s3 import S3Source
+from pipeline import Pipeline, PipelineConfig, PipelineHooks, STAGES
+from registry import destinations, model_providers
+from sharding import shard_filter
+import tracing
 
 # Set loggers within this application to INFO
 logger = logging.getLogger(__name__)
@@ -34,196 +28,436 @@ logger.setLevel(logging.INFO)
 logging.getLogger('openai').setLevel(logging.WARNING)
 logging.getLogger('amplitude').setLevel(logging.WARNING)
 logging.getLogger('anthropic').setLevel(logging.WARNING)
-if __name__ == "__main__":
+
+
+class FirstItemTimer(PipelineHooks):
+    """Records how long each stage takes to stream its first event, from the start of the stage."""
+
+    def __init__(self):
+        self.stage_started_at = {}
+        self.seconds_to_first_item = {}
+
+    def on_stage_start(self, stage: str):
+        self.stage_started_at[stage] = time.perf_counter()
+
+    def on_item(self, stage: str, event):
+        if stage not in self.seconds_to_first_item:
+            self.seconds_to_first_item[stage] = round(time.perf_counter() - self.stage_started_at[stage], 3)
+
+
+def build_model_provider(args):
+    return model_providers.create(args.model_provider, args)
+
+
+def build_source(args):
+    # Automatically determine source type based on path prefix. Sources are imported on selection since pyarrow, boto3 and pandas are slow to import
+    if args.data_format == "parquet" or args.data_path.endswith((".parquet", ".pq")):
+        from sources.parquet import ParquetSource
+
+        logger.info("Loading data from Parquet")
+        return ParquetSource(
+            args.data_path,
+            start_date=args.start_date,
+            end_date=args.end_date,
+            conversation_ids=args.conversation_ids.split(",") if args.conversation_ids else None
+        )
+    elif args.data_path.startswith("s3://"):
+        import boto3
+        from sources.s3 import S3Source
+
+        logger.info("Detected S3 path, loading data from S3")
+        s3_client = boto3.client("s3")
+        return S3Source(s3_client, args.data_path)
+    else:
+        from sources.local import LocalSource
+
+        logger.info("Loading data from local file")
+        return LocalSource(args.data_path)
+
+
+def build_hedging_policy(args):
+    if not args.hedge_requests:
+        return None
+    from llm_queries.hedging import HedgingPolicy
+
+    return HedgingPolicy(quantile=args.hedge_quantile, max_extra_fraction=args.hedge_max_extra_fraction, min_samples=args.hedge_min_samples)
+
+
+def build_judge_sampler(args):
+    if args.judge_sample_rate is None:
+        return None
+    from judge_sampling import StratifiedJudgeSampler
+
+    return StratifiedJudgeSampler(
+        default_rate=args.judge_sample_rate,
+        rates=dict(args.judge_stratum_rate),
+        dimensions=args.judge_strata.split(","),
+        min_per_stratum=args.judge_min_per_stratum,
+        impute=args.judge_impute
+    )
+
+
+def build_executor(args):
+    """The executor name, or for "priority", a scheduler that serves every stage from a single largest-first queue."""
+    if args.executor != "priority":
+        return args.executor
+    from scheduler import PriorityScheduler
+
+    return PriorityScheduler(args.max_concurrency, tokens_per_minute=args.tokens_per_minute)
+
+
+def build_destination(args):
+    destination = destinations.create(args.destination, args)
+    if args.outbox_path:
+        from destinations.outbox import OutboxDestination
+
+        logger.info(f"Delivering events through the outbox {args.outbox_path}")
+        return OutboxDestination(destination, args.outbox_path, batch_size=args.outbox_batch_size, max_attempts=args.outbox_max_attempts)
+    return destination
+
+
+def run(args, worker_index: int = 0, num_workers: int = 1, model_provider=None, executor=None) -> dict:
+    """
+    Run the full pipeline for this process's shard of the conversations and return a summary. A model provider
+    and executor shared with other runs can be passed in, in which case they're left open.
+    """
+    if args.trace_path:
+        tracing.configure(args.trace_path if num_workers == 1 else f"{args.trace_path}.{worker_index}", service_name="upload_events")
+
+    model_provider = model_provider or build_model_provider(args)
+    data_schema = DataSchema.from_yaml(args.data_schema_path)
+    source = build_source(args)
+    destination = build_destination(args)
+
+    logger.info("Loading conversations")
+    if args.num_shards > 1 or num_workers > 1:
+        # The source skips other shards' conversations as it reads them, instead of every process loading them all
+        source.conversation_filter = shard_filter(args.shard_index, args.num_shards, worker_index, num_workers)
+        conversations = source.get_conversations()
+        logger.info(f"Found {len(conversations)} conversations in shard {args.shard_index}/{args.num_shards}, worker {worker_index}/{num_workers}")
+    else:
+        conversations = source.get_conversations()
+        logger.info(f"Found {len(conversations)} conversations")
+
+    local_tagger = None
+    if args.local_tagger_path:
+        from local_tagger import LocalEventTagger
+        local_tagger = LocalEventTagger.load(args.local_tagger_path, data_schema.event_types)
+
+    explanation_clusterer = None
+    # Processes that each see part of the conversations would each learn different clusters, so they all label
+    # events with the same fitted clusters instead (see check_args)
+    update_explanation_clusters = args.num_shards == 1 and num_workers == 1
+    if args.explanation_clusters:
+        from explanation_clustering import ExplanationClusterer
+
+        if args.explanation_clusterer_path and os.path.exists(args.explanation_clusterer_path):
+            explanation_clusterer = ExplanationClusterer.load(args.explanation_clusterer_path)
+        else:
+            explanation_clusterer = ExplanationClusterer(n_clusters=args.explanation_clusters)
+
+    judge_sampler = build_judge_sampler(args)
+    if judge_sampler:
+        # Users are stratified by their conversations in this process's whole shard, not in each chunk
+        judge_sampler.count_users(conversations)
+
+    config = PipelineConfig(
+        event_model=args.event_model,
+        event_property_model=args.event_property_model,
+        explanation_model=args.explanation_model,
+        llm_judge_model=args.llm_judge_model,
+        max_workers=args.max_concurrency,
+        stage_concurrency=args.stage_concurrency,
+        local_tagger=local_tagger,
+        local_tagger_threshold=args.local_tagger_threshold,
+        event_escalation_model=args.event_escalation_model,
+        llm_judge_escalation_model=args.llm_judge_escalation_model,
+        cascade_min_confidence=args.cascade_min_confidence,
+        combined_judge_events=args.combined_judge_events,
+        judge_sampler=judge_sampler,
+        explanation_clusterer=explanation_clusterer,
+        update_explanation_clusters=update_explanation_clusters,
+        hedging=build_hedging_policy(args),
+        stream_responses=args.stream_responses
+    )
+    owns_executor = executor is None
+    executor = executor or build_executor(args)
+    hooks = FirstItemTimer()
+    with Pipeline(model_provider, data_schema, destination, config=config, executor=executor, hooks=hooks) as pipeline:
+        result = pipeline.run(conversations, chunk_size=args.chunk_size)
+    if owns_executor and not isinstance(executor, str):
+        executor.shutdown()
+    if explanation_clusterer and args.explanation_clusterer_path and update_explanation_clusters:
+        explanation_clusterer.save(args.explanation_clusterer_path)
+    tracing.flush()
+
+    summary = {
+        "shard_index": args.shard_index,
+        "num_shards": args.num_shards,
+        "worker_index": worker_index,
+        "num_workers": num_workers,
+        "conversations": len(conversations),
+        "events_sent": result.sent,
+        "events_failed": result.failed,
+        "stage_failures": result.stage_failures
+    }
+    if config.stream_responses:
+        summary["seconds_to_first_item"] = hooks.seconds_to_first_item
+    if config.hedging:
+        config.hedging.close()
+        summary["hedging"] = config.hedging.stats()
+        logger.info(f"Hedging: {json.dumps(summary['hedging'])}")
+    if config.judge_sampler:
+        summary["judge_sampling"] = config.judge_sampler.estimate()
+        _log_judge_estimate(summary["judge_sampling"])
+    return summary
+
+
+def _log_judge_estimate(estimate: dict):
+    logger.info(
+        f"Estimated mean judge score of {estimate['conversations']} conversations from {estimate['judged']} judged: "
+        f"{estimate['mean']} ({estimate['confidence']:.0%} CI {estimate['ci_low']} to {estimate['ci_high']})"
+    )
+
+
+def plan(args) -> dict:
+    """Plan the run without sending any requests: build every stage's prompts locally and estimate its tokens, cost and duration."""
+    from planning import TokenCounter, load_model_profiles, plan_pipeline
+
+    data_schema = DataSchema.from_yaml(args.data_schema_path)
+    source = build_source(args)
+    if args.num_shards > 1:
+        source.conversation_filter = shard_filter(args.shard_index, args.num_shards)
+    conversations = source.get_conversations()
+
+    local_tagger = None
+    if args.local_tagger_path:
+        from local_tagger import LocalEventTagger
+        local_tagger = LocalEventTagger.load(args.local_tagger_path, data_schema.event_types)
+
+    config = PipelineConfig(
+        event_model=args.event_model,
+        event_property_model=args.event_property_model,
+        explanation_model=args.explanation_model,
+        llm_judge_model=args.llm_judge_model,
+        max_workers=args.max_concurrency,
+        stage_concurrency=args.stage_concurrency,
+        local_tagger=local_tagger,
+        local_tagger_threshold=args.local_tagger_threshold,
+        event_escalation_model=args.event_escalation_model,
+        llm_judge_escalation_model=args.llm_judge_escalation_model,
+        combined_judge_events=args.combined_judge_events,
+        judge_sampler=build_judge_sampler(args)
+    )
+    # Local workers split the shard, so they add to the concurrency of each stage
+    config.stage_concurrency = {stage: config.concurrency(stage) * args.num_workers for stage in STAGES}
+    result = plan_pipeline(
+        data_schema, conversations, config, TokenCounter(), load_model_profiles(args.plan_models), args.plan_sample_size
+    )
+    print(result.format())
+    return result.to_dict()
+
+
+# How often run_workers checks for workers that died without reporting their summary
+WORKER_POLL_SECONDS = 5
+
+
+def _run_worker(args, worker_index: int, num_workers: int, results: multiprocessing.Queue):
+    try:
+        results.put(run(args, worker_index, num_workers))
+    except Exception as e:
+        logger.error(f"Worker {worker_index} failed: {e}")
+        results.put({"worker_index": worker_index, "error": str(e)})
+
+
+def run_workers(args) -> list:
+    """Launch one process per local worker, each running the full pipeline on its part of this shard."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=_run_worker, args=(args, worker_index, args.num_workers, results))
+        for worker_index in range(args.num_workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # Drain the queue before joining so that workers never block on a full pipe
+    summaries = {}
+    while len(summaries) < len(processes):
+        try:
+            summary = results.get(timeout=WORKER_POLL_SECONDS)
+            summaries[summary["worker_index"]] = summary
+        except queue.Empty:
+            # A worker that was killed, e.g. for running out of memory, never reports back
+            for worker_index, process in enumerate(processes):
+                if worker_index not in summaries and process.exitcode not in (None, 0):
+                    logger.error(f"Worker {worker_index} exited with code {process.exitcode}")
+                    summaries[worker_index] = {"worker_index": worker_index, "error": f"Exited with code {process.exitcode}"}
+    for process in processes:
+        process.join()
+
+    return [summaries[worker_index] for worker_index in sorted(summaries)]
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument("--data-path", type=str, required=True)
+    parser.add_argument("--data-format", type=str, choices=["auto", "parquet"], default="auto", help="Use 'parquet' to read a Parquet dataset directory. Paths ending in .parquet are detected automatically")
+    parser.add_argument("--start-date", type=datetime.fromisoformat, default=None, help="Only load Parquet messages at or after this ISO-8601 timestamp")
+    parser.add_argument("--end-date", type=datetime.fromisoformat, default=None, help="Only load Parquet messages before this ISO-8601 timestamp")
+    parser.add_argument("--conversation-ids", type=str, default=None, help="Comma-separated conversation ids to load from Parquet")
     parser.add_argument("--data-schema-path", type=str, required=True)
-    parser.add_argument("--destination", type=str, choices=["amplitude", "posthog"], required=True)
-    parser.add_argument("--model-provider", type=str, choices=["openai", "anthropic", "bedrock"], default="openai")
+    add_destination_arguments(parser)
+    add_outbox_arguments(parser)
+    parser.add_argument("--model-provider", type=str, choices=model_providers.names(), default="openai", help="Use 'replay' to run offline against recorded or synthetic responses")
+    add_replay_arguments(parser)
     parser.add_argument("--event-model", type=str, default="gpt-4o")
     parser.add_argument("--event-property-model", type=str, default="gpt-4.1")
     parser.add_argument("--explanation-model", type=str, default="gpt-4.1-mini")
     parser.add_argument("--llm-judge-model", type=str, default="gpt-4.1")
-    args = parser.parse_args()
+    parser.add_argument("--event-escalation-model", type=str, default=None, help="Cascade mode: tag events with --event-model first and re-run low-confidence conversations on this model")
+    parser.add_argument("--llm-judge-escalation-model", type=str, default=None, help="Cascade mode: judge with --llm-judge-model first and re-run low-confidence conversations on this model")
+    parser.add_argument("--cascade-min-confidence", type=float, default=0.8, help="The self-reported confidence below which cascade mode escalates to the larger model")
+    parser.add_argument("--combined-judge-events", action="store_true", help="Judge each conversation and tag its events in a single request to --event-model instead of separate requests")
+    parser.add_argument("--judge-sample-rate", type=float, default=None, help="Judge a stratified sample of this fraction of conversations instead of all of them, and report the estimated mean judge score with a confidence interval")
+    parser.add_argument("--judge-stratum-rate", type=parse_stratum_rate, action="append", default=[], help="The sample rate of strata matching a selector, e.g. length:long=0.5 or events:Crisis,user:frequent=1. Can be repeated; the highest matching rate is used")
+    parser.add_argument("--judge-strata", type=str, default="length,events,user", help="Comma-separated dimensions to stratify by: length (message count), events (most common event type) and user (conversations per user)")
+    parser.add_argument("--judge-min-per-stratum", type=int, default=2, help="The fewest conversations judged in each stratum")
+    parser.add_argument("--judge-impute", action="store_true", help="Give conversations that aren't judged their stratum's mean score instead of no llm_judge_score")
+    parser.add_argument("--max-concurrency", type=int, default=5, help="The number of concurrent LLM requests per stage")
+    add_pipeline_arguments(parser)
+    parser.add_argument("--chunk-size", type=int, default=None, help="Run the pipeline over this many conversations at a time, delivering each chunk's events before starting the next. Defaults to all at once")
+    add_client_arguments(parser)
+    parser.add_argument("--explanation-clusters", type=int, default=0, help="Cluster the explanations of each event type into this many clusters and upload each event's cluster as its explanation_cluster property")
+    parser.add_argument("--explanation-clusterer-path", type=str, default=None, help="Continue clustering from the clusters saved at this path (.npz), and save the updated clusters there")
+    parser.add_argument("--local-tagger-path", type=str, default=None, help="A local event tagger trained with train_local_tagger.py. Messages it tags confidently are not sent to the event model")
+    parser.add_argument("--local-tagger-threshold", type=float, default=0.9, help="The minimum local tagger probability needed to skip the event model for a message")
+    parser.add_argument("--shard-index", type=int, default=0, help="The shard of conversations (by hashed conversation_id) this invocation processes")
+    parser.add_argument("--num-shards", type=int, default=1, help="The total number of shards, e.g. one per machine")
+    parser.add_argument("--num-workers", type=int, default=1, help="The number of local worker processes to split this shard across")
+    parser.add_argument("--trace-path", type=str, default=None, help="Optional path to write OTLP/JSON trace spans of the run to. With multiple workers, each worker writes to its own file with the worker index appended")
+    parser.add_argument("--summary-path", type=str, default=None, help="Optional path to write the per-worker run summaries to as JSON")
+    add_plan_arguments(parser)
+    return parser
 
-    if args.model_provider == "openai":
-        openai_client = OpenAI()
-        model_provider = OpenAIModelProvider(openai_client)
-    elif args.model_provider == "anthropic":
-        anthropic_client = Anthropic()
-        model_provider = AnthropicModelProvider(anthropic_client)
-    elif args.model_provider == "bedrock":
-        bedrock_client = boto3.client("bedrock-runtime")
-        model_provider = BedrockModelProvider(bedrock_client)
 
-    data_schema = DataSchema.from_yaml(args.data_schema_path)
+def parse_stage_concurrency(value: str) -> Dict[str, int]:
+    """Parse a comma-separated list of stage=concurrency pairs, e.g. upload_events=20,generate_events=10."""
+    stage_concurrency = {}
+    for pair in value.split(","):
+        stage, _, concurrency = pair.partition("=")
+        if stage not in STAGES or not concurrency.isdigit():
+            raise argparse.ArgumentTypeError(f"Expected stage=concurrency with a stage in {STAGES}, got {pair}")
+        stage_concurrency[stage] = int(concurrency)
+    return stage_concurrency
 
-    # Automatically determine source type based on path prefix
-    if args.data_path.startswith("s3://"):
-        logger.info("Detected S3 path, loading data from S3")
-        s3_client = boto3.client("s3")
-        source = S3Source(s3_client, args.data_path)
-    else:
-        logger.info("Loading data from local file")
-        source = LocalSource(args.data_path)
 
-    if args.destination == "amplitude":
-        logger.info("Using Amplitude destination")
-        destination = AmplitudeDestination(amplitude_client=Amplitude(os.getenv("AMPLITUDE_API_KEY")))
-    else:
-        logger.info("Using Posthog destination")
-        posthog_client = Posthog(
-            project_api_key=os.getenv("POSTHOG_API_KEY"),
-            host=os.getenv("POSTHOG_HOST")
+def parse_stratum_rate(value: str) -> Tuple[str, float]:
+    """Parse a stratum selector and its sample rate, e.g. length:long,user:frequent=0.5."""
+    selector, _, rate = value.rpartition("=")
+    try:
+        rate = float(rate)
+    except ValueError:
+        rate = None
+    if not selector or rate is None or not 0 <= rate <= 1:
+        raise argparse.ArgumentTypeError(f"Expected dimension:value[,dimension:value]=rate with a rate between 0 and 1, got {value}")
+    return selector, rate
+
+
+def add_pipeline_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--executor", type=str, choices=list(EXECUTORS) + ["priority"], default="threads", help="How each stage runs its concurrent requests. 'priority' serves every stage from one queue that starts the largest requests first, with --max-concurrency workers")
+    parser.add_argument("--tokens-per-minute", type=int, default=None, help="With --executor priority, the estimated prompt tokens per minute to stay within")
+    parser.add_argument("--stage-concurrency", type=parse_stage_concurrency, default={}, help="Per-stage overrides of --max-concurrency, e.g. upload_events=20,generate_events=10")
+    parser.add_argument("--stream-responses", action="store_true", help="Stream LLM responses, parsing each message's result as soon as it's generated, and explain each conversation's events as soon as they're complete")
+    parser.add_argument("--hedge-requests", action="store_true", help="Send a duplicate of LLM requests that take longer than --hedge-quantile of recent requests to the same model and query, and use the first valid response")
+    parser.add_argument("--hedge-quantile", type=float, default=0.95, help="The latency quantile after which a request is hedged")
+    parser.add_argument("--hedge-max-extra-fraction", type=float, default=0.1, help="The maximum fraction of requests that are hedged, which caps the extra spend")
+    parser.add_argument("--hedge-min-samples", type=int, default=20, help="Requests to a model and query observed before their requests are hedged")
+
+
+def add_plan_arguments(parser: argparse.ArgumentParser, sampled: bool = True):
+    parser.add_argument("--plan", action="store_true", help="Don't send any requests. Build every prompt locally and print the requests, tokens, cost and duration the run would take")
+    parser.add_argument("--plan-models", type=str, default=None, help="YAML mapping of model ids to price and rate limit overrides for --plan, e.g. {gpt-4o: {tokens_per_minute: 800000}}")
+    if sampled:
+        parser.add_argument("--plan-sample-size", type=int, default=20000, help="With more conversations than this, --plan builds prompts for a random sample of them and scales up its totals")
+
+
+def add_outbox_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--outbox-path", type=str, default=None, help="Write events to this SQLite outbox before delivering them, so events that fail to send can be redelivered with replay_outbox.py")
+    parser.add_argument("--outbox-batch-size", type=int, default=100, help="Events delivered from the outbox per batch")
+    parser.add_argument("--outbox-max-attempts", type=int, default=8, help="Attempts to deliver a batch, with exponential backoff, before its events are left in the outbox for replay")
+
+
+def add_client_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--http-pool-size", type=int, default=None, help="Connections kept open to the model provider. Defaults to twice --max-concurrency")
+    parser.add_argument("--http2", action=argparse.BooleanOptionalAction, default=True, help="Use HTTP/2 for the OpenAI and Anthropic clients (requires the h2 package)")
+    parser.add_argument("--http-keepalive-expiry", type=float, default=60.0, help="Seconds an idle connection is kept alive")
+
+
+def add_destination_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--destination", type=str, choices=destinations.names(), required=True)
+    parser.add_argument("--destination-path", type=str, default=None, help="The output file for the jsonl destination, directory or s3:// URI for the parquet destination, or database file for the duckdb destination. Only one process at a time can write to a DuckDB database, so give each worker its own")
+    parser.add_argument("--posthog-threads", type=int, default=4, help="Background threads sending batches of events to PostHog")
+    parser.add_argument("--posthog-max-queue-size", type=int, default=10000, help="Events PostHog buffers before dropping new ones")
+    parser.add_argument("--amplitude-flush-queue-size", type=int, default=200, help="Events Amplitude buffers before sending a batch")
+    parser.add_argument("--amplitude-flush-interval-millis", type=int, default=10000, help="How often Amplitude sends buffered events")
+    parser.add_argument("--parquet-row-group-size", type=int, default=100000, help="Events buffered per write (and Parquet row group) by the parquet and duckdb destinations")
+    parser.add_argument("--parquet-compression", type=str, default="zstd", help="The Parquet compression codec, e.g. zstd, snappy or none")
+    parser.add_argument("--parquet-partition-by", type=str, default="date,event_type", help="Comma-separated columns to Hive-partition the Parquet dataset by, or empty for no partitioning")
+    parser.add_argument("--duckdb-table", type=str, default="events", help="The table the duckdb destination appends events to")
+
+
+def add_replay_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--replay-fixtures-path", type=str, default=None, help="Recorded responses for the replay model provider (JSON Lines)")
+    parser.add_argument("--replay-record-provider", type=str, choices=[name for name in model_providers.names() if name != "replay"], default=None, help="Send requests without a recorded response to this provider and record them to --replay-fixtures-path")
+    parser.add_argument("--replay-latency", type=float, default=0.0, help="Simulated seconds of overhead per replayed request")
+    parser.add_argument("--replay-seconds-per-input-token", type=float, default=0.0, help="Simulated prompt processing time per input token of replayed requests")
+    parser.add_argument("--replay-seconds-per-output-token", type=float, default=0.0, help="Simulated generation time per output token of replayed requests")
+    parser.add_argument("--replay-jitter", type=float, default=0.0, help="The sigma of the log-normal factor applied to the simulated latency")
+    parser.add_argument("--replay-error-rate", type=float, default=0.0, help="The fraction of replayed requests that fail")
+
+
+def check_args(parser: argparse.ArgumentParser, args):
+    """Report flags that can't be used together with parser.error."""
+    if args.judge_sample_rate is not None and args.combined_judge_events:
+        parser.error("--judge-sample-rate can't be used with --combined-judge-events, which judges every conversation in its event request")
+    if args.explanation_clusters and (args.num_shards > 1 or args.num_workers > 1) and not (
+        args.explanation_clusterer_path and os.path.exists(args.explanation_clusterer_path)
+    ):
+        parser.error(
+            "--explanation-clusters with --num-shards or --num-workers needs --explanation-clusterer-path to be clusters "
+            "fitted beforehand, e.g. by cluster_explanations.py, since each process would otherwise learn its own"
         )
-        destination = PosthogDestination(posthog_client=posthog_client)       
+    if args.destination == "duckdb" and args.num_workers > 1:
+        parser.error("--destination duckdb can't be used with --num-workers, since only one process at a time can write to a DuckDB database")
 
-    logger.info("Loading conversations")
-    conversations = source.get_conversations()
-    logger.info(f"Found {len(conversations)} conversations")
-
-    # TODO: EXECUTE THIS IN PARALLEL
-    logger.info("Performing LLM-as-a-judge on conversations")
-    llm_judge_scores_by_convo_id = dict()
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {
-            executor.submit(
-                LLMJudge(
-                    model_provider,
-                    args.llm_judge_model,
-                    data_schema.assistant,
-                    data_schema.llm_judge_criteria,
-                    conversation
-                ).query,
-                max_retries=2,
-                retry_delay=2,
-                timeout=60
-            ): conversation for conversation in conversations
-        }
-        
-        for future in tqdm(as_completed(futures), total=len(conversations), desc="Processing LLM Judge"):
-            try:
-                conversation = futures[future]
-                llm_judge_score = future.result()
-                llm_judge_scores_by_convo_id[conversation.id] = llm_judge_score
-            except Exception as e:
-                logger.error(f"Error running LLM Judge for conversation {conversation.id}: {e}")
-
-    logger.info("Generating events")
-    events_by_conversation = dict()
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {
-            executor.submit(
-                EventGenerator(
-                    model_provider,
-                    args.event_model, 
-                    data_schema.assistant, 
-                    data_schema.event_types,
-                    conversation=conversation
-                ).query,
-                max_retries=2,
-                retry_delay=2,
-                timeout=60
-            ): conversation for conversation in conversations
-        }
-        
-        for future in tqdm(as_completed(futures), total=len(conversations), desc="Generating events"):
-            try:
-                conversation = futures[future]
-                events_for_conversation = future.result()
-                events_by_conversation[conversation] = events_for_conversation
-            except Exception as e:
-                logger.error(f"Error processing conversation {conversation.id}: {e}")
-    
-    logger.info("Generating event explanations")
-    events = list()
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {}
-        for conversation, events_for_conversation in events_by_conversation.items():
-            future = executor.submit(
-                ExplanationGenerator(
-                    model_provider,
-                    args.explanation_model, 
-                    data_schema.assistant, 
-                    data_schema.event_types,
-                    events_for_conversation,
-                    conversation
-                ).query,
-                max_retries=2,
-                retry_delay=2,
-                timeout=60
-            )
-            futures[future] = conversation
-        
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Generating explanations"):
-            try:
-                events_with_explanations = future.result()
-                events.extend(events_with_explanations)
-            except Exception as e:
-                conversation = futures[future]
-                logger.error(f"Error generating explanation for conversation {conversation.id}: {e}")
-
-    logger.info("Generating event property values. Number of events: %d", len(events))
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {}
-        batch_size = 50
-        event_mapping = {event.message.message_id: i for i, event in enumerate(events)}
-
-        for event_type in data_schema.event_types:
-            events_for_event_type = [event for event in events if event.event_type == event_type]
-            if not events_for_event_type:
-                continue
-                
-            # Skip if no properties to process
-            if not event_type.properties:
-                continue
-                
-            for event_property in event_type.properties:
-                # Process events in batches
-                for i in range(0, len(events_for_event_type), batch_size):
-                    events_batch = events_for_event_type[i:i + batch_size]
-                    future = executor.submit(
-                        EventPropertyGenerator(
-                            model_provider,
-                            args.event_property_model, 
-                            data_schema.assistant, 
-                            event_type, 
-                            events_batch,
-                            event_property
-                        ).query,
-                        max_retries=2,
-                        retry_delay=2,
-                        timeout=60
-                    )
-                    futures[future] = (event_type.name, event_property.name, [event.message.message_id for event in events_batch])
-        
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Generating event properties"):
-            try:
-                events_with_property_values = future.result()
-                # Update existing events in events with new property values
-                for updated_event in events_with_property_values:
-                    message_id = updated_event.message.message_id
-                    if message_id in event_mapping:
-                        index = event_mapping[message_id]
-                        # Merge properties instead of replacing the entire event
-                        for prop, prop_value in updated_event.property_values.items():
-                            events[index].property_values[prop] = prop_value
-            except Exception as e:
-                event_type_name, property_name, _ = futures[future]
-                logger.error(f"Error generating property {property_name} for event type {event_type_name}: {e}")
-
-    logger.info(f"Uploading events")
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures= [
-            executor.submit(destination.send_event, event, llm_judge_scores_by_convo_id[event.conversation_id]) for event in events
-        ]
-        
-        for future in tqdm(as_completed(futures), total=len(events), desc="Uploading events"):
-            try:
-                future.result()
-            except Exception as e:
-                logger.error(f"Error sending event: {e}")
 
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+
+    if args.plan:
+        summary = plan(args)
+        if args.summary_path:
+            with open(args.summary_path, 'w') as f:
+                json.dump(summary, f, indent=4)
+        raise SystemExit(0)
+
+    if args.num_workers > 1:
+        summaries = run_workers(args)
+    else:
+        summaries = [run(args)]
 
+    for summary in summaries:
+        if "error" in summary:
+            logger.error(f"Worker {summary['worker_index']} failed: {summary['error']}")
+    logger.info(f"Sent {sum(s.get('events_sent', 0) for s in summaries)} events for {sum(s.get('conversations', 0) for s in summaries)} conversations")
+    if args.judge_sample_rate is not None and len(summaries) > 1:
+        from judge_sampling import combine_strata, estimate_mean
 
+        _log_judge_estimate(estimate_mean(combine_strata(s["judge_sampling"]["strata"] for s in summaries if "judge_sampling" in s)))
 
+    if args.summary_path:
+        with open(args.summary_path, 'w') as f:
+            json.dump(summaries, f, indent=4)
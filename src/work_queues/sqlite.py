@@ -0,0 +1,112 @@
+from datetime import datetime
+import json
+import sqlite3
+import threading
+import time
+from typing import List
+import uuid
+
+from models.conversation import Conversation
+from work_queues.work_queue import WorkItem, WorkQueue
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    A file-backed work queue that several local worker processes can share. Dead-lettered items stay in the
+    work_items table with status 'dead' and their last error.
+    """
+
+    poll_interval = 1
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        # Autocommit mode, so that transactions are controlled explicitly below
+        self.connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS work_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                visible_at REAL NOT NULL,
+                receipt TEXT,
+                receive_count INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                delivered TEXT,
+                last_error TEXT
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS work_items_status_visible_at ON work_items (status, visible_at)")
+
+    def send(self, conversations: List[Conversation]):
+        payload = json.dumps([c.to_dict() for c in conversations])
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO work_items (payload, enqueued_at, visible_at) VALUES (?, ?, ?)",
+                (payload, now, now)
+            )
+
+    def receive(self, max_items: int = 1, visibility_timeout: int = 600, wait_time: int = 0) -> List[WorkItem]:
+        deadline = time.time() + wait_time
+        while True:
+            items = self._receive(max_items, visibility_timeout)
+            if items or time.time() >= deadline:
+                return items
+            time.sleep(self.poll_interval)
+
+    def _receive(self, max_items: int, visibility_timeout: int) -> List[WorkItem]:
+        now = time.time()
+        with self.lock:
+            # BEGIN IMMEDIATE takes the write lock up front so two processes can't claim the same rows
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.connection.execute(
+                    "SELECT id, payload, enqueued_at, receive_count, delivered FROM work_items WHERE status = 'pending' AND visible_at <= ? ORDER BY id LIMIT ?",
+                    (now, max_items)
+                ).fetchall()
+
+                items = []
+                for row_id, payload, enqueued_at, receive_count, delivered in rows:
+                    receipt = f"{row_id}:{uuid.uuid4().hex}"
+                    self.connection.execute(
+                        "UPDATE work_items SET visible_at = ?, receipt = ?, receive_count = ? WHERE id = ?",
+                        (now + visibility_timeout, receipt, receive_count + 1, row_id)
+                    )
+                    items.append(WorkItem(
+                        receipt=receipt,
+                        conversations=[Conversation.from_dict(c) for c in json.loads(payload)],
+                        enqueued_at=datetime.fromtimestamp(enqueued_at),
+                        receive_count=receive_count + 1,
+                        delivered=set(json.loads(delivered)) if delivered else set()
+                    ))
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        return items
+
+    def ack(self, item: WorkItem):
+        # Matching on the receipt means a stale consumer can't delete an item that has since been redelivered
+        with self.lock:
+            self.connection.execute("DELETE FROM work_items WHERE receipt = ?", (item.receipt,))
+
+    def nack(self, item: WorkItem, delay: int = 0):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE work_items SET visible_at = ?, delivered = ? WHERE receipt = ?",
+                (time.time() + delay, json.dumps(sorted(item.delivered)), item.receipt)
+            )
+
+    def dead_letter(self, item: WorkItem, error: str):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE work_items SET status = 'dead', delivered = ?, last_error = ? WHERE receipt = ?",
+                (json.dumps(sorted(item.delivered)), error, item.receipt)
+            )
+
+    def approximate_depth(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM work_items WHERE status = 'pending'").fetchone()[0]
@@ -0,0 +1,107 @@
+from datetime import datetime
+import json
+from typing import List, Optional
+
+import boto3
+
+from models.conversation import Conversation
+from work_queues.work_queue import WorkItem, WorkQueue
+
+
+class SQSWorkQueue(WorkQueue):
+    """
+    A work queue on SQS. Items that keep failing are moved to dead_letter_queue_url if one is given, otherwise
+    they're hidden for as long as SQS allows, for the queue's own redrive policy to move them.
+    """
+
+    # SQS caps both the number of messages per receive and the long-poll wait
+    max_receive_items = 10
+    max_wait_time = 20
+    # And how long a message can be hidden, or a new message delayed
+    max_visibility_timeout = 12 * 60 * 60
+    max_delay_seconds = 15 * 60
+
+    def __init__(self, sqs_client: boto3.client, queue_url: str, dead_letter_queue_url: Optional[str] = None):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.dead_letter_queue_url = dead_letter_queue_url
+
+    def send(self, conversations: List[Conversation]):
+        self.sqs_client.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps([c.to_dict() for c in conversations])
+        )
+
+    def receive(self, max_items: int = 1, visibility_timeout: int = 600, wait_time: int = 0) -> List[WorkItem]:
+        response = self.sqs_client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_items, self.max_receive_items),
+            VisibilityTimeout=visibility_timeout,
+            WaitTimeSeconds=min(wait_time, self.max_wait_time),
+            AttributeNames=["SentTimestamp", "ApproximateReceiveCount"]
+        )
+
+        items = []
+        for message in response.get("Messages", []):
+            attributes = message.get("Attributes", {})
+            body = json.loads(message["Body"])
+            # A retried batch is sent again as an object with its delivered events, see nack
+            if isinstance(body, list):
+                body = {"conversations": body, "enqueued_at": int(attributes["SentTimestamp"]) / 1000}
+            items.append(WorkItem(
+                receipt=message["ReceiptHandle"],
+                conversations=[Conversation.from_dict(c) for c in body["conversations"]],
+                enqueued_at=datetime.fromtimestamp(body["enqueued_at"]),
+                receive_count=body.get("receive_count", 0) + int(attributes.get("ApproximateReceiveCount", 1)),
+                delivered=set(body.get("delivered", []))
+            ))
+        return items
+
+    def ack(self, item: WorkItem):
+        self.sqs_client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=item.receipt)
+
+    def nack(self, item: WorkItem, delay: int = 0):
+        if not item.delivered:
+            self.sqs_client.change_message_visibility(
+                QueueUrl=self.queue_url, ReceiptHandle=item.receipt, VisibilityTimeout=min(delay, self.max_visibility_timeout)
+            )
+            return
+
+        # Messages can't be changed, so the batch is sent again with its delivered events, and the original deleted
+        self.sqs_client.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=self._retry_body(item),
+            DelaySeconds=min(delay, self.max_delay_seconds)
+        )
+        self.ack(item)
+
+    def dead_letter(self, item: WorkItem, error: str):
+        if not self.dead_letter_queue_url:
+            self.sqs_client.change_message_visibility(
+                QueueUrl=self.queue_url, ReceiptHandle=item.receipt, VisibilityTimeout=self.max_visibility_timeout
+            )
+            return
+
+        self.sqs_client.send_message(
+            QueueUrl=self.dead_letter_queue_url,
+            MessageBody=self._retry_body(item),
+            MessageAttributes={"error": {"DataType": "String", "StringValue": error}}
+        )
+        self.ack(item)
+
+    def approximate_depth(self) -> int:
+        response = self.sqs_client.get_queue_attributes(
+            QueueUrl=self.queue_url,
+            AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"]
+        )
+        attributes = response["Attributes"]
+        return int(attributes["ApproximateNumberOfMessages"]) + int(attributes["ApproximateNumberOfMessagesNotVisible"])
+
+    @staticmethod
+    def _retry_body(item: WorkItem) -> str:
+        return json.dumps({
+            "conversations": [c.to_dict() for c in item.conversations],
+            "enqueued_at": item.enqueued_at.timestamp(),
+            "receive_count": item.receive_count,
+            "delivered": sorted(item.delivered)
+        })
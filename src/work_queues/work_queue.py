@@ -0,0 +1,52 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Set
+
+from models.conversation import Conversation
+
+
+@dataclass
+class WorkItem:
+    receipt: str
+    conversations: List[Conversation]
+    enqueued_at: datetime
+    receive_count: int = 1
+    # The insert_ids of the batch's events that earlier deliveries already sent, so a retry can skip them
+    delivered: Set[str] = field(default_factory=set)
+
+
+class WorkQueue(ABC):
+    """
+    An at-least-once queue of conversation batches.
+
+    Received items stay invisible to other consumers for the visibility timeout. An item is only removed
+    once it is acknowledged; otherwise it becomes visible again and is redelivered.
+    """
+
+    @abstractmethod
+    def send(self, conversations: List[Conversation]):
+        pass
+
+    @abstractmethod
+    def receive(self, max_items: int = 1, visibility_timeout: int = 600, wait_time: int = 0) -> List[WorkItem]:
+        pass
+
+    @abstractmethod
+    def ack(self, item: WorkItem):
+        pass
+
+    @abstractmethod
+    def nack(self, item: WorkItem, delay: int = 0):
+        """Make the item visible again after delay seconds so that it is retried, keeping its delivered events."""
+        pass
+
+    @abstractmethod
+    def dead_letter(self, item: WorkItem, error: str):
+        """Set aside an item that keeps failing, so that it's no longer redelivered."""
+        pass
+
+    @abstractmethod
+    def approximate_depth(self) -> int:
+        """The approximate number of batches waiting to be processed."""
+        pass
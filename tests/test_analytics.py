@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from analytics import funnel, judge_scores_by_event_type, judge_scores_by_property, load_events, time_to_event, transition_matrix
+from destinations.jsonl import JsonlDestination
+from models.conversation import Message, ROLE
+from models.event import Event, EventType
+
+START = datetime(2024, 1, 1, 10)
+
+# (event type, seconds from the start, tone) of each conversation's events, and the conversation's judge score
+CONVERSATIONS = {
+    "c1": ([("greet", 0, None), ("question", 10, "calm"), ("answer", 20, None)], 80),
+    "c2": ([("question", 0, "angry"), ("answer", 5, None), ("question", 30, "calm")], 40),
+    "c3": ([("greet", 0, None), ("greet", 5, None)], None)
+}
+
+
+@pytest.fixture
+def events(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    destination = JsonlDestination(path)
+    # Sent out of order, as the pipeline's concurrent conversations would be
+    for conversation_id, (conversation_events, score) in reversed(CONVERSATIONS.items()):
+        for i, (event_type, seconds, tone) in reversed(list(enumerate(conversation_events))):
+            role = ROLE.assistant if event_type == "answer" else ROLE.user
+            destination.send_event(Event(
+                user_id="user",
+                event_type=EventType(event_type, event_type, role),
+                conversation_id=conversation_id,
+                message=Message(role, "...", START + timedelta(seconds=seconds), str(i)),
+                property_values={"tone": tone} if tone else {}
+            ), score)
+    destination.flush()
+    return load_events(path)
+
+
+def test_events_are_sorted_by_conversation_and_time(events):
+    assert len(events) == 8
+    assert events.num_conversations == 3
+    assert np.all(np.diff(events.conversations) >= 0)
+    assert sorted(np.diff(np.r_[events.conversation_starts, len(events)]).tolist()) == [2, 3, 3]
+
+
+def test_transition_matrix(events):
+    matrix = transition_matrix(events)
+    names = events.event_type_names
+    transitions = {
+        (names[i], names[j]): int(matrix[i, j]) for i in range(len(names)) for j in range(len(names)) if matrix[i, j]
+    }
+
+    assert transitions == {("greet", "question"): 1, ("question", "answer"): 2, ("answer", "question"): 1, ("greet", "greet"): 1}
+
+
+def test_funnel(events):
+    steps = funnel(events, ["greet", "question", "answer"])
+
+    assert [step["conversations"] for step in steps] == [2, 1, 1]
+    assert [step["conversion_from_previous"] for step in steps] == [None, 0.5, 1.0]
+    assert [step["conversion_from_start"] for step in steps] == [None, 0.5, 0.5]
+    assert [step["median_seconds_from_previous"] for step in steps] == [None, 10.0, 10.0]
+
+
+def test_judge_scores_by_event_type(events):
+    scores = judge_scores_by_event_type(events)
+
+    # c3 has no judge score, so greet only counts c1
+    assert scores["greet"]["conversations"] == 1
+    assert scores["greet"]["mean"] == 80.0
+    # c2 has two questions but counts once
+    assert scores["question"]["conversations"] == 2
+    assert scores["question"]["mean"] == 60.0
+    assert scores["question"]["median"] == 40.0
+    assert sum(scores["question"]["histogram"]) == 2
+
+
+def test_judge_scores_by_property(events):
+    scores = judge_scores_by_property(events, "tone")
+
+    assert {value: (s["conversations"], s["mean"]) for value, s in scores.items()} == {"calm": (2, 60.0), "angry": (1, 40.0)}
+    with pytest.raises(ValueError):
+        judge_scores_by_property(events, "unknown")
+
+
+def test_time_to_event(events):
+    result = time_to_event(events, "answer")
+
+    assert result["conversations_reached"] == 2
+    assert result["fraction_reached"] == pytest.approx(2 / 3)
+    assert result["seconds"]["mean"] == 12.5
+    assert result["turns"]["mean"] == 1.5
+
@@ -0,0 +1,65 @@
+from datetime import datetime
+import glob
+import os
+
+import duckdb
+import pyarrow.dataset as ds
+
+from destinations.duckdb import DuckDBDestination
+from destinations.parquet import ParquetDestination
+from models.conversation import Message, ROLE
+from models.event import Event, EventType
+
+
+def event(message_id: str, event_type: str = "greeting", day: int = 1, model_id: str = "model") -> Event:
+    return Event(
+        user_id="user",
+        event_type=EventType(event_type, event_type, ROLE.user),
+        conversation_id="conversation",
+        message=Message(ROLE.user, "hi", datetime(2024, 1, day, 10), message_id),
+        property_values={"tone": "calm"},
+        model_id=model_id
+    )
+
+
+def test_parquet_destination_writes_hive_partitions_per_batch(tmp_path):
+    path = str(tmp_path / "events")
+    destination = ParquetDestination(path, row_group_size=2)
+    destination.send_event(event("0"), 80)
+    destination.send_event(event("1", "question"), 80)
+    # The first two events fill a batch and are written without a flush
+    assert len(glob.glob(os.path.join(path, "**", "*.parquet"), recursive=True)) == 2
+
+    destination.send_event(event("2", day=2, model_id=None), None)
+    destination.flush()
+
+    table = ds.dataset(path, format="parquet", partitioning="hive").to_table().sort_by("message_id")
+    assert table.column("message_id").to_pylist() == ["0", "1", "2"]
+    assert table.column("event_type").to_pylist() == ["greeting", "question", "greeting"]
+    assert table.column("date").to_pylist() == ["2024-01-01", "2024-01-01", "2024-01-02"]
+    assert table.column("event_model").to_pylist() == ["model", "model", None]
+    assert table.column("llm_judge_score").to_pylist() == [80, 80, None]
+    assert table.column("event_properties").to_pylist()[0] == [("tone", "calm")]
+
+
+def test_parquet_destinations_append_without_overwriting(tmp_path):
+    path = str(tmp_path / "events")
+    for message_id in ["0", "1"]:
+        destination = ParquetDestination(path)
+        destination.send_event(event(message_id), 80)
+        destination.flush()
+
+    assert ds.dataset(path, format="parquet", partitioning="hive").count_rows() == 2
+
+
+def test_duckdb_destination_appends_to_the_table(tmp_path):
+    path = str(tmp_path / "events.duckdb")
+    for message_ids in [["0", "1"], ["2"]]:
+        destination = DuckDBDestination(path, table="tagged")
+        for message_id in message_ids:
+            destination.send_event(event(message_id), 80)
+        destination.flush()
+        destination.connection.close()
+
+    connection = duckdb.connect(path, read_only=True)
+    assert connection.execute('SELECT message_id, llm_judge_score FROM "tagged" ORDER BY message_id').fetchall() == [("0", 80), ("1", 80), ("2", 80)]
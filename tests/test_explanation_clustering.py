@@ -0,0 +1,83 @@
+from datetime import datetime
+
+import numpy as np
+
+from explanation_clustering import ExplanationClusterer, NearestNeighborIndex
+from models.conversation import Message, ROLE
+from models.event import Event, EventType
+
+SLEEP = [f"The user describes trouble sleeping and waking up at night, night {i}" for i in range(10)]
+WORK = [f"The user is stressed about deadlines and their manager at work, week {i}" for i in range(10)]
+
+
+def events(explanations, event_type="concern"):
+    return [
+        Event(
+            user_id="user",
+            event_type=EventType(event_type, event_type, ROLE.user),
+            conversation_id="conversation",
+            message=Message(ROLE.user, "...", datetime(2024, 1, 1), str(i)),
+            explanation=explanation
+        )
+        for i, explanation in enumerate(explanations)
+    ]
+
+
+def clusterer() -> ExplanationClusterer:
+    return ExplanationClusterer(n_clusters=2, n_features=512, index_dimensions=64)
+
+
+def test_index_search_and_reservoir_capacity():
+    vectors = np.eye(8, dtype=np.float32)
+    index = NearestNeighborIndex(8, capacity=5)
+    index.add(vectors[:3], ["0", "1", "2"])
+
+    assert index.search(vectors[1:2], k=2)[0][0] == ("1", 1.0)
+
+    index.add(vectors[3:], [str(i) for i in range(3, 8)])
+    assert len(index) == 5
+    assert index.num_added == 8
+
+
+def test_clusters_separate_distinct_explanations():
+    fitted = clusterer().partial_fit(events(SLEEP + WORK))
+
+    labels = fitted.predict_explanations("concern", SLEEP + WORK)
+    assert len(set(labels[:10])) == 1
+    assert len(set(labels[10:])) == 1
+    assert labels[0] != labels[10]
+    assert sorted(c["explanations"] for c in fitted.summary()["concern"]) == [10, 10]
+
+
+def test_explanations_are_unlabeled_until_every_cluster_is_seeded():
+    fitted = clusterer().partial_fit(events(SLEEP[:1]))
+    labeled = fitted.label(events(SLEEP[:1]))
+
+    assert fitted.predict_explanations("concern", SLEEP[:1]).tolist() == [-1]
+    assert fitted.predict_explanations("unknown", SLEEP[:1]).tolist() == [-1]
+    assert "explanation_cluster" not in labeled[0].property_values
+
+    fitted.partial_fit(events(WORK[:1]))
+    assert "explanation_cluster" in fitted.label(events(SLEEP[:1]))[0].property_values
+
+
+def test_similar_finds_the_closest_explanations():
+    training = events(SLEEP + WORK)
+    fitted = clusterer().partial_fit(training)
+
+    ids = [insert_id for insert_id, _ in fitted.similar("concern", "stressed about deadlines at work", k=5)]
+
+    work_ids = {event.insert_id for event in training if event.explanation in WORK}
+    assert set(ids) <= work_ids
+    assert fitted.similar("unknown", "anything") == []
+
+
+def test_save_and_load(tmp_path):
+    fitted = clusterer().partial_fit(events(SLEEP + WORK))
+    path = str(tmp_path / "clusters.npz")
+    fitted.save(path)
+
+    loaded = ExplanationClusterer.load(path)
+
+    assert loaded.predict_explanations("concern", SLEEP + WORK).tolist() == fitted.predict_explanations("concern", SLEEP + WORK).tolist()
+    assert loaded.summary() == fitted.summary()
@@ -0,0 +1,93 @@
+import itertools
+import time
+
+import pytest
+
+from llm_queries.hedging import HedgingPolicy, LatencyTracker
+
+KEY = ("model", "EventGenerator")
+
+
+def policy(**kwargs) -> HedgingPolicy:
+    # With plenty of fast requests already recorded, anything slower than 10ms is hedged
+    policy = HedgingPolicy(min_samples=20, **kwargs)
+    for _ in range(200):
+        policy.latencies.record(KEY, 0.01)
+    return policy
+
+
+def test_latency_quantiles_need_min_samples():
+    tracker = LatencyTracker(min_samples=3)
+    tracker.record(KEY, 1.0)
+    tracker.record(KEY, 3.0)
+    assert tracker.quantile(KEY, 0.5) is None
+
+    tracker.record(KEY, 2.0)
+    assert tracker.quantile(KEY, 0.5) == 2.0
+    assert tracker.quantile(("other", "query"), 0.5) is None
+
+
+def test_requests_arent_hedged_without_latency_history():
+    hedging = HedgingPolicy(max_extra_fraction=1.0)
+
+    assert hedging.call(KEY, lambda: time.sleep(0.05) or "response") == "response"
+    assert hedging.stats()["hedged_requests"] == 0
+    hedging.close()
+
+
+def test_slow_requests_are_hedged_and_the_first_response_wins():
+    hedging = policy(max_extra_fraction=1.0)
+    calls = itertools.count()
+
+    def request():
+        # The first request is stuck, the hedge returns quickly
+        if next(calls) == 0:
+            time.sleep(1)
+            return "slow"
+        return "fast"
+
+    start = time.perf_counter()
+    assert hedging.call(KEY, request) == "fast"
+    assert time.perf_counter() - start < 0.5
+    stats = hedging.stats()
+    assert (stats["requests"], stats["hedged_requests"], stats["hedge_wins"]) == (1, 1, 1)
+    hedging.close()
+
+
+def test_hedges_are_capped_at_the_extra_fraction():
+    hedging = policy(max_extra_fraction=0.25)
+
+    for _ in range(8):
+        hedging.call(KEY, lambda: time.sleep(0.05) or "response")
+
+    assert hedging.stats()["hedged_requests"] == 2
+    hedging.close()
+
+
+def test_a_failed_hedge_doesnt_replace_the_first_response():
+    hedging = policy(max_extra_fraction=1.0)
+    calls = itertools.count()
+
+    def request():
+        if next(calls) == 0:
+            time.sleep(0.1)
+            return "first"
+        raise ValueError("invalid response")
+
+    assert hedging.call(KEY, request) == "first"
+    assert hedging.stats()["hedge_wins"] == 0
+    hedging.close()
+
+
+def test_the_first_error_is_raised_when_both_fail():
+    hedging = policy(max_extra_fraction=1.0)
+    calls = itertools.count()
+
+    def request():
+        call = next(calls)
+        time.sleep(0.05 if call == 0 else 0)
+        raise ValueError(f"error {call}")
+
+    with pytest.raises(ValueError, match="error 0"):
+        hedging.call(KEY, request)
+    hedging.close()
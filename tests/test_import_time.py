@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from import_time import benchmark
+
+
+@pytest.mark.parametrize("module", ["upload_events", "generate_schema", "ingest_worker", "run_tenants", "replay_outbox"])
+def test_cli_doesnt_import_sdks_at_startup(module):
+    assert benchmark(module, repeat=1)["eager_sdk_imports"] == []
@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from judge_sampling import StratifiedJudgeSampler, StratumStats, combine_strata, estimate_mean
+from models.conversation import Conversation, Message, ROLE
+from models.event import Event, EventType
+
+
+def conversation(conversation_id: str, num_messages: int = 2, user_id: str = None) -> Conversation:
+    return Conversation(conversation_id, user_id or f"user_{conversation_id}", [
+        Message(ROLE.user, "...", datetime(2024, 1, 1) + timedelta(seconds=i), str(i)) for i in range(num_messages)
+    ])
+
+
+def events_of_type(conversation: Conversation, event_type: str):
+    return [
+        Event(conversation.user_id, EventType(event_type, event_type, ROLE.user), conversation.id, message)
+        for message in conversation.messages
+    ]
+
+
+def test_stratum_names():
+    sampler = StratifiedJudgeSampler()
+    long_conversation = conversation("a", num_messages=30)
+
+    assert sampler.stratum(long_conversation, events_of_type(long_conversation, "Crisis"), 1) == "length:long,events:Crisis,user:one-off"
+    assert sampler.stratum(conversation("b", 10), [], 3) == "length:medium,events:none,user:returning"
+    assert StratifiedJudgeSampler(dimensions=["user"]).stratum(conversation("c"), [], 6) == "user:frequent"
+
+
+def test_sample_rates_by_stratum():
+    conversations = [conversation(f"short_{i}") for i in range(100)] + [conversation(f"long_{i}", 30) for i in range(10)]
+    sampler = StratifiedJudgeSampler(default_rate=0.1, rates={"length:long": 1.0}, dimensions=["length"])
+
+    sample = sampler.sample(conversations, {})
+
+    judged = {c.id for c in sample.conversations}
+    assert len([c for c in judged if c.startswith("short")]) == 10
+    assert {f"long_{i}" for i in range(10)} <= judged
+    assert sample.strata["short_0"] == "length:short"
+
+
+def test_small_strata_keep_min_per_stratum():
+    conversations = [conversation(f"short_{i}") for i in range(5)] + [conversation("long", 30)]
+    sampler = StratifiedJudgeSampler(default_rate=0.01, dimensions=["length"], min_per_stratum=2)
+
+    judged = [c.id for c in sampler.sample(conversations, {}).conversations]
+
+    assert len(judged) == 3
+    assert "long" in judged
+
+
+def test_samples_are_deterministic_and_consistent():
+    conversations = [conversation(str(i)) for i in range(200)]
+    sampler = StratifiedJudgeSampler(default_rate=0.1, dimensions=["length"])
+
+    first = {c.id for c in sampler.sample(conversations, {}).conversations}
+    again = {c.id for c in sampler.sample(list(reversed(conversations)), {}).conversations}
+
+    assert first == again
+
+
+def test_count_users_stratifies_by_every_loaded_conversation():
+    conversations = [conversation(str(i), user_id="user") for i in range(6)]
+    sampler = StratifiedJudgeSampler(dimensions=["user"])
+
+    assert set(sampler.sample(conversations[:1], {}).strata.values()) == {"user:one-off"}
+    sampler.count_users(conversations)
+    assert set(sampler.sample(conversations[:1], {}).strata.values()) == {"user:frequent"}
+
+
+def test_record_accumulates_strata_and_imputes_scores():
+    conversations = [conversation(f"short_{i}") for i in range(4)] + [conversation(f"long_{i}", 30) for i in range(2)]
+    sampler = StratifiedJudgeSampler(default_rate=0.5, min_per_stratum=1, dimensions=["length"], impute=True)
+    sample = sampler.sample(conversations, {})
+    judged = [c.id for c in sample.conversations]
+    scores = {conversation_id: 80 if conversation_id.startswith("short") else 40 for conversation_id in judged}
+
+    recorded = sampler.record(sample, scores)
+
+    assert len(judged) == 3
+    assert recorded == {**{f"short_{i}": 80 for i in range(4)}, **{f"long_{i}": 40 for i in range(2)}}
+    estimate = sampler.estimate()
+    assert estimate["strata"]["length:short"] == {"population": 4, "judged": 2, "total": 160.0, "total_squares": 12800.0}
+    assert estimate["mean"] == pytest.approx((4 * 80 + 2 * 40) / 6, abs=1e-3)
+    assert estimate["by_dimension"]["length:long"]["mean"] == 40.0
+
+
+def test_unjudged_conversations_get_no_score_without_impute():
+    sampler = StratifiedJudgeSampler(default_rate=0.5, min_per_stratum=1, dimensions=["length"])
+    sample = sampler.sample([conversation("a"), conversation("b")], {})
+    judged = sample.conversations[0].id
+
+    assert sampler.record(sample, {judged: 70}) == {judged: 70}
+
+
+@pytest.mark.parametrize("kwargs", [{"dimensions": ["size"]}, {"rates": {"size:large": 1.0}}, {"rates": {"length": 1.0}}])
+def test_invalid_configuration(kwargs):
+    with pytest.raises(ValueError):
+        StratifiedJudgeSampler(**kwargs)
+
+
+def stratum(population, scores) -> StratumStats:
+    stats = StratumStats(population=population)
+    for score in scores:
+        stats.add_score(score)
+    return stats
+
+
+def test_estimate_mean_weights_strata_by_population():
+    estimate = estimate_mean({"short": stratum(30, [80, 80, 80]), "long": stratum(10, [40, 40])})
+
+    assert estimate["mean"] == 70.0
+    assert estimate["standard_error"] == 0.0
+    assert estimate["judged"] == 5
+    assert estimate["conversations"] == 40
+
+
+def test_estimate_mean_fully_judged_strata_add_no_uncertainty():
+    estimate = estimate_mean({"all": stratum(4, [10, 20, 30, 40])})
+
+    assert estimate["mean"] == 25.0
+    assert estimate["standard_error"] == 0.0
+
+
+def test_estimate_mean_confidence_interval():
+    scores = [10, 20, 30, 40]
+    estimate = estimate_mean({"sample": stratum(1000, scores)}, confidence=0.95)
+
+    standard_error = np.std(scores, ddof=1) / 2 * np.sqrt(1 - 4 / 1000)
+    assert estimate["standard_error"] == pytest.approx(standard_error, abs=1e-3)
+    assert estimate["ci_low"] == pytest.approx(25 - 1.96 * standard_error, abs=1e-2)
+    assert estimate["ci_high"] == pytest.approx(25 + 1.96 * standard_error, abs=1e-2)
+
+
+def test_estimate_mean_excludes_unjudged_strata():
+    estimate = estimate_mean({"judged": stratum(10, [50, 70]), "unjudged": stratum(5, [])})
+
+    assert estimate["mean"] == 60.0
+    assert estimate["unjudged_conversations"] == 5
+    assert estimate_mean({"unjudged": stratum(5, [])})["mean"] is None
+
+
+def test_combine_strata_merges_shards():
+    shards = [{"a": {"population": 10, "judged": 2, "total": 100.0, "total_squares": 5200.0}}, {"a": {"population": 5, "judged": 1, "total": 30.0, "total_squares": 900.0}}]
+
+    combined = combine_strata(shards)
+
+    assert combined["a"] == StratumStats(population=15, judged=3, total=130.0, total_squares=6100.0)
@@ -0,0 +1,182 @@
+from datetime import datetime
+import json
+from typing import Dict, List
+
+import pytest
+
+from llm_queries.event_generator import EventGenerator
+from llm_queries.judged_event_generator import JudgedEventGenerator
+from llm_queries.llm_query import ModelProvider
+from llm_queries.schema_validation import split_valid_entries, validation_errors
+from llm_queries.streaming import IncrementalObjectParser
+from models.assistant import Assistant
+from models.conversation import Conversation, Message, ROLE
+from models.event import EventType
+from models.llm_judge_criteria import LLMJudgeCriteria
+
+
+class ScriptedModelProvider(ModelProvider):
+    """Returns the given responses in order, recording the response schema of each request."""
+
+    def __init__(self, responses: List[Dict]):
+        self.responses = list(responses)
+        self.schemas = []
+
+    def query(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int = 60):
+        self.schemas.append(response_schema)
+        return self.responses.pop(0)
+
+    def response_format(self, response_schema: Dict) -> Dict:
+        return response_schema
+
+
+EVENT_TYPES = [
+    EventType("question", "The user asks a question", ROLE.user),
+    EventType("greeting", "The user greets the assistant", ROLE.user),
+    EventType("answer", "The assistant answers", ROLE.assistant)
+]
+
+CONVERSATION = Conversation("conversation", "user", [
+    Message(ROLE.user, "What's up?", datetime(2024, 1, 1, 10), "0"),
+    Message(ROLE.assistant, "Not much.", datetime(2024, 1, 1, 10, 0, 1), "1"),
+    Message(ROLE.user, "And you?", datetime(2024, 1, 1, 10, 0, 2), "2")
+])
+
+
+def event_generator(responses: List[Dict]) -> EventGenerator:
+    provider = ScriptedModelProvider(responses)
+    return EventGenerator(provider, "model", Assistant("assistant", "A chat assistant"), EVENT_TYPES, CONVERSATION)
+
+
+def test_parser_returns_entries_as_they_complete():
+    text = json.dumps({"0": "question", "1": {"type": "answer", "tags": ["a", "b}"]}, "2": "say \"hi\", then {"})
+    parser = IncrementalObjectParser()
+
+    entries = []
+    completed_at = []
+    for i, c in enumerate(text):
+        for entry in parser.feed(c):
+            entries.append(entry)
+            completed_at.append(i)
+
+    assert entries == list(json.loads(text).items())
+    # The first entry is available as soon as the comma after it arrives, long before the whole object
+    assert completed_at[0] == text.index(",")
+    assert parser.buffer == text
+
+
+def test_parser_handles_empty_objects():
+    parser = IncrementalObjectParser()
+    assert parser.feed("{") == []
+    assert parser.feed(" }") == []
+
+
+@pytest.mark.parametrize("value, schema, errors", [
+    ({"a": 1}, {"type": "object", "properties": {"a": {"type": "integer"}}, "required": ["a"]}, []),
+    ({"a": 1.0}, {"type": "object", "properties": {"a": {"type": "integer"}}}, []),
+    ({"a": True}, {"type": "object", "properties": {"a": {"type": "number"}}}, ["$.a: expected number, got bool"]),
+    ({}, {"type": "object", "required": ["a"]}, ["$: missing required property a"]),
+    ({"b": 1}, {"type": "object", "properties": {}, "additionalProperties": False}, ["$: unexpected property b"]),
+    (["x", "z"], {"type": "array", "items": {"type": "string", "enum": ["x", "y"]}}, ["$[1]: 'z' is not one of ['x', 'y']"]),
+    (None, {"type": ["string", "null"]}, [])
+])
+def test_validation_errors(value, schema, errors):
+    assert validation_errors(value, schema) == errors
+
+
+def test_split_valid_entries():
+    schema = {
+        "type": "object",
+        "properties": {"0": {"type": "string", "enum": ["question"]}, "1": {"type": "string"}, "2": {"type": "string"}},
+        "required": ["0", "1", "2"]
+    }
+
+    entries, failed = split_valid_entries({"0": "question", "1": 5, "extra": "x"}, schema)
+
+    assert entries == {"0": "question"}
+    assert failed == ["1", "2"]
+    with pytest.raises(ValueError):
+        split_valid_entries(["question"], schema)
+
+
+def test_event_generator_requeries_only_invalid_entries():
+    generator = event_generator([
+        {"0": "question", "1": "question", "2": "question"},
+        {"1": "answer"}
+    ])
+
+    events = generator.query(retry_delay=0)
+
+    assert [(e.message.message_id, e.event_type.name) for e in events] == [("0", "question"), ("1", "answer"), ("2", "question")]
+    # The follow-up asks for just the entry that was invalid
+    assert list(generator.model_provider.schemas[1]["properties"]) == ["1"]
+    # Entries kept from the first response are passed to the follow-up as already tagged, but keep the LLM's model
+    assert {e.model_id for e in events} == {"model"}
+
+
+def test_event_generator_drops_entries_still_invalid_after_every_follow_up():
+    generator = event_generator([{"0": "question", "1": "unknown", "2": "question"}] + [{"1": "unknown"}] * 2)
+
+    events = generator.query(max_retries=2, retry_delay=0)
+
+    assert [e.message.message_id for e in events] == ["0", "2"]
+    assert len(generator.model_provider.schemas) == 3
+
+
+def test_event_generator_streams_valid_entries_once():
+    generator = event_generator([
+        {"0": "question", "1": "question", "2": "question"},
+        {"1": "answer"}
+    ])
+    streamed = []
+
+    events = generator.query(retry_delay=0, on_item=streamed.append)
+
+    assert [e.message.message_id for e in streamed] == ["0", "2", "1"]
+    # The streamed events are copies, so later stages updating the events don't change them
+    assert {(e.message.message_id, e.event_type.name) for e in streamed} == {(e.message.message_id, e.event_type.name) for e in events}
+    assert not set(map(id, events)) & set(map(id, streamed))
+
+
+def test_judged_event_generator_streams_each_event():
+    provider = ScriptedModelProvider([{"score": 70, "0": "question", "1": "answer", "2": "question"}])
+    generator = JudgedEventGenerator(
+        provider, "model", Assistant("assistant", "A chat assistant"), LLMJudgeCriteria(["help"], [], [], []), EVENT_TYPES, CONVERSATION
+    )
+    streamed = []
+
+    score, events = generator.query(retry_delay=0, on_item=streamed.append)
+
+    assert score == 70
+    assert [e.message.message_id for e in streamed] == ["0", "1", "2"]
+    assert [e.event_type.name for e in events] == ["question", "answer", "question"]
+
+
+def test_retried_attempts_stream_changed_values_again():
+    provider = ScriptedModelProvider([
+        {"score": 150, "0": "question", "1": "answer", "2": "question"},
+        {"score": 70, "0": "greeting", "1": "answer", "2": "question"}
+    ])
+    generator = JudgedEventGenerator(
+        provider, "model", Assistant("assistant", "A chat assistant"), LLMJudgeCriteria(["help"], [], [], []), EVENT_TYPES, CONVERSATION
+    )
+    streamed = []
+
+    # The first response's score is out of bounds, so it's requested again
+    score, events = generator.query(retry_delay=0, on_item=streamed.append)
+
+    assert score == 70
+    assert [(e.message.message_id, e.event_type.name) for e in streamed] == [("0", "question"), ("1", "answer"), ("2", "question"), ("0", "greeting")]
+    assert [e.event_type.name for e in events] == ["greeting", "answer", "question"]
+
+
+def test_event_generator_only_asks_for_messages_that_werent_pretagged():
+    provider = ScriptedModelProvider([{"1": "answer", "2": "question"}])
+    generator = EventGenerator(
+        provider, "model", Assistant("assistant", "A chat assistant"), EVENT_TYPES, CONVERSATION, pretagged={"0": EVENT_TYPES[1]}
+    )
+
+    events = generator.query(retry_delay=0)
+
+    assert list(provider.schemas[0]["properties"]) == ["1", "2"]
+    assert [(e.event_type.name, e.model_id) for e in events] == [("greeting", "local_tagger"), ("answer", "model"), ("question", "model")]
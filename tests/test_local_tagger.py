@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import pytest
+
+from local_tagger import LocalEventTagger
+from models.conversation import Message, ROLE
+from models.event import EventType
+
+EVENT_TYPES = [
+    EventType("greeting", "The user greets the assistant", ROLE.user),
+    EventType("question", "The user asks a question", ROLE.user),
+    EventType("answer", "The assistant answers", ROLE.assistant)
+]
+
+EXAMPLES = [
+    (ROLE.user, text, "greeting", "c") for text in ["hello there", "hi, good morning", "hey hello", "good evening, hi"]
+] + [
+    (ROLE.user, text, "question", "c") for text in ["how do I sleep better?", "what should I do about stress?", "why do I feel tired?", "how can I relax?"]
+] + [
+    (ROLE.assistant, text, "answer", "c") for text in ["try a regular bedtime", "breathing exercises can help", "rest and drink water", "take a short walk"]
+]
+
+
+def message(role: ROLE, content: str, message_id: str = "0") -> Message:
+    return Message(role, content, datetime(2024, 1, 1), message_id)
+
+
+@pytest.fixture(scope="module")
+def tagger():
+    return LocalEventTagger(EVENT_TYPES, n_features=256).fit(EXAMPLES * 5)
+
+
+def test_predicts_the_trained_event_types(tagger):
+    predictions = tagger.predict([message(role, content) for role, content, _, _ in EXAMPLES])
+
+    assert [event_type.name for event_type, _ in predictions] == [name for _, _, name, _ in EXAMPLES]
+
+
+def test_only_predicts_event_types_of_the_message_role(tagger):
+    # A greeting sent by the assistant can't be tagged with a user event type
+    [(event_type, probability)] = tagger.predict([message(ROLE.assistant, "hello there")])
+
+    assert event_type.name == "answer"
+    assert probability == pytest.approx(1.0)
+
+
+def test_pretag_keeps_confident_predictions(tagger):
+    messages = [message(ROLE.user, "hello there", "0"), message(ROLE.user, "something else entirely", "1")]
+    probabilities = [probability for _, probability in tagger.predict(messages)]
+    threshold = (probabilities[0] + probabilities[1]) / 2
+    assert probabilities[0] > probabilities[1]
+
+    assert {message_id: event_type.name for message_id, event_type in tagger.pretag(messages, threshold).items()} == {"0": "greeting"}
+    assert tagger.pretag(messages, 1.01) == {}
+
+
+def test_role_without_event_types_gets_zero_probabilities():
+    tagger = LocalEventTagger(EVENT_TYPES[:2], n_features=64).fit(EXAMPLES)
+
+    [(_, probability)] = tagger.predict([message(ROLE.assistant, "try a regular bedtime")])
+
+    assert probability == 0.0
+    assert tagger.pretag([message(ROLE.assistant, "try a regular bedtime")], 0.5) == {}
+
+
+def test_save_and_load(tagger, tmp_path):
+    path = str(tmp_path / "tagger.npz")
+    tagger.save(path)
+
+    loaded = LocalEventTagger.load(path, list(reversed(EVENT_TYPES)))
+    messages = [message(role, content) for role, content, _, _ in EXAMPLES]
+
+    assert [(e.name, round(p, 5)) for e, p in loaded.predict(messages)] == [(e.name, round(p, 5)) for e, p in tagger.predict(messages)]
+    with pytest.raises(ValueError):
+        LocalEventTagger.load(path, EVENT_TYPES[:2])
+
+
+def test_fit_requires_known_event_types():
+    with pytest.raises(ValueError):
+        LocalEventTagger(EVENT_TYPES).fit([(ROLE.user, "hello", "unknown", "c")])
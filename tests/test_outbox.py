@@ -0,0 +1,117 @@
+from datetime import datetime
+import threading
+
+from destinations.destination import DeliveryError, Destination
+from destinations.outbox import OutboxDestination
+from models.conversation import Message, ROLE
+from models.event import Event, EventType
+
+
+class RecordingDestination(Destination):
+    """Records the events it's sent, failing those whose message id is in send_failures or flush_failures."""
+
+    def __init__(self, send_failures=(), flush_failures=()):
+        self.send_failures = set(send_failures)
+        self.flush_failures = set(flush_failures)
+        self.sent = []
+        self.unflushed = []
+        self.delivered = []
+        self.lock = threading.Lock()
+
+    def send_event(self, event: Event, llm_judge_score: int):
+        if event.message.message_id in self.send_failures:
+            raise ConnectionError(f"can't send {event.message.message_id}")
+        with self.lock:
+            self.sent.append(event.message.message_id)
+            self.unflushed.append(event)
+
+    def flush(self):
+        with self.lock:
+            events, self.unflushed = self.unflushed, []
+        failed = {e.insert_id: "rejected" for e in events if e.message.message_id in self.flush_failures}
+        self.delivered.extend(e.message.message_id for e in events if e.insert_id not in failed)
+        if failed:
+            raise DeliveryError(failed)
+
+
+def event(message_id: str) -> Event:
+    return Event(
+        user_id="user",
+        event_type=EventType("greeting", "A greeting", ROLE.user),
+        conversation_id="conversation",
+        message=Message(ROLE.user, "hi", datetime(2024, 1, 1), message_id),
+        model_id="model"
+    )
+
+
+def outbox(destination, tmp_path, **kwargs) -> OutboxDestination:
+    outbox = OutboxDestination(destination, str(tmp_path / "outbox.db"), base_delay=0.01, max_delay=0.05, **kwargs)
+    outbox.poll_interval = 0.01
+    return outbox
+
+
+def test_events_are_delivered_once(tmp_path):
+    destination = RecordingDestination()
+    box = outbox(destination, tmp_path, batch_size=2)
+    for i in range(5):
+        box.send_event(event(str(i)), 90)
+    box.flush()
+
+    assert sorted(destination.delivered) == ["0", "1", "2", "3", "4"]
+    assert box.counts() == {"delivered": 5}
+
+    # A rerun doesn't deliver the events again
+    box.send_event(event("0"), 90)
+    box.flush()
+    box.close()
+    assert sorted(destination.sent) == ["0", "1", "2", "3", "4"]
+
+
+def test_send_failures_are_retried_then_dead_lettered(tmp_path):
+    destination = RecordingDestination(send_failures={"1"})
+    box = outbox(destination, tmp_path, max_attempts=3)
+    box.send_event(event("0"), 90)
+    box.send_event(event("1"), 90)
+    box.flush()
+
+    assert box.counts() == {"delivered": 1, "dead": 1}
+    assert destination.delivered == ["0"]
+    attempts, last_error = box.connection.execute("SELECT attempts, last_error FROM outbox WHERE status = 'dead'").fetchone()
+    assert attempts == 3
+    assert last_error == "can't send 1"
+
+    # Once the destination recovers, requeued events are delivered
+    destination.send_failures.clear()
+    assert box.requeue() == 1
+    box.flush()
+    assert box.counts() == {"delivered": 2}
+    box.close()
+    assert sorted(destination.delivered) == ["0", "1"]
+
+
+def test_events_reported_by_flush_are_retried(tmp_path):
+    destination = RecordingDestination(flush_failures={"1"})
+    box = outbox(destination, tmp_path, max_attempts=2)
+    for i in range(3):
+        box.send_event(event(str(i)), 90)
+    box.flush()
+    assert box.counts() == {"delivered": 2, "dead": 1}
+    box.close()
+
+    # The event that failed was sent again before it was dead-lettered, the others only once
+    assert sorted(destination.sent) == ["0", "1", "1", "2"]
+
+
+def test_pending_events_survive_a_restart(tmp_path):
+    destination = RecordingDestination()
+    box = outbox(destination, tmp_path)
+    box._stop.set()
+    box._sender.join()
+    box.send_event(event("0"), 90)
+    box.connection.close()
+    assert destination.sent == []
+
+    box = outbox(destination, tmp_path)
+    box.flush()
+    box.close()
+    assert destination.delivered == ["0"]
@@ -0,0 +1,155 @@
+import os
+import threading
+
+import pytest
+
+from destinations.destination import DeliveryError, Destination
+from judge_sampling import StratifiedJudgeSampler
+from llm_queries.replay_model_provider import ReplayModelProvider
+from models.data_schema import DataSchema
+from models.event import Event
+from pipeline import Pipeline, PipelineConfig, PipelineHooks
+from sources.local import LocalSource
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "therapist")
+
+
+class MemoryDestination(Destination):
+
+    def __init__(self, reject: int = 0):
+        # How many of the events sent before each flush it reports as failed
+        self.reject = reject
+        self.events = []
+        self.unflushed = []
+        self.lock = threading.Lock()
+
+    def send_event(self, event: Event, llm_judge_score: int):
+        with self.lock:
+            self.unflushed.append((event, llm_judge_score))
+
+    def flush(self):
+        with self.lock:
+            events, self.unflushed = self.unflushed, []
+        rejected = {event.insert_id: "rejected" for event, _ in events[:self.reject]}
+        self.events.extend(entry for entry in events if entry[0].insert_id not in rejected)
+        if rejected:
+            raise DeliveryError(rejected)
+
+
+class RecordingHooks(PipelineHooks):
+
+    def __init__(self):
+        self.stages = []
+        self.items = []
+        self.results = []
+        self.lock = threading.Lock()
+
+    def on_stage_start(self, stage: str):
+        self.stages.append(stage)
+
+    def on_item(self, stage: str, event: Event):
+        with self.lock:
+            self.items.append((stage, event))
+
+    def on_result(self, result):
+        self.results.append(result)
+
+
+@pytest.fixture(scope="module")
+def data_schema():
+    return DataSchema.from_yaml(os.path.join(EXAMPLE_DIR, "schema.yml"))
+
+
+@pytest.fixture(scope="module")
+def conversations():
+    return LocalSource(os.path.join(EXAMPLE_DIR, "example_data.json")).get_conversations()
+
+
+def test_run_generates_and_sends_every_event(data_schema, conversations):
+    destination = MemoryDestination()
+    hooks = RecordingHooks()
+
+    with Pipeline(ReplayModelProvider(), data_schema, destination, hooks=hooks) as pipeline:
+        result = pipeline.run(conversations)
+
+    assert result.sent == len(result.events) == len(destination.events) == 92
+    assert result.failed == 0
+    assert set(result.llm_judge_scores_by_convo_id) == {c.id for c in conversations}
+    assert hooks.stages == ["llm_judge", "generate_events", "generate_explanations", "generate_event_properties", "upload_events"]
+    for event, score in destination.events:
+        assert score == result.llm_judge_scores_by_convo_id[event.conversation_id]
+        assert event.explanation
+        assert set(event.property_values) == {p.name for p in event.event_type.properties}
+    # Every message gets exactly one event
+    assert len({event.insert_id for event, _ in destination.events}) == sum(len(c.messages) for c in conversations)
+
+
+def test_run_in_chunks_from_the_source(data_schema):
+    hooks = RecordingHooks()
+    source = LocalSource(os.path.join(EXAMPLE_DIR, "example_data.json"))
+
+    with Pipeline(ReplayModelProvider(), data_schema, MemoryDestination(), source=source, hooks=hooks) as pipeline:
+        result = pipeline.run(chunk_size=4)
+
+    assert [len(r.conversations) for r in hooks.results] == [4, 4, 2]
+    assert result.sent == 92
+
+
+def test_run_requires_conversations_or_a_source(data_schema):
+    with pytest.raises(ValueError):
+        Pipeline(ReplayModelProvider(), data_schema, MemoryDestination()).run()
+
+
+def test_delivered_events_are_not_sent_again(data_schema, conversations):
+    destination = MemoryDestination()
+    delivered = set()
+
+    with Pipeline(ReplayModelProvider(), data_schema, destination) as pipeline:
+        first = pipeline.run(conversations, delivered=delivered)
+        second = pipeline.run(conversations, delivered=delivered)
+
+    assert first.sent == len(delivered) == 92
+    assert second.sent == 0
+    assert len(destination.events) == 92
+
+
+def test_events_the_destination_rejects_are_counted_as_failed(data_schema, conversations):
+    delivered = set()
+
+    with Pipeline(ReplayModelProvider(), data_schema, MemoryDestination(reject=2)) as pipeline:
+        result = pipeline.run(conversations, delivered=delivered)
+
+    assert (result.sent, result.failed) == (90, 2)
+    assert len(delivered) == 90
+
+
+@pytest.mark.parametrize("combined_judge_events, event_stage", [(False, "generate_events"), (True, "judge_and_generate_events")])
+def test_streamed_responses_pass_each_event_to_the_hooks(data_schema, conversations, combined_judge_events, event_stage):
+    hooks = RecordingHooks()
+    config = PipelineConfig(stream_responses=True, combined_judge_events=combined_judge_events)
+
+    with Pipeline(ReplayModelProvider(), data_schema, MemoryDestination(), config=config, hooks=hooks) as pipeline:
+        result = pipeline.run(conversations)
+
+    items_by_stage = {}
+    for stage, event in hooks.items:
+        items_by_stage.setdefault(stage, []).append(event)
+    assert len(items_by_stage[event_stage]) == len(items_by_stage["generate_explanations"]) == len(result.events) == 92
+    assert items_by_stage["generate_event_properties"]
+    # The streamed events are copies, which later stages don't update
+    assert all(event.explanation is None for event in items_by_stage[event_stage])
+    assert all(event.explanation for event in result.events)
+
+
+def test_judge_sampler_judges_only_the_sample(data_schema, conversations):
+    sampler = StratifiedJudgeSampler(default_rate=0.2, min_per_stratum=1, dimensions=["length"])
+    destination = MemoryDestination()
+
+    with Pipeline(ReplayModelProvider(), data_schema, destination, config=PipelineConfig(judge_sampler=sampler)) as pipeline:
+        result = pipeline.run(conversations)
+
+    judged = set(result.llm_judge_scores_by_convo_id)
+    assert 0 < len(judged) < len(conversations)
+    assert {event.conversation_id for event, score in destination.events if score is not None} == judged
+    assert sampler.estimate()["judged"] == len(judged)
+    assert sampler.estimate()["conversations"] == len(conversations)
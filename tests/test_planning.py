@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+from models.data_schema import DataSchema
+from pipeline import PipelineConfig
+from planning import ModelProfile, TokenCounter, estimate_output_tokens, load_model_profiles, plan_pipeline, plan_stage
+from sources.local import LocalSource
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "therapist")
+
+# Not a model tiktoken knows, so its tokens are counted at four characters each whether or not tiktoken is installed
+MODEL_ID = "test-model"
+
+
+class StaticQuery:
+
+    def __init__(self, prompt: str, schema: dict):
+        self.prompt = prompt
+        self.schema = schema
+
+    def generate_prompt(self) -> str:
+        return self.prompt
+
+    def response_schema(self) -> dict:
+        return self.schema
+
+
+def profiles(**values) -> dict:
+    return {MODEL_ID: ModelProfile(**{
+        "input_per_million": 1000.0, "output_per_million": 2000.0, "output_tokens_per_second": 10.0, "base_latency": 1.0,
+        **values
+    })}
+
+
+@pytest.mark.parametrize("schema,tokens", [
+    ({"type": "string"}, 40),
+    ({"type": "integer"}, 3),
+    ({"type": "boolean"}, 1),
+    ({"type": "string", "enum": ["yes", "no"]}, 2),
+    ({"type": "array", "items": {"type": "integer"}}, 2 + 5 * 4),
+    ({"type": "object", "properties": {"a": {"type": "string"}, "b": {"type": "integer"}}}, 2 + (3 + 40) + (3 + 3))
+])
+def test_estimate_output_tokens(schema, tokens):
+    assert estimate_output_tokens(schema) == tokens
+
+
+def test_estimate_output_tokens_options():
+    schema = {"type": "array", "items": {"type": "string"}}
+    assert estimate_output_tokens(schema, free_text_tokens=10, array_items=2) == 2 + 2 * 11
+
+
+def test_plan_stage():
+    # 400 characters of prompt and 18 of schema, at four characters a token
+    queries = [StaticQuery("x" * 400, {"type": "string"})] * 4
+
+    plan = plan_stage("stage", MODEL_ID, queries, 2, TokenCounter(), profiles())
+
+    assert plan.tokenizer == "chars/4"
+    assert (plan.requests, plan.input_tokens, plan.output_tokens) == (4, 4 * 105, 4 * 40)
+    assert plan.cost == 0.74
+    # Four 5 second requests, two at a time
+    assert (plan.seconds, plan.limited_by) == (10.0, "concurrency")
+
+
+def test_plan_stage_scales_a_sample():
+    queries = [StaticQuery("x" * 400, {"type": "string"})] * 4
+
+    plan = plan_stage("stage", MODEL_ID, queries, 2, TokenCounter(), profiles(requests_per_minute=10), scale=10, requests=30)
+
+    assert (plan.requests, plan.input_tokens, plan.output_tokens) == (30, 4200, 1600)
+    assert (plan.seconds, plan.limited_by) == (180.0, "requests_per_minute")
+
+
+def test_plan_stage_limited_by_longest_request():
+    queries = [StaticQuery("x", {"type": "string"})]
+
+    plan = plan_stage("stage", MODEL_ID, queries, 8, TokenCounter(), profiles(reasoning_tokens=60))
+
+    assert plan.output_tokens == 100
+    assert (plan.seconds, plan.limited_by) == (11.0, "longest_request")
+
+
+def test_plan_stage_unknown_model_has_no_cost():
+    plan = plan_stage("stage", "unknown-model", [StaticQuery("x", {"type": "string"})], 1, TokenCounter(), profiles())
+
+    assert plan.cost is None
+
+
+def test_load_model_profiles(tmp_path):
+    path = tmp_path / "profiles.yml"
+    path.write_text("gpt-4o:\n  requests_per_minute: 500\nnew-model:\n  input_per_million: 1.5\n")
+
+    loaded = load_model_profiles(str(path))
+
+    assert loaded["gpt-4o"].requests_per_minute == 500
+    assert loaded["gpt-4o"].input_per_million == 2.50
+    assert loaded["new-model"].input_per_million == 1.5
+
+    path.write_text("gpt-4o:\n  price: 1\n")
+    with pytest.raises(ValueError):
+        load_model_profiles(str(path))
+
+
+def test_plan_pipeline_scales_a_sample():
+    data_schema = DataSchema.from_yaml(os.path.join(EXAMPLE_DIR, "schema.yml"))
+    conversations = LocalSource(os.path.join(EXAMPLE_DIR, "example_data.json")).get_conversations()
+
+    plan = plan_pipeline(data_schema, conversations, PipelineConfig(), TokenCounter(), load_model_profiles(), sample_size=4)
+    summary = plan.to_dict()
+
+    assert (plan.conversations, plan.sampled_conversations) == (10, 4)
+    assert [stage.stage for stage in plan.stages] == ["llm_judge", "generate_events", "generate_explanations", "generate_event_properties"]
+    assert [stage.requests for stage in plan.stages[:3]] == [10, 10, 10]
+    assert summary["requests"] == sum(stage.requests for stage in plan.stages)
+    assert summary["cost"] == round(sum(stage.cost for stage in plan.stages), 2)
+    assert "Plan for 10 conversations" in plan.format()
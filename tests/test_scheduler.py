@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import FairShareScheduler, PriorityScheduler
+
+
+class Recorder:
+    """Blocks the scheduler's worker threads until released, then records the order in which calls start."""
+
+    def __init__(self):
+        self.started = []
+        self.release = threading.Event()
+        self.blocked = threading.Semaphore(0)
+        self.lock = threading.Lock()
+
+    def block(self):
+        self.blocked.release()
+        self.release.wait(5)
+
+    def call(self, name):
+        with self.lock:
+            self.started.append(name)
+        return name
+
+
+def block_workers(executor, recorder: Recorder, num_workers: int):
+    futures = [executor.submit(recorder.block) for _ in range(num_workers)]
+    for _ in range(num_workers):
+        assert recorder.blocked.acquire(timeout=5)
+    return futures
+
+
+def test_priority_scheduler_runs_largest_first_then_unsized_in_order():
+    recorder = Recorder()
+    scheduler = PriorityScheduler(max_workers=1)
+    block_workers(scheduler, recorder, 1)
+
+    futures = [
+        scheduler.submit(recorder.call, "unsized 1"),
+        scheduler.submit_sized(10, recorder.call, "small"),
+        scheduler.submit_sized(1000, recorder.call, "large"),
+        scheduler.submit(recorder.call, "unsized 2"),
+        scheduler.submit_sized(100, recorder.call, "medium 1"),
+        scheduler.submit_sized(100, recorder.call, "medium 2")
+    ]
+    recorder.release.set()
+    scheduler.shutdown()
+
+    assert [f.result() for f in futures] == ["unsized 1", "small", "large", "unsized 2", "medium 1", "medium 2"]
+    assert recorder.started == ["large", "medium 1", "medium 2", "small", "unsized 1", "unsized 2"]
+
+
+def test_priority_scheduler_runs_smaller_calls_while_the_largest_waits_for_tokens():
+    recorder = Recorder()
+    scheduler = PriorityScheduler(max_workers=1, tokens_per_minute=6000)
+    block_workers(scheduler, recorder, 1)
+    # Only a few tokens are left in the bucket
+    scheduler.bucket.consume(5900)
+
+    scheduler.submit_sized(5000, recorder.call, "large")
+    scheduler.submit_sized(50, recorder.call, "small")
+    scheduler.submit(recorder.call, "unsized")
+    recorder.release.set()
+
+    deadline = time.monotonic() + 5
+    while len(recorder.started) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scheduler.shutdown(wait=False, cancel_futures=True)
+
+    assert recorder.started[:2] == ["unsized", "small"]
+
+
+def test_priority_scheduler_rejects_calls_after_shutdown():
+    scheduler = PriorityScheduler(max_workers=1)
+    scheduler.shutdown()
+
+    with pytest.raises(RuntimeError):
+        scheduler.submit(print)
+
+
+def test_fair_share_scheduler_shares_by_weight():
+    recorder = Recorder()
+    scheduler = FairShareScheduler(max_workers=1)
+    block_workers(scheduler.tenant("blocker"), recorder, 1)
+    heavy = scheduler.tenant("heavy", weight=2)
+    light = scheduler.tenant("light", weight=1)
+
+    for i in range(10):
+        heavy.submit(recorder.call, "heavy")
+        light.submit(recorder.call, "light")
+    recorder.release.set()
+    scheduler.shutdown()
+
+    first = recorder.started[:9]
+    assert first.count("heavy") == 6
+    assert first.count("light") == 3
+    stats = scheduler.stats()
+    assert stats["heavy"]["requests"] == 10
+    assert stats["light"]["requests"] == 10
+
+
+def test_fair_share_scheduler_limits_tenant_concurrency():
+    scheduler = FairShareScheduler(max_workers=4)
+    tenant = scheduler.tenant("tenant", max_concurrency=2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    futures = [tenant.submit(call) for _ in range(8)]
+    for future in futures:
+        future.result(timeout=5)
+    scheduler.shutdown()
+
+    assert max(peak) == 2
+
+
+def test_fair_share_scheduler_requires_a_tenant():
+    scheduler = FairShareScheduler(max_workers=1)
+    scheduler.tenant("tenant")
+
+    with pytest.raises(TypeError):
+        scheduler.submit(print)
+    with pytest.raises(ValueError):
+        scheduler.tenant("tenant")
+    with pytest.raises(ValueError):
+        scheduler.tenant("weightless", weight=0)
+    scheduler.shutdown()
@@ -0,0 +1,128 @@
+from datetime import datetime, timezone
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from models.conversation import ROLE
+from sharding import in_shard, select_shard, shard_filter
+from sources.local import LocalSource
+from sources.parquet import ParquetSource
+
+
+def write_json(path, num_conversations=3):
+    data = {
+        f"conversation_{i}": {
+            "user_id": f"user_{i % 2}",
+            "messages": [
+                {"role": "user", "content": f"question {i}", "timestamp": f"2024-01-0{i + 1}T10:00:00"},
+                {"role": "assistant", "content": f"answer {i}", "timestamp": f"2024-01-0{i + 1}T10:00:05"}
+            ]
+        }
+        for i in range(num_conversations)
+    }
+    path.write_text(json.dumps(data))
+
+
+def write_parquet(path, timestamps, **kwargs):
+    pq.write_table(pa.table({
+        "conversation_id": ["a", "a", "b", "c"],
+        "user_id": ["u1", "u1", "u2", "u3"],
+        "role": ["user", "assistant", "user", "user"],
+        "content": ["hi", "hello", "hey", "yo"],
+        "timestamp": timestamps
+    }), path, **kwargs)
+
+
+def test_local_json_source(tmp_path):
+    path = tmp_path / "data.json"
+    write_json(path)
+
+    conversations = LocalSource(str(path)).get_conversations()
+
+    assert [c.id for c in conversations] == ["conversation_0", "conversation_1", "conversation_2"]
+    assert [c.user_id for c in conversations] == ["user_0", "user_1", "user_0"]
+    first = conversations[0].messages
+    assert [m.role for m in first] == [ROLE.user, ROLE.assistant]
+    assert first[1].timestamp == datetime(2024, 1, 1, 10, 0, 5)
+    # Message ids default to the message's position in the file
+    assert [m.message_id for c in conversations for m in c.messages] == [str(i) for i in range(6)]
+
+
+def test_local_source_filter_keeps_message_ids(tmp_path):
+    path = tmp_path / "data.json"
+    write_json(path)
+    source = LocalSource(str(path))
+    source.conversation_filter = lambda conversation_id: conversation_id == "conversation_1"
+
+    conversations = source.get_conversations()
+
+    assert [c.id for c in conversations] == ["conversation_1"]
+    assert [m.message_id for m in conversations[0].messages] == ["2", "3"]
+
+
+@pytest.mark.parametrize("timestamps", [
+    ["2024-01-01T10:00:00", "2024-01-01T10:00:01", "2024-01-02 09:00:00", "2024-01-03T00:00:00"],
+    ["2024-01-01T10:00:00Z", "2024-01-01T10:00:01+00:00", "2024-01-02T11:00:00+02:00", "2024-01-03T01:00:00+01:00"],
+    pa.array([datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 10, 0, 1), datetime(2024, 1, 2, 9), datetime(2024, 1, 3)], pa.timestamp("ms")),
+    pa.array([datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 10, 0, 1), datetime(2024, 1, 2, 9), datetime(2024, 1, 3)], pa.timestamp("us", tz="UTC"))
+])
+def test_parquet_source_date_filters(tmp_path, timestamps):
+    path = tmp_path / "data.parquet"
+    write_parquet(path, timestamps)
+
+    conversations = ParquetSource(
+        str(path), start_date=datetime(2024, 1, 1, 12, tzinfo=timezone.utc), end_date=datetime(2024, 1, 3)
+    ).get_conversations()
+
+    assert [c.id for c in conversations] == ["b"]
+    assert conversations[0].messages[0].content == "hey"
+    assert conversations[0].messages[0].timestamp.replace(tzinfo=None) == datetime(2024, 1, 2, 9)
+    assert conversations[0].messages[0].message_id == "2"
+
+
+def test_parquet_source_groups_batches(tmp_path):
+    path = tmp_path / "data.parquet"
+    write_parquet(path, [datetime(2024, 1, 1, 10, 0, s) for s in range(4)], row_group_size=1)
+
+    conversations = ParquetSource(str(path), batch_size=1).get_conversations()
+
+    assert [(c.id, c.user_id, len(c.messages)) for c in conversations] == [("a", "u1", 2), ("b", "u2", 1), ("c", "u3", 1)]
+    assert [m.role for m in conversations[0].messages] == [ROLE.user, ROLE.assistant]
+
+
+def test_parquet_source_shard_filter(tmp_path):
+    path = tmp_path / "data.parquet"
+    write_parquet(path, [datetime(2024, 1, 1, 10, 0, s) for s in range(4)])
+
+    kept = []
+    for shard_index in range(2):
+        source = ParquetSource(str(path))
+        source.conversation_filter = shard_filter(shard_index, 2)
+        kept.append({c.id for c in source.get_conversations()})
+
+    assert kept[0] | kept[1] == {"a", "b", "c"}
+    assert not kept[0] & kept[1]
+
+
+def test_shards_partition_conversations(tmp_path):
+    path = tmp_path / "data.json"
+    write_json(path, num_conversations=9)
+    conversations = LocalSource(str(path)).get_conversations()
+
+    shards = [
+        select_shard(conversations, shard_index, 3, worker_index, 2)
+        for shard_index in range(3) for worker_index in range(2)
+    ]
+
+    assert sorted(c.id for shard in shards for c in shard) == sorted(c.id for c in conversations)
+    # The shard of a conversation doesn't depend on the number of workers it's split across
+    for conversation in conversations:
+        assert in_shard(conversation.id, 1, 3) == any(in_shard(conversation.id, 1, 3, w, 2) for w in range(2))
+
+
+@pytest.mark.parametrize("shard_index, num_shards, worker_index, num_workers", [(2, 2, 0, 1), (-1, 2, 0, 1), (0, 1, 1, 1)])
+def test_shard_filter_rejects_out_of_range_indices(shard_index, num_shards, worker_index, num_workers):
+    with pytest.raises(ValueError):
+        shard_filter(shard_index, num_shards, worker_index, num_workers)
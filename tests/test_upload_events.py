@@ -0,0 +1,68 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+import upload_events
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+def parse_args(tmp_path, *argv):
+    return upload_events.build_parser().parse_args([
+        "--data-path", os.path.join(EXAMPLES_DIR, "therapist", "example_data.json"),
+        "--data-schema-path", os.path.join(EXAMPLES_DIR, "therapist", "schema.yml"),
+        "--model-provider", "replay",
+        "--destination", "jsonl",
+        "--destination-path", str(tmp_path / "events.jsonl"),
+        *argv
+    ])
+
+
+def test_workers_split_the_conversations(tmp_path):
+    summaries = upload_events.run_workers(parse_args(tmp_path, "--num-workers", "2"))
+
+    assert [s["worker_index"] for s in summaries] == [0, 1]
+    assert not any("error" in s for s in summaries)
+    assert sum(s["conversations"] for s in summaries) == 10
+    with open(tmp_path / "events.jsonl") as f:
+        events = [json.loads(line) for line in f]
+    assert len(events) == sum(s["events_sent"] for s in summaries)
+    assert len({e["insert_id"] for e in events}) == len(events)
+
+
+def _run_or_die(args, worker_index, num_workers):
+    if worker_index == 1:
+        # Like a worker killed for running out of memory, which never reports back
+        os._exit(9)
+    return {"worker_index": worker_index, "conversations": 1, "events_sent": 1}
+
+
+def test_dead_workers_are_reported_as_failed(tmp_path, monkeypatch):
+    # Forked workers inherit the patched run, which spawned ones wouldn't
+    fork = multiprocessing.get_context("fork")
+    monkeypatch.setattr(upload_events.multiprocessing, "get_context", lambda method: fork)
+    monkeypatch.setattr(upload_events, "run", _run_or_die)
+    monkeypatch.setattr(upload_events, "WORKER_POLL_SECONDS", 0.1)
+
+    summaries = upload_events.run_workers(parse_args(tmp_path, "--num-workers", "2"))
+
+    assert summaries == [
+        {"worker_index": 0, "conversations": 1, "events_sent": 1},
+        {"worker_index": 1, "error": "Exited with code 9"}
+    ]
+
+
+
+@pytest.mark.parametrize("argv", [
+    ["--num-workers", "2", "--destination", "duckdb"],
+    ["--num-shards", "2", "--explanation-clusters", "4"],
+    ["--judge-sample-rate", "0.1", "--combined-judge-events"]
+])
+def test_check_args_rejects_incompatible_flags(tmp_path, argv):
+    parser = upload_events.build_parser()
+    args = parse_args(tmp_path, *argv)
+
+    with pytest.raises(SystemExit):
+        upload_events.check_args(parser, args)
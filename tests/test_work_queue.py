@@ -0,0 +1,90 @@
+from datetime import datetime
+import time
+
+import pytest
+
+from models.conversation import Conversation, Message, ROLE
+from work_queues.sqlite import SQLiteWorkQueue
+
+
+def conversation(conversation_id: str) -> Conversation:
+    return Conversation(conversation_id, "user", [Message(ROLE.user, "hi", datetime(2024, 1, 1), "0")])
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.db"))
+    queue.poll_interval = 0.05
+    return queue
+
+
+def test_received_items_are_invisible_until_the_timeout(queue):
+    queue.send([conversation("a"), conversation("b")])
+    queue.send([conversation("c")])
+
+    items = queue.receive(max_items=1, visibility_timeout=1)
+    assert [c.id for c in items[0].conversations] == ["a", "b"]
+    assert items[0].receive_count == 1
+
+    # The first item is claimed, so the next receive gets the second one
+    assert [c.id for c in queue.receive(max_items=5, visibility_timeout=1)[0].conversations] == ["c"]
+    assert queue.receive(max_items=5) == []
+
+    time.sleep(1.1)
+    redelivered = queue.receive(max_items=5, visibility_timeout=60)
+    assert [item.receive_count for item in redelivered] == [2, 2]
+
+
+def test_ack_deletes_the_item(queue):
+    queue.send([conversation("a")])
+    item = queue.receive()[0]
+
+    queue.ack(item)
+
+    assert queue.approximate_depth() == 0
+    assert queue.receive() == []
+
+
+def test_ack_with_a_stale_receipt_does_nothing(queue):
+    queue.send([conversation("a")])
+    stale = queue.receive(visibility_timeout=0)[0]
+    current = queue.receive()[0]
+
+    queue.ack(stale)
+
+    assert queue.approximate_depth() == 1
+    queue.ack(current)
+    assert queue.approximate_depth() == 0
+
+
+def test_nack_redelivers_after_the_delay_with_delivered_conversations(queue):
+    queue.send([conversation("a"), conversation("b")])
+    item = queue.receive()[0]
+    item.delivered.add("a")
+
+    queue.nack(item, delay=0)
+
+    redelivered = queue.receive()[0]
+    assert redelivered.delivered == {"a"}
+    assert redelivered.receive_count == 2
+
+    queue.nack(redelivered, delay=60)
+    assert queue.receive(wait_time=0.2) == []
+
+
+def test_dead_lettered_items_are_not_redelivered(queue):
+    queue.send([conversation("a")])
+    item = queue.receive(visibility_timeout=0)[0]
+
+    queue.dead_letter(item, "failed")
+
+    assert queue.approximate_depth() == 0
+    assert queue.receive() == []
+    assert queue.connection.execute("SELECT status, last_error FROM work_items").fetchall() == [("dead", "failed")]
+
+
+def test_receive_waits_for_new_items(queue):
+    assert queue.receive(wait_time=0.1) == []
+
+    queue.send([conversation("a")])
+    assert len(queue.receive(wait_time=1)) == 1